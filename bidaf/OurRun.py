@@ -4,12 +4,16 @@ Writen by YanXu, FangYueran and ZhangTianyang
 Partly adapted from BiDAF
 '''
 import os
-import pickle
 import logging
 import argparse
 from dataloader.OurDataLoader import DataLoader
 from VocabBuild.OurVocab import Vocab
 from model.OurModel import Model
+from model.FrozenModel import FrozenModel, export_model, latest_version_dir, VOCAB_PREFIX
+from model.SessionConfig import benchmark_export
+from model.Quantize import quantize_export
+from utils import convert_embeddings
+from utils import write_shard, shard_prefix, predict_shards, merge_test_shards
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 '''Which dataset do you want to use, just choose between search and zhidao'''
@@ -27,14 +31,56 @@ def parse_args():
     parser = argparse.ArgumentParser('Reading Comprehension on BaiduRC dataset')
     parser.add_argument('--prepare', action='store_true',
                         help='create the directories, prepare to process the vocabulary and embeddings')
+    parser.add_argument('--compile', action='store_true',
+                        help='compile the data files into memory-mapped arrays in cache_dir')
+    parser.add_argument('--convert_embeddings', action='store_true',
+                        help='convert the pretrained word embeddings into a binary, memory-mapped copy next to them')
     parser.add_argument('--train', action='store_true',
                         help='train the model')
     parser.add_argument('--evaluate', action='store_true',
                         help='evaluate the model on dev set')
     parser.add_argument('--predict', action='store_true',
                         help='predict the answers for test set with trained model')
+    parser.add_argument('--export', action='store_true',
+                        help='export the trained model into a frozen, inference-only artifact in export_dir')
+    parser.add_argument('--quantize', choices=['int8', 'fp16'], default=None,
+                        help='quantize the latest exported model, calibrated and checked on the dev set')
+    parser.add_argument('--calibration_batches', type=int, default=20,
+                        help='number of dev batches used to calibrate the int8 ranges, 0 for dynamic ranges')
+    parser.add_argument('--quantize_tolerance', type=float, default=0.01,
+                        help='max drop of Bleu-4 and Rouge-L accepted from the quantization')
     parser.add_argument('--gpu', type=str, default='1',
                         help='specify gpu device')
+    parser.add_argument('--num_shards', type=int, default=1,
+                        help='number of shards the test files are split into by line for the prediction, '
+                             'predicted by as many local processes unless shard_id is set')
+    parser.add_argument('--shard_id', type=int, default=None,
+                        help='the only shard predicted by this process, for the prediction spread over nodes')
+    parser.add_argument('--merge_shards', action='store_true',
+                        help='merge the test predictions of the num_shards shards into test.predicted.json')
+    parser.add_argument('--intra_op_threads', type=int, default=0,
+                        help='number of threads of one op in the session, 0 to let tensorflow choose; '
+                             'the cores are shared between the shards by default')
+    parser.add_argument('--inter_op_threads', type=int, default=0,
+                        help='number of ops run in parallel in the session, 0 to let tensorflow choose')
+    parser.add_argument('--xla', action='store_true',
+                        help='compile the graph with the XLA JIT')
+    parser.add_argument('--opt_level', choices=['L0', 'L1'], default='L1',
+                        help='graph optimization level, L0 disables the constant folding and '
+                             'the common subexpression elimination')
+    parser.add_argument('--benchmark_session', action='store_true',
+                        help='measure the latency and the throughput of the exported model on a fixed dev sample '
+                             'under each session config')
+    parser.add_argument('--benchmark_questions', type=int, default=256,
+                        help='number of dev questions of the benchmark sample')
+    parser.add_argument('--benchmark_repeats', type=int, default=3,
+                        help='number of timed passes over the benchmark sample')
+    parser.add_argument('--benchmark_intra_op_threads', type=int, nargs='+', default=None,
+                        help='intra_op_threads values benchmarked, only intra_op_threads if not set')
+    parser.add_argument('--benchmark_inter_op_threads', type=int, nargs='+', default=None,
+                        help='inter_op_threads values benchmarked, only inter_op_threads if not set')
+    parser.add_argument('--benchmark_xla', action='store_true',
+                        help='benchmark every config with and without XLA')
 
     train_settings = parser.add_argument_group('train settings')
     train_settings.add_argument('--algo', type=str, default='qanet',
@@ -63,6 +109,20 @@ def parse_args():
                                 help='train batch size')
     train_settings.add_argument('--epochs', type=int, default=10,
                                 help='train epochs')
+    train_settings.add_argument('--stream', action='store_true',
+                                help='stream the data files instead of loading them into memory')
+    train_settings.add_argument('--shuffle_buffer', type=int, default=10000,
+                                help='number of samples shuffled together in stream mode')
+    train_settings.add_argument('--bucket_size', type=int, default=0,
+                                help='number of batches whose samples are sorted by passage length together, '
+                                     '0 to disable length bucketing')
+    train_settings.add_argument('--prefetch', type=int, default=4,
+                                help='number of batches built in the background while the model runs, '
+                                     '0 to build them synchronously')
+    train_settings.add_argument('--num_workers', type=int, default=1,
+                                help='number of threads building the prefetched batches')
+    train_settings.add_argument('--summary_every', type=int, default=100,
+                                help='number of training steps between two summaries, 0 to disable them')
 
     model_settings = parser.add_argument_group('model settings')
     model_settings.add_argument('--word_embed_size', type=int, default=150,
@@ -106,6 +166,10 @@ def parse_args():
                                help='the dir to output the results')
     path_settings.add_argument('--summary_dir', default='./data/summary/Our/'+dataName+'/',
                                help='the dir to write tensorboard summary')
+    path_settings.add_argument('--cache_dir', default='./data/cache/Our/'+dataName+'/',
+                               help='the dir of the compiled data, used instead of the data files once compiled')
+    path_settings.add_argument('--export_dir', default='./data/export/Our/'+dataName+'/',
+                               help='the dir of the versioned inference artifacts')
     path_settings.add_argument('--log_path', default='./data/summary/Our/'+dataName+'/log.txt',
                                help='path of the log file. If not set, logs are printed to console')
     path_settings.add_argument('--pretrained_word_path',
@@ -117,6 +181,18 @@ def parse_args():
     return parser.parse_args()
 
 
+def convert_pretrained_embeddings(args):
+    """
+    converts the pretrained word embeddings once, the later runs load the binary copy instead
+    """
+    logger = logging.getLogger("QANet")
+    assert args.pretrained_word_path is not None, 'No pretrained word embeddings are provided.'
+    logger.info('Converting the embeddings in {}...'.format(args.pretrained_word_path))
+    print('Converting the embeddings in {}...'.format(args.pretrained_word_path))
+    token_num = convert_embeddings(args.pretrained_word_path)
+    logger.info('Done with converting {} embeddings!'.format(token_num))
+
+
 def prepare(args):
     """prepare to process data including building vocab"""
     logger = logging.getLogger("QANet")
@@ -135,7 +211,8 @@ def prepare(args):
     logger.info('Building vocabulary...')
     print('Building vocabulary...')
     dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len, args.max_ch_len,
-                          args.train_files, args.dev_files, args.test_files)
+                          args.train_files, args.dev_files, args.test_files,
+                          stream=args.stream, shuffle_buffer_size=args.shuffle_buffer)
 
     vocab = Vocab(lower=True)
     for word in dataloader.word_iter('train'):
@@ -167,12 +244,34 @@ def prepare(args):
 
     logger.info('Saving vocab...')
     print('Saving vocab...')
-    with open(os.path.join(args.vocab_dir, dataName+'OurVocab.data'), 'wb') as fout:
-        pickle.dump(vocab, fout)
+    vocab.save(os.path.join(args.vocab_dir, dataName+'OurVocab'))
 
     logger.info('====== Done with preparing! ======')
 
 
+def compile_cache(args):
+    """Compile the tokenized and id-converted data into cache_dir, later runs memory-map it"""
+    logger = logging.getLogger("QANet")
+    logger.info("====== compiling ======")
+    logger.info('Load data_set and vocab...')
+    print('Load data_set and vocab...')
+    vocab = Vocab.load(os.path.join(args.vocab_dir, dataName+'OurVocab'))
+
+    dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len, args.max_ch_len,
+                          args.train_files, args.dev_files, args.test_files,
+                          stream=args.stream, shuffle_buffer_size=args.shuffle_buffer)
+
+    logger.info('Converting text into ids...')
+    print('Converting text into ids...')
+    dataloader.convert_to_ids(vocab)
+
+    logger.info('Compiling the data into {}...'.format(args.cache_dir))
+    print('Compiling the data into {}...'.format(args.cache_dir))
+    dataloader.compile_cache(args.cache_dir)
+
+    logger.info('====== Done with compiling! ======')
+
+
 def train(args):
     """Train"""
     logger = logging.getLogger("QANet")
@@ -180,11 +279,13 @@ def train(args):
 
     logger.info('Load data_set and vocab...')
     print('Load data_set and vocab...')
-    with open(os.path.join(args.vocab_dir, dataName+'OurVocab.data'), 'rb') as fin:
-        vocab = pickle.load(fin)
+    vocab = Vocab.load(os.path.join(args.vocab_dir, dataName+'OurVocab'))
 
     dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len, args.max_ch_len,
-                          args.train_files, args.dev_files)
+                          args.train_files, args.dev_files,
+                          stream=args.stream, shuffle_buffer_size=args.shuffle_buffer,
+                          bucket_size=args.bucket_size, prefetch=args.prefetch,
+                          num_workers=args.num_workers, cache_dir=args.cache_dir)
 
     logger.info('Converting text into ids...')
     dataloader.convert_to_ids(vocab)
@@ -194,7 +295,8 @@ def train(args):
 
     logger.info('Training the model...')
     print('Training the model...')
-    model.train(dataloader, args.epochs, args.batch_size, save_dir=args.model_dir, save_prefix=args.algo, dropout=args.dropout)
+    model.train(dataloader, args.epochs, args.batch_size, save_dir=args.model_dir, save_prefix=args.algo, dropout=args.dropout,
+                summary_every=args.summary_every)
 
     logger.info('====== Done with model training! ======')
     print('====== Done with model training! ======')
@@ -205,12 +307,14 @@ def evaluate(args):
     logger.info("====== evaluating ======")
     logger.info('Load data_set and vocab...')
     print('Load data_set and vocab...')
-    with open(os.path.join(args.vocab_dir, dataName+'OurVocab.data'), 'rb') as fin:
-        vocab = pickle.load(fin)
+    vocab = Vocab.load(os.path.join(args.vocab_dir, dataName+'OurVocab'))
 
     assert len(args.dev_files) > 0, 'No dev files are provided.'
     dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len,
-                            args.max_ch_len, args.train_files, args.dev_files)
+                            args.max_ch_len, args.train_files, args.dev_files,
+                            stream=args.stream, shuffle_buffer_size=args.shuffle_buffer,
+                            prefetch=args.prefetch, num_workers=args.num_workers,
+                            cache_dir=args.cache_dir)
 
     logger.info('Converting text into ids...')
     print('Converting text into ids...')
@@ -234,16 +338,27 @@ def evaluate(args):
 
 
 def predict(args):
-    """Predict answers"""
+    """Predict answers, of one shard of the test files if shard_id is set"""
     logger = logging.getLogger("QANet")
+    if args.num_shards > 1 and args.shard_id is None:
+        predict_shards(args, predict_shard, logger)
+        return
+    assert len(args.test_files) > 0, 'No test files are provided.'
+    test_files, result_prefix = args.test_files, 'test.predicted'
+    if args.num_shards > 1:
+        logger.info('Writing the shard {} of {}...'.format(args.shard_id, args.num_shards))
+        test_files = [write_shard(args.test_files, args.num_shards, args.shard_id,
+                                  os.path.join(args.result_dir, 'shards'))]
+        result_prefix = shard_prefix(result_prefix, args.num_shards, args.shard_id)
     logger.info('Load data_set and vocab...')
     print('Load data_set and vocab...')
-    with open(os.path.join(args.vocab_dir, dataName+'OurVocab.data'), 'rb') as fin:
-        vocab = pickle.load(fin)
+    vocab = Vocab.load(os.path.join(args.vocab_dir, dataName+'OurVocab'))
 
-    assert len(args.test_files) > 0, 'No test files are provided.'
     dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len, args.max_ch_len, 
-                          test_files=args.test_files)
+                          test_files=test_files,
+                          stream=args.stream, shuffle_buffer_size=args.shuffle_buffer,
+                          prefetch=args.prefetch, num_workers=args.num_workers,
+                          cache_dir=args.cache_dir)
 
     logger.info('Converting text into ids...')
     print('Converting text into ids...')
@@ -257,11 +372,67 @@ def predict(args):
     print('Predicting answers for test set...')
     test_batches = dataloader.next_batch('test', args.batch_size, vocab.get_word_id(vocab.pad_token), vocab.get_char_id(vocab.pad_token), shuffle=False)
 
-    model.evaluate(test_batches,result_dir=args.result_dir, result_prefix='test.predicted')
+    model.evaluate(test_batches,result_dir=args.result_dir, result_prefix=result_prefix)
 
 
-def run():
-    args = parse_args()
+def predict_shard(args):
+    """Predict one shard in a process started by predict_shards"""
+    init_logger(args)
+    predict(args)
+
+
+def export(args):
+    """Export the trained model into a frozen, inference-only artifact"""
+    logger = logging.getLogger("QANet")
+    logger.info('Load vocab...')
+    print('Load vocab...')
+    vocab = Vocab.load(os.path.join(args.vocab_dir, dataName+'OurVocab'))
+
+    logger.info('Restoring the model...')
+    print('Restoring the model...')
+    model = Model(vocab, args)
+    model.restore(args.model_dir, args.algo)
+    export_model(model, args.export_dir, logger)
+
+
+def dev_batch_factory(args, vocab):
+    """Convert the dev files with the vocab of an exported model, return a function giving the dev batches"""
+    logger = logging.getLogger("QANet")
+    assert len(args.dev_files) > 0, 'No dev files are provided.'
+    dataloader = DataLoader(args.max_p_num, args.max_p_len, args.max_q_len,
+                            args.max_ch_len, dev_files=args.dev_files,
+                            stream=args.stream, shuffle_buffer_size=args.shuffle_buffer,
+                            prefetch=args.prefetch, num_workers=args.num_workers,
+                            cache_dir=args.cache_dir)
+    logger.info('Converting text into ids...')
+    print('Converting text into ids...')
+    dataloader.convert_to_ids(vocab)
+
+    def dev_batches():
+        return dataloader.next_batch('dev', args.batch_size, vocab.get_word_id(vocab.pad_token),
+                                     vocab.get_char_id(vocab.pad_token), shuffle=False)
+    return dev_batches
+
+
+def quantize(args):
+    """Quantize the exported model, calibrate it and report its accuracy on the dev set"""
+    logger = logging.getLogger("QANet")
+    logger.info('Loading the exported model...')
+    print('Loading the exported model...')
+    reference = FrozenModel(args.export_dir)
+    quantize_export(args.export_dir, args.quantize, dev_batch_factory(args, reference.vocab),
+                    args.calibration_batches, args.quantize_tolerance, reference=reference, logger=logger)
+
+
+def benchmark_session(args):
+    """Measure the forward pass of the exported model on a fixed dev sample under each session config"""
+    logger = logging.getLogger("QANet")
+    vocab = Vocab.load(os.path.join(latest_version_dir(args.export_dir), VOCAB_PREFIX))
+    benchmark_export(args, dev_batch_factory(args, vocab), logger)
+
+
+def init_logger(args):
+    """Send the logs to the log file, or to the console if not set"""
     logger = logging.getLogger("QANet")
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -276,20 +447,38 @@ def run():
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
         logger.addHandler(console_handler)
+    return logger
+
+
+def run():
+    args = parse_args()
+    logger = init_logger(args)
 
     logger.info('Running with args : {}'.format(args))
 
     os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
     os.environ["CUDA_VISIBLE_DEVICES"] = args.gpu
 
+    if args.convert_embeddings:
+        convert_pretrained_embeddings(args)
     if args.prepare:
         prepare(args)
+    if args.compile:
+        compile_cache(args)
     if args.train:
         train(args)
     if args.evaluate:
         evaluate(args)
     if args.predict:
         predict(args)
+    if args.merge_shards:
+        merge_test_shards(args, logger)
+    if args.export:
+        export(args)
+    if args.quantize:
+        quantize(args)
+    if args.benchmark_session:
+        benchmark_session(args)
 
 if __name__ == '__main__':
     run()
@@ -16,9 +16,17 @@
 # ============================================================================== 
 """
 This module implements the Vocab class for converting string to id and back
+
+A vocab is saved as two files next to each other:
+    <vocab_path>.json: the settings and the token list, the id of a token is its index
+    <vocab_path>.npy: the embedding matrix, memory-mapped when loaded
 """
 
+import os
+import json
+import pickle
 import numpy as np
+from utils import load_embeddings
 
 
 class Vocab(object):
@@ -26,7 +34,7 @@ class Vocab(object):
     Implements a vocabulary to store the tokens in the data, with their corresponding embeddings.
     """
     def __init__(self, filename=None, initial_tokens=None, lower=False):
-        self.id2token = {}
+        self.id2token = []
         self.token2id = {}
         self.token_cnt = {}
         self.lower = lower
@@ -85,10 +93,9 @@ class Vocab(object):
         returns:
             a token string
         """
-        try:
+        if 0 <= idx < len(self.id2token):
             return self.id2token[idx]
-        except KeyError:
-            return self.unk_token
+        return self.unk_token
 
     def add(self, token, cnt=1):
         """
@@ -102,7 +109,7 @@ class Vocab(object):
             idx = self.token2id[token]
         else:
             idx = len(self.id2token)
-            self.id2token[idx] = token
+            self.id2token.append(token)
             self.token2id[token] = idx
         if cnt > 0:
             if token in self.token_cnt:
@@ -120,7 +127,7 @@ class Vocab(object):
         filtered_tokens = [token for token in self.token2id if self.token_cnt[token] >= min_cnt]
         # rebuild the token x id map
         self.token2id = {}
-        self.id2token = {}
+        self.id2token = []
         for token in self.initial_tokens:
             self.add(token, cnt=0)
         for token in filtered_tokens:
@@ -142,31 +149,22 @@ class Vocab(object):
         loads the pretrained embeddings from embedding_path,
         tokens not in pretrained embeddings will be filtered
         Args:
-            embedding_path: the path of the pretrained embedding file
-        """
-        trained_embeddings = {}
-        with open(embedding_path, 'r') as fin:
-            for line in fin:
-                contents = line.strip().split()
-                token = contents[0].decode('utf8')
-                if token not in self.token2id:
-                    continue
-                trained_embeddings[token] = list(map(float, contents[1:]))
-                if self.embed_dim is None:
-                    self.embed_dim = len(contents) - 1
-        filtered_tokens = trained_embeddings.keys()
+            embedding_path: the path of the pretrained embedding file, see utils.embeddings
+        """
+        # the matrix is indexed by the ids before the filtering
+        trained_embeddings, found_ids = load_embeddings(embedding_path, self.token2id)
+        self.embed_dim = trained_embeddings.shape[1]
+        filtered_tokens = [self.id2token[idx] for idx in found_ids]
         # rebuild the token x id map
+        old_token2id = self.token2id
         self.token2id = {}
-        self.id2token = {}
+        self.id2token = []
         for token in self.initial_tokens:
             self.add(token, cnt=0)
         for token in filtered_tokens:
             self.add(token, cnt=0)
-        # load embeddings
-        self.embeddings = np.zeros([self.size(), self.embed_dim])
-        for token in self.token2id.keys():
-            if token in trained_embeddings:
-                self.embeddings[self.get_id(token)] = trained_embeddings[token]
+        # load embeddings, the initial tokens not in the file stay zeros
+        self.embeddings = trained_embeddings[[old_token2id[token] for token in self.id2token]]
 
     def convert_to_ids(self, tokens):
         """
@@ -176,8 +174,28 @@ class Vocab(object):
         Returns:
             a list of ids
         """
-        vec = [self.get_id(label) for label in tokens]
-        return vec
+        return self.convert_batch([tokens])[0].tolist()
+
+    def convert_batch(self, token_lists):
+        """
+        Converts many lists of tokens to ids with a single lookup pass, use unk_token if the token is not in vocab.
+        Args:
+            token_lists: a list of token lists
+        Returns:
+            a list of int32 arrays, one for each token list
+        """
+        if not token_lists:
+            return []
+        lengths = [len(tokens) for tokens in token_lists]
+        tokens = [token for token_list in token_lists for token in token_list]
+        get_id, unk_id = self.token2id.get, self.token2id[self.unk_token]
+        # the tokens of the vocab are already lowered, so only the missing tokens need to be lowered
+        ids = list(map(get_id, tokens))
+        if None in ids:
+            for pos, idx in enumerate(ids):
+                if idx is None:
+                    ids[pos] = get_id(tokens[pos].lower(), unk_id) if self.lower else unk_id
+        return np.split(np.asarray(ids, dtype=np.int32), np.cumsum(lengths)[:-1])
 
     def recover_from_ids(self, ids, stop_id=None):
         """
@@ -194,3 +212,48 @@ class Vocab(object):
             if stop_id is not None and i == stop_id:
                 break
         return tokens
+
+    def save(self, vocab_path):
+        """
+        Saves the token list into vocab_path.json and the embeddings into vocab_path.npy,
+        the counts are only used to build the vocab and are not saved
+        """
+        meta = {'lower': self.lower,
+                'pad_token': self.pad_token,
+                'unk_token': self.unk_token,
+                'initial_tokens': self.initial_tokens,
+                'embed_dim': self.embed_dim,
+                'tokens': self.id2token}
+        with open(vocab_path + '.json', 'w') as fout:
+            json.dump(meta, fout, ensure_ascii=False)
+        if self.embeddings is not None:
+            np.save(vocab_path + '.npy', np.asarray(self.embeddings, dtype=np.float32))
+
+    @classmethod
+    def load(cls, vocab_path):
+        """
+        Loads a vocab saved by save, or pickled in vocab_path.data by the former versions
+        """
+        if not os.path.exists(vocab_path + '.json'):
+            with open(vocab_path + '.data', 'rb') as fin:
+                return pickle.load(fin)
+        with open(vocab_path + '.json') as fin:
+            meta = json.load(fin)
+        vocab = cls.__new__(cls)
+        vocab.lower = meta['lower']
+        vocab.pad_token = meta['pad_token']
+        vocab.unk_token = meta['unk_token']
+        vocab.initial_tokens = meta['initial_tokens']
+        vocab.embed_dim = meta['embed_dim']
+        vocab.id2token = meta['tokens']
+        vocab.token2id = {token: idx for idx, token in enumerate(vocab.id2token)}
+        vocab.token_cnt = {}
+        vocab.embeddings = np.load(vocab_path + '.npy', mmap_mode='r') \
+            if os.path.exists(vocab_path + '.npy') else None
+        return vocab
+
+    def __setstate__(self, state):
+        # the pickles of the former versions map the ids to the tokens with a dict
+        if isinstance(state['id2token'], dict):
+            state['id2token'] = [state['id2token'][idx] for idx in range(len(state['id2token']))]
+        self.__dict__.update(state)
@@ -1,17 +1,25 @@
 # -*- coding: utf-8 -*-
+"""
+A vocab is saved as three files next to each other:
+    <vocab_path>.json: the settings and the word and char lists, the id of a token is its index
+    <vocab_path>.word.npy, <vocab_path>.char.npy: the embedding matrices, memory-mapped when loaded
+"""
 
+import os
+import json
 import numpy as np
 import pickle as pkl
+from utils import load_embeddings
 
 class Vocab(object):
     def __init__(self, filename=None, initial_tokens=None, lower=False):
         # word
-        self.id2word = {}
+        self.id2word = []
         self.word2id = {}
         self.word_cnt = {}
         
         # char
-        self.id2char = {}
+        self.id2char = []
         self.char2id = {}
         self.char_cnt = {}
 
@@ -55,7 +63,7 @@ class Vocab(object):
         return self.char2id[token] if token in self.char2id else self.char2id[self.unk_token]
 
     def get_word_token(self, idx):
-        return self.id2word[idx] if idx in self.id2word else self.unk_token
+        return self.id2word[idx] if 0 <= idx < len(self.id2word) else self.unk_token
 
     def add_word(self, token, cnt=1):
         token = token.lower() if self.lower else token
@@ -63,7 +71,7 @@ class Vocab(object):
             idx = self.word2id[token]
         else:
             idx = len(self.id2word)
-            self.id2word[idx] = token
+            self.id2word.append(token)
             self.word2id[token] = idx
         if cnt > 0:
             if token in self.word_cnt:
@@ -78,7 +86,7 @@ class Vocab(object):
             idx = self.char2id[token]
         else:
             idx = len(self.id2char)
-            self.id2char[idx] = token
+            self.id2char.append(token)
             self.char2id[token] = idx
         if cnt > 0:
             if token in self.char_cnt:
@@ -91,7 +99,7 @@ class Vocab(object):
         filtered_tokens = [token for token in self.word2id if self.word_cnt[token] >= min_cnt]
         # rebuild the token x id map
         self.word2id = {}
-        self.id2word = {}
+        self.id2word = []
         for token in self.initial_tokens:
             self.add_word(token, cnt=0)
 
@@ -102,7 +110,7 @@ class Vocab(object):
         filtered_tokens = [token for token in self.char2id if self.char_cnt[token] >= min_cnt]
         # rebuild the token x id map
         self.char2id = {}
-        self.id2char = {}
+        self.id2char = []
         for token in self.initial_tokens:
             self.add_char(token, cnt=0)
         for token in filtered_tokens:
@@ -124,29 +132,20 @@ class Vocab(object):
     :description: for word
     """
     def load_pretrained_word_embeddings(self, embedding_path):
-        trained_embeddings = {}
-        with open(embedding_path, 'r') as fin:
-            for line in fin:
-                contents = line.strip().split()
-                token = contents[0].decode('utf8')
-                if token not in self.word2id:
-                    continue
-                trained_embeddings[token] = list(map(float, contents[1:]))
-                if self.word_embed_dim is None:
-                    self.word_embed_dim = len(contents) - 1
-        filtered_tokens = trained_embeddings.keys()
+        # the matrix is indexed by the ids before the filtering, see utils.embeddings for the formats
+        trained_embeddings, found_ids = load_embeddings(embedding_path, self.word2id)
+        self.word_embed_dim = trained_embeddings.shape[1]
+        filtered_tokens = [self.id2word[idx] for idx in found_ids]
         # rebuild the token x id map
+        old_word2id = self.word2id
         self.word2id = {}
-        self.id2word = {}
+        self.id2word = []
         for token in self.initial_tokens:
             self.add_word(token, cnt=0)
         for token in filtered_tokens:
             self.add_word(token, cnt=0)
-        # load embeddings
-        self.word_embeddings = np.zeros([self.word_size(), self.word_embed_dim])
-        for token in self.word2id.keys():
-            if token in trained_embeddings:
-                self.word_embeddings[self.get_word_id(token)] = trained_embeddings[token]
+        # load embeddings, the initial tokens not in the file stay zeros
+        self.word_embeddings = trained_embeddings[[old_word2id[token] for token in self.id2word]]
 
     def load_pretrained_char_embeddings(self, embedding_path):
         trained_embeddings = {}
@@ -161,7 +160,7 @@ class Vocab(object):
         filtered_chars = trained_embeddings.keys()
         # rebuild the token x id map
         self.char2id = {}
-        self.id2char = {}
+        self.id2char = []
         for char in self.initial_chars:
             self.add_char(char, cnt=0)
         for char in filtered_chars:
@@ -178,17 +177,51 @@ class Vocab(object):
                 self.char_embeddings[self.get_char_id(char)] = trained_embeddings[char]
 
     def convert_word_to_ids(self, tokens):
-        vec = [self.get_word_id(label) for label in tokens]
-        return vec
+        return self.convert_word_batch([tokens])[0].tolist()
     
     def convert_char_to_ids(self, tokens):
-        vec = []
-        for token in tokens:
-            char_vec = []
-            for char in token:
-                char_vec.append(self.get_char_id(char))
-            vec.append(char_vec)
-        return vec
+        lengths = [len(token) for token in tokens]
+        ids = self._lookup(self.char2id, [char for token in tokens for char in token])
+        return [chars.tolist() for chars in np.split(ids, np.cumsum(lengths)[:-1])] if tokens else []
+
+    def _lookup(self, token2id, tokens):
+        # the tokens of the vocab are already lowered, so only the missing tokens need to be lowered
+        get_id, unk_id = token2id.get, token2id[self.unk_token]
+        ids = list(map(get_id, tokens))
+        if None in ids:
+            for pos, idx in enumerate(ids):
+                if idx is None:
+                    ids[pos] = get_id(tokens[pos].lower(), unk_id) if self.lower else unk_id
+        return np.asarray(ids, dtype=np.int32)
+
+    def convert_word_batch(self, token_lists):
+        """
+        Converts many lists of tokens to word ids with a single lookup pass
+        Returns:
+            a list of int32 arrays, one for each token list
+        """
+        if not token_lists:
+            return []
+        lengths = [len(tokens) for tokens in token_lists]
+        ids = self._lookup(self.word2id, [token for tokens in token_lists for token in tokens])
+        return np.split(ids, np.cumsum(lengths)[:-1])
+
+    def convert_char_batch(self, token_lists, max_char_len, pad_char_id):
+        """
+        Converts many lists of tokens to char ids with a single lookup pass, the chars of each token
+        are truncated or padded to max_char_len
+        Returns:
+            a list of int32 arrays with shape [len(tokens), max_char_len], one for each token list
+        """
+        if not token_lists:
+            return []
+        tokens = [token[:max_char_len] for token_list in token_lists for token in token_list]
+        char_lens = np.asarray([len(token) for token in tokens], dtype=np.int32)
+        chars = np.full([len(tokens), max_char_len], pad_char_id, dtype=np.int32)
+        # the row-major order of the mask is the order of the chars
+        chars[np.arange(max_char_len) < char_lens[:, None]] = self._lookup(self.char2id, [char for token in tokens
+                                                                                        for char in token])
+        return np.split(chars, np.cumsum([len(token_list) for token_list in token_lists])[:-1])
 
     def recover_from_word_ids(self, ids, stop_id=None):
         tokens = []
@@ -197,3 +230,57 @@ class Vocab(object):
             if stop_id is not None and i == stop_id:
                 break
         return tokens
+
+    def save(self, vocab_path):
+        """
+        Saves the word and char lists into vocab_path.json and the embeddings into .npy files,
+        the counts are only used to build the vocab and are not saved
+        """
+        meta = {'lower': self.lower,
+                'pad_token': self.pad_token,
+                'unk_token': self.unk_token,
+                'initial_tokens': self.initial_tokens,
+                'word_embed_dim': self.word_embed_dim,
+                'char_embed_dim': self.char_embed_dim,
+                'words': self.id2word,
+                'chars': self.id2char}
+        with open(vocab_path + '.json', 'w') as fout:
+            json.dump(meta, fout, ensure_ascii=False)
+        for name, embeddings in [('word', self.word_embeddings), ('char', self.char_embeddings)]:
+            if embeddings is not None:
+                np.save('{}.{}.npy'.format(vocab_path, name), np.asarray(embeddings, dtype=np.float32))
+
+    @classmethod
+    def load(cls, vocab_path):
+        """
+        Loads a vocab saved by save, or pickled in vocab_path.data by the former versions
+        """
+        if not os.path.exists(vocab_path + '.json'):
+            with open(vocab_path + '.data', 'rb') as fin:
+                return pkl.load(fin)
+        with open(vocab_path + '.json') as fin:
+            meta = json.load(fin)
+        vocab = cls.__new__(cls)
+        vocab.lower = meta['lower']
+        vocab.pad_token = meta['pad_token']
+        vocab.unk_token = meta['unk_token']
+        vocab.initial_tokens = meta['initial_tokens']
+        vocab.word_embed_dim = meta['word_embed_dim']
+        vocab.char_embed_dim = meta['char_embed_dim']
+        vocab.id2word = meta['words']
+        vocab.id2char = meta['chars']
+        vocab.word2id = {token: idx for idx, token in enumerate(vocab.id2word)}
+        vocab.char2id = {token: idx for idx, token in enumerate(vocab.id2char)}
+        vocab.word_cnt, vocab.char_cnt = {}, {}
+        for name in ['word', 'char']:
+            embedding_path = '{}.{}.npy'.format(vocab_path, name)
+            setattr(vocab, name + '_embeddings',
+                    np.load(embedding_path, mmap_mode='r') if os.path.exists(embedding_path) else None)
+        return vocab
+
+    def __setstate__(self, state):
+        # the pickles of the former versions map the ids to the tokens with dicts
+        for key in ['id2word', 'id2char']:
+            if isinstance(state[key], dict):
+                state[key] = [state[key][idx] for idx in range(len(state[key]))]
+        self.__dict__.update(state)
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+"""
+This module coalesces concurrent question requests into padded batches,
+so that one sess.run answers several callers at once.
+"""
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from predictor import get_predictor
+
+
+class MicroBatcher(object):
+    """
+    Gathers samples submitted by concurrent callers until batch_size samples are queued
+    or max_wait_ms has passed since the first one, then predicts them in one batch.
+    """
+    def __init__(self, predictor, batch_size=32, max_wait_ms=10):
+        self.logger = logging.getLogger("brc")
+        self.predictor = predictor
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name='micro-batcher')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, sample):
+        """
+        Queues one sample processed by predict_one.data_precess
+        Returns:
+            a Future resolved with the answer string
+        """
+        future = Future()
+        self._queue.put((sample, future))
+        return future
+
+    def predict(self, sample, timeout=None):
+        """
+        Queues one sample and blocks until its answer is ready
+        """
+        return self.submit(sample).result(timeout)
+
+    def _collect(self):
+        """
+        Blocks for the first request, then gathers more until the batch is full or the wait expires
+        """
+        requests = [self._queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(requests) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                requests.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return requests
+
+    def _loop(self):
+        while True:
+            # drop the requests whose callers cancelled while waiting
+            requests = [(sample, future) for sample, future in self._collect()
+                        if future.set_running_or_notify_cancel()]
+            if not requests:
+                continue
+            samples = [sample for sample, _ in requests]
+            futures = [future for _, future in requests]
+            try:
+                answers = self.predictor.predict(samples)
+            except Exception as e:
+                self.logger.exception('Failed to predict a batch of {} samples'.format(len(samples)))
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, answer in zip(futures, answers):
+                future.set_result(answer)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher(args):
+    """
+    Returns the micro batcher of the current process, building it and the predictor on first use
+    """
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(get_predictor(args), args.batch_size, args.max_wait_ms)
+    return _batcher
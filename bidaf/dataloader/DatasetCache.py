@@ -0,0 +1,237 @@
+# -*- coding:utf8 -*-
+"""
+This module compiles the tokenized and id-converted datasets into flat binary arrays,
+so that later runs memory-map them instead of parsing, tokenizing and converting the json again.
+
+The layout of a compiled set in cache_dir/set_name:
+    question_ids.bin, passage_ids.bin: the token ids of all questions / passages, int32, concatenated
+    question_chars.bin, passage_chars.bin: the char ids of each token padded to max_char_len (QANet only)
+    question_offsets.npy: the start of each question in question_ids.bin, plus the total length
+    passage_offsets.npy: the start of each passage in passage_ids.bin, plus the total length
+    sample_passages.npy: the index of the first passage of each sample, plus the passage number
+    answer_passages.npy, answer_spans.npy: the gold passage and span of each sample, -1 if absent
+    samples.jsonl, sample_offsets.npy: the text fields used by evaluation, read lazily by byte offset
+    meta.json: sizes, the vocab size and hash, and the signature of the files and settings the set was compiled with
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from utils import pad_token_chars
+
+TEXT_FIELDS = ['question_id', 'question_type', 'segmented_question', 'answers']
+
+
+def file_stats(data_files):
+    """
+    Returns the path, size and mtime of each data file for the signature of a compiled set,
+    so that a file regenerated at the same path makes the set stale
+    """
+    stats = []
+    for data_path in data_files:
+        try:
+            stat = os.stat(data_path)
+            stats.append([data_path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            stats.append([data_path, None, None])
+    return stats
+
+
+def vocab_hash(*token_lists, lower=False):
+    """
+    Hashes the token lists of a vocab in id order, two vocabs of the same size but different tokens
+    or ids convert the samples into different ids
+    """
+    sha1 = hashlib.sha1(b'lower' if lower else b'cased')
+    for tokens in token_lists:
+        sha1.update(b'\x00\x00')
+        for token in tokens:
+            sha1.update(token.encode('utf-8') + b'\x00')
+    return sha1.hexdigest()
+
+
+def compile_dataset(samples, cache_dir, set_name, vocab_size, signature=None, max_char_len=None, pad_char_id=0,
+                    vocab_digest=None):
+    """
+    Writes the converted samples of one set into cache_dir/set_name
+    Args:
+        samples: an iterable of samples converted to ids by the data loader
+        cache_dir: the root dir of the compiled datasets
+        set_name: train/dev/test
+        vocab_size: the size of the vocab used to convert the samples, checked when loading
+        signature: the data files and settings the samples were loaded with, a cache with another
+                   signature is considered stale
+        max_char_len: if set, the char ids of the tokens are also compiled
+        pad_char_id: the id used to pad the char ids
+        vocab_digest: the vocab_hash of the vocab used to convert the samples, checked when loading
+    Returns:
+        the number of compiled samples
+    """
+    set_dir = os.path.join(cache_dir, set_name)
+    if not os.path.exists(set_dir):
+        os.makedirs(set_dir)
+    with_chars = max_char_len is not None
+
+    question_offsets, passage_offsets, sample_passages = [0], [0], [0]
+    answer_passages, answer_spans, sample_offsets = [], [], [0]
+    files = {name: open(os.path.join(set_dir, name + '.bin'), 'wb')
+             for name in ['question_ids', 'passage_ids'] + (['question_chars', 'passage_chars'] if with_chars else [])}
+    with open(os.path.join(set_dir, 'samples.jsonl'), 'wb') as text_out:
+        for sample in samples:
+            question_ids = np.asarray(sample['question_token_ids'], dtype=np.int32)
+            files['question_ids'].write(question_ids.tobytes())
+            question_offsets.append(question_offsets[-1] + len(question_ids))
+            if with_chars:
+                files['question_chars'].write(
+                    pad_token_chars(sample['question_char_ids'], max_char_len, pad_char_id).tobytes())
+
+            for passage in sample['passages']:
+                passage_ids = np.asarray(passage['passage_token_ids'], dtype=np.int32)
+                files['passage_ids'].write(passage_ids.tobytes())
+                passage_offsets.append(passage_offsets[-1] + len(passage_ids))
+                if with_chars:
+                    files['passage_chars'].write(
+                        pad_token_chars(passage['passage_char_ids'], max_char_len, pad_char_id).tobytes())
+            sample_passages.append(sample_passages[-1] + len(sample['passages']))
+
+            if 'answer_passages' in sample and len(sample['answer_passages']):
+                answer_passages.append(sample['answer_passages'][0])
+                answer_spans.append(sample['answer_spans'][0])
+            else:
+                answer_passages.append(-1)
+                answer_spans.append([-1, -1])
+
+            text = {field: sample[field] for field in TEXT_FIELDS if field in sample}
+            text['passage_tokens'] = [passage['passage_tokens'] for passage in sample['passages']]
+            line = (json.dumps(text, ensure_ascii=False) + '\n').encode('utf-8')
+            text_out.write(line)
+            sample_offsets.append(sample_offsets[-1] + len(line))
+    for fout in files.values():
+        fout.close()
+
+    np.save(os.path.join(set_dir, 'question_offsets.npy'), np.asarray(question_offsets, dtype=np.int64))
+    np.save(os.path.join(set_dir, 'passage_offsets.npy'), np.asarray(passage_offsets, dtype=np.int64))
+    np.save(os.path.join(set_dir, 'sample_passages.npy'), np.asarray(sample_passages, dtype=np.int64))
+    np.save(os.path.join(set_dir, 'sample_offsets.npy'), np.asarray(sample_offsets, dtype=np.int64))
+    np.save(os.path.join(set_dir, 'answer_passages.npy'), np.asarray(answer_passages, dtype=np.int32))
+    np.save(os.path.join(set_dir, 'answer_spans.npy'),
+            np.asarray(answer_spans, dtype=np.int32).reshape([-1, 2]))
+    meta = {'sample_num': len(answer_passages),
+            'question_token_num': question_offsets[-1],
+            'passage_token_num': passage_offsets[-1],
+            'vocab_size': vocab_size,
+            'vocab_hash': vocab_digest,
+            'signature': signature,
+            'max_char_len': max_char_len}
+    with open(os.path.join(set_dir, 'meta.json'), 'w') as fout:
+        json.dump(meta, fout)
+    return meta['sample_num']
+
+
+def has_compiled(cache_dir, set_name, signature=None):
+    """
+    Checks whether set_name has been compiled into cache_dir with the same signature
+    """
+    if cache_dir is None:
+        return False
+    meta_path = os.path.join(cache_dir, set_name, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as fin:
+        meta = json.load(fin)
+    # json turns the tuples of the signature into lists
+    return meta['signature'] == json.loads(json.dumps(signature))
+
+
+class CachedDataset(object):
+    """
+    A read-only sequence of samples backed by memory-mapped arrays, several processes share the same pages
+    """
+    def __init__(self, cache_dir, set_name):
+        self.set_dir = os.path.join(cache_dir, set_name)
+        with open(os.path.join(self.set_dir, 'meta.json')) as fin:
+            self.meta = json.load(fin)
+        self.with_chars = self.meta['max_char_len'] is not None
+
+        self.question_ids = self._map('question_ids', [self.meta['question_token_num']])
+        self.passage_ids = self._map('passage_ids', [self.meta['passage_token_num']])
+        if self.with_chars:
+            self.question_chars = self._map('question_chars',
+                                            [self.meta['question_token_num'], self.meta['max_char_len']])
+            self.passage_chars = self._map('passage_chars',
+                                           [self.meta['passage_token_num'], self.meta['max_char_len']])
+        self.question_offsets = self._load('question_offsets')
+        self.passage_offsets = self._load('passage_offsets')
+        self.sample_passages = self._load('sample_passages')
+        self.sample_offsets = self._load('sample_offsets')
+        self.answer_passages = self._load('answer_passages')
+        self.answer_spans = self._load('answer_spans')
+        self._text = np.memmap(os.path.join(self.set_dir, 'samples.jsonl'), dtype=np.uint8, mode='r') \
+            if self.sample_offsets[-1] > 0 else None
+
+    def check_vocab(self, vocab_size, vocab_digest):
+        """
+        The compiled ids are only valid for the vocab they were converted with
+        """
+        if json.loads(json.dumps(vocab_size)) != self.meta['vocab_size']:
+            raise ValueError('{} was compiled with a vocab of size {}, but the vocab has size {}, '
+                             'compile it again'.format(self.set_dir, self.meta['vocab_size'], vocab_size))
+        if vocab_digest != self.meta.get('vocab_hash'):
+            raise ValueError('{} was compiled with another vocab of the same size, '
+                             'compile it again'.format(self.set_dir))
+
+    def _map(self, name, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=np.int32)
+        return np.memmap(os.path.join(self.set_dir, name + '.bin'), dtype=np.int32, mode='r', shape=tuple(shape))
+
+    def _load(self, name):
+        return np.load(os.path.join(self.set_dir, name + '.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.meta['sample_num']
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def sample_lengths(self, max_p_num):
+        """
+        The token number of the longest of the first max_p_num passages of each sample, read from the offsets
+        """
+        passage_lens = np.diff(self.passage_offsets)
+        first_passages, end_passages = self.sample_passages[:-1], self.sample_passages[1:]
+        lengths = np.zeros([len(self)], dtype=np.int64)
+        for pidx in range(max_p_num):
+            valid = first_passages + pidx < end_passages
+            lengths[valid] = np.maximum(lengths[valid], passage_lens[first_passages[valid] + pidx])
+        return lengths
+
+    def __getitem__(self, idx):
+        """
+        Assembles one sample with the same fields as the data loaders produce, the ids are views of the mapped arrays
+        """
+        if idx < 0:
+            idx += len(self)
+        text = json.loads(bytes(self._text[self.sample_offsets[idx]: self.sample_offsets[idx + 1]]).decode('utf-8'))
+        q_start, q_end = self.question_offsets[idx], self.question_offsets[idx + 1]
+        sample = {field: text[field] for field in TEXT_FIELDS if field in text}
+        sample['question_tokens'] = text.get('segmented_question', [])
+        sample['question_token_ids'] = self.question_ids[q_start: q_end]
+        if self.with_chars:
+            sample['question_char_ids'] = self.question_chars[q_start: q_end]
+        sample['passages'] = []
+        first_passage = self.sample_passages[idx]
+        for pidx, passage_tokens in enumerate(text['passage_tokens']):
+            p_start = self.passage_offsets[first_passage + pidx]
+            p_end = self.passage_offsets[first_passage + pidx + 1]
+            passage = {'passage_tokens': passage_tokens,
+                       'passage_token_ids': self.passage_ids[p_start: p_end]}
+            if self.with_chars:
+                passage['passage_char_ids'] = self.passage_chars[p_start: p_end]
+            sample['passages'].append(passage)
+        if self.answer_passages[idx] >= 0:
+            sample['answer_passages'] = [int(self.answer_passages[idx])]
+            sample['answer_spans'] = [self.answer_spans[idx].tolist()]
+        return sample
@@ -2,9 +2,14 @@
 '''Writen by Yanxu, FangYueran and ZhangTianyang''' 
 import json
 import logging
+import itertools
 import numpy as np
 from collections import Counter
 import jieba
+from dataloader.DatasetCache import CachedDataset, compile_dataset, has_compiled, file_stats, vocab_hash
+from utils import bucket_batches, bucket_stream, prefetch_map, pad_sequences, pad_char_sequences
+from utils import slim_sample, shuffle_buffer
+
 
 def word_tokenize(sent):
     if isinstance(sent, list):
@@ -20,28 +25,53 @@ class DataLoader(object):
     This module implements the APIs for loading and using baidu reading comprehension dataset
     """
     def __init__(self, max_p_num, max_p_len, max_q_len, max_char_len, 
-                 train_files=[], dev_files=[], test_files=[]):
+                 train_files=[], dev_files=[], test_files=[], stream=False, shuffle_buffer_size=10000,
+                 bucket_size=0, prefetch=0, num_workers=1, cache_dir=None):
         self.logger = logging.getLogger("brc")
         self.max_p_num = max_p_num
         self.max_p_len = max_p_len
         self.max_q_len = max_q_len
         self.max_char_len = max_char_len
 
+        # in stream mode the files are parsed lazily by next_batch instead of being kept in memory
+        self.stream = stream
+        self.shuffle_buffer_size = shuffle_buffer_size
+        # the shuffled batches are drawn from buckets of bucket_size batches sorted by passage length
+        self.bucket_size = bucket_size
+        # the number of batches built ahead by num_workers background threads, 0 to build them synchronously
+        self.prefetch = prefetch
+        self.num_workers = num_workers
+        self.data_files = {'train': train_files, 'dev': dev_files, 'test': test_files}
+        self.vocab = None
+
         self.train_set, self.dev_set, self.test_set = [], [], []
-        if train_files:
-            for train_file in train_files:
+        # the sets compiled by compile_cache are memory-mapped and their files are not parsed at all
+        for set_name in ['train', 'dev', 'test']:
+            if self.data_files[set_name] and has_compiled(cache_dir, set_name, self._cache_signature(set_name)):
+                setattr(self, set_name + '_set', CachedDataset(cache_dir, set_name))
+                self.data_files[set_name] = []
+                self.logger.info('{} set size: {} questions, memory-mapped from {}.'.format(
+                    set_name.capitalize(), len(getattr(self, set_name + '_set')), cache_dir))
+
+        if stream:
+            self.logger.info('Streaming train files {}, dev files {}, test files {}'.format(
+                self.data_files['train'], self.data_files['dev'], self.data_files['test']))
+            return
+
+        if self.data_files['train']:
+            for train_file in self.data_files['train']:
                 self.logger.info('---train file-----{}'.format(train_file))
                 self.train_set += self._load_dataset(train_file, train=True)
             self.logger.info('Train set size: {} questions.'.format(len(self.train_set)))
 
-        if dev_files:
-            for dev_file in dev_files:
+        if self.data_files['dev']:
+            for dev_file in self.data_files['dev']:
                 self.logger.info('---dev file-----{}'.format(dev_file))
                 self.dev_set += self._load_dataset(dev_file, train=True)
             self.logger.info('Dev set size: {} questions.'.format(len(self.dev_set)))
 
-        if test_files:
-            for test_file in test_files:
+        if self.data_files['test']:
+            for test_file in self.data_files['test']:
                 self.test_set += self._load_dataset(test_file)
             self.logger.info('Test set size: {} questions.'.format(len(self.test_set)))
 
@@ -51,71 +81,83 @@ class DataLoader(object):
         Args:
             data_path: the data file to load
         """
-        max_char_num = 0
-        max_char_list = []
+        return list(self._iter_dataset(data_path, train))
+
+    def _iter_dataset(self, data_path, train=False):
+        """
+        Parses the dataset lazily, one sample per line
+        """
         with open(data_path,encoding='utf-8') as fin:
-            data_set = []
             for lidx, line in enumerate(fin):
-                sample = json.loads(line.strip())
-                if train:
-                    if len(sample['answer_spans']) == 0:
-                        continue
-                    if sample['answer_spans'][0][1] >= self.max_p_len:
-                        continue
-
-                if 'answer_docs' in sample:
-                    sample['answer_passages'] = sample['answer_docs']
-
-                question_tokens = word_tokenize(sample['segmented_question'])
-                sample['question_tokens'] = question_tokens
-                question_chars = [list(token) for token in question_tokens]
-                sample['question_chars'] = question_chars
-
-                for char in question_chars:
-                    if len(char) > max_char_num:
-                        max_char_num = len(char)
-                        max_char_list = char
-
-                sample['passages'] = []
-                for d_idx, doc in enumerate(sample['documents']):
-                    if train:
-                        most_related_para = doc['most_related_para']
-
-                        passage_tokens = word_tokenize(doc['segmented_paragraphs'][most_related_para])
-                        passage_chars = [list(token) for token in passage_tokens]
-
-                        for char in passage_chars:
-                            if len(char) > max_char_num:
-                                max_char_num = len(char)
-                                max_char_list = char
-
-                        sample['passages'].append(
-                            {'passage_tokens': passage_tokens,
-                             'is_selected': doc['is_selected'],
-                             'passage_chars':passage_chars}
-                        )
+                sample = self._parse_sample(json.loads(line.strip()), train)
+                if sample is not None:
+                    yield sample
+
+    def _parse_sample(self, sample, train=False):
+        """
+        Tokenizes one raw sample and selects its passages
+        Returns:
+            the sample, or None if it is filtered out
+        """
+        if train:
+            if len(sample['answer_spans']) == 0:
+                return None
+            if sample['answer_spans'][0][1] >= self.max_p_len:
+                return None
+
+        if 'answer_docs' in sample:
+            sample['answer_passages'] = sample['answer_docs']
+
+        question_tokens = word_tokenize(sample['segmented_question'])
+        sample['question_tokens'] = question_tokens
+        sample['question_chars'] = [list(token) for token in question_tokens]
+
+        sample['passages'] = []
+        for d_idx, doc in enumerate(sample['documents']):
+            if train:
+                most_related_para = doc['most_related_para']
+
+                passage_tokens = word_tokenize(doc['segmented_paragraphs'][most_related_para])
+                passage_chars = [list(token) for token in passage_tokens]
+
+                sample['passages'].append(
+                    {'passage_tokens': passage_tokens,
+                     'is_selected': doc['is_selected'],
+                     'passage_chars':passage_chars}
+                )
+            else:
+                para_infos = []
+                for para_tokens in doc['segmented_paragraphs']:
+                    para_tokens = word_tokenize(para_tokens)
+                    question_tokens = word_tokenize(sample['segmented_question'])
+
+                    common_with_question = Counter(para_tokens) & Counter(question_tokens)
+                    correct_preds = sum(common_with_question.values())
+                    if correct_preds == 0:
+                        recall_wrt_question = 0
                     else:
-                        para_infos = []
-                        for para_tokens in doc['segmented_paragraphs']:
-                            para_tokens = word_tokenize(para_tokens)
-                            question_tokens = word_tokenize(sample['segmented_question'])
-
-                            common_with_question = Counter(para_tokens) & Counter(question_tokens)
-                            correct_preds = sum(common_with_question.values())
-                            if correct_preds == 0:
-                                recall_wrt_question = 0
-                            else:
-                                recall_wrt_question = float(correct_preds) / len(question_tokens)
-                            para_infos.append((para_tokens, recall_wrt_question, len(para_tokens)))
-                        para_infos.sort(key=lambda x: (-x[1], x[2]))
-                        fake_passage_tokens = []
-                        for para_info in para_infos[:1]:
-                            fake_passage_tokens += para_info[0]
-
-                        sample['passages'].append({'passage_tokens': fake_passage_tokens,
-                                                    'passage_chars':[list(token) for token in fake_passage_tokens]})
-                data_set.append(sample)
-        return data_set
+                        recall_wrt_question = float(correct_preds) / len(question_tokens)
+                    para_infos.append((para_tokens, recall_wrt_question, len(para_tokens)))
+                para_infos.sort(key=lambda x: (-x[1], x[2]))
+                fake_passage_tokens = []
+                for para_info in para_infos[:1]:
+                    fake_passage_tokens += para_info[0]
+
+                sample['passages'].append({'passage_tokens': fake_passage_tokens,
+                                            'passage_chars':[list(token) for token in fake_passage_tokens]})
+        return sample
+
+    def _stream_set(self, set_name):
+        """
+        Streams the slim samples of one set from its files, converted to ids if the vocab is known
+        """
+        for data_path in self.data_files[set_name]:
+            # the dev set is filtered like the train set, see __init__
+            for sample in self._iter_dataset(data_path, train=set_name in ('train', 'dev')):
+                sample = slim_sample(sample)
+                if self.vocab is not None:
+                    self._convert_sample_to_ids(sample, self.vocab)
+                yield sample
 
     def _one_mini_batch(self, data, indices, pad_id, pad_char_id):
         """
@@ -152,10 +194,10 @@ class DataLoader(object):
                 else:
                     batch_data['question_token_ids'].append([])
                     batch_data['question_length'].append(0)
-                    batch_data['question_char_ids'].append([[]])
+                    batch_data['question_char_ids'].append([])
                     batch_data['passage_token_ids'].append([])
                     batch_data['passage_length'].append(0)
-                    batch_data['passage_char_ids'].append([[]])
+                    batch_data['passage_char_ids'].append([])
 
         batch_data, padded_p_len, padded_q_len = self._dynamic_padding(batch_data, pad_id, pad_char_id)
         for sample in batch_data['raw_data']:
@@ -171,38 +213,19 @@ class DataLoader(object):
 
     def _dynamic_padding(self, batch_data, pad_id, pad_char_id):
         """
-        Dynamically pads the batch_data with pad_id
+        Dynamically pads the batch_data with pad_id and pad_char_id into int32 arrays, the samples are not modified
         """
         pad_char_len = self.max_char_len
-        pad_p_len = self.max_p_len #min(self.max_p_len, max(batch_data['passage_length']))
-        pad_q_len = self.max_q_len #min(self.max_q_len, max(batch_data['question_length']))
-        batch_data['passage_token_ids'] = [(ids + [pad_id] * (pad_p_len - len(ids)))[: pad_p_len]
-                                           for ids in batch_data['passage_token_ids']]
-        for index, char_list in enumerate(batch_data['passage_char_ids']):
-            #print(batch_data['passage_char_ids'])
-            for char_index in range(len(char_list)):
-                if len(char_list[char_index]) >= pad_char_len:
-                    char_list[char_index] = char_list[char_index][:self.max_char_len]
-                else:
-                    char_list[char_index] += [pad_char_id]*(pad_char_len - len(char_list[char_index]))
-            batch_data['passage_char_ids'][index] = char_list
-        batch_data['passage_char_ids'] = [(ids + [[pad_char_id]*pad_char_len]*(pad_p_len-len(ids)))[:pad_p_len]
-                                        for ids in batch_data['passage_char_ids']]
-
-        # print(np.array(batch_data['passage_char_ids']).shape, "==========")
-
-        batch_data['question_token_ids'] = [(ids + [pad_id] * (pad_q_len - len(ids)))[: pad_q_len]
-                                            for ids in batch_data['question_token_ids']]
-        for index, char_list in enumerate(batch_data['question_char_ids']):
-            for char_index in range(len(char_list)):
-                if len(char_list[char_index]) >= pad_char_len:
-                    char_list[char_index] = char_list[char_index][:self.max_char_len]
-                else:    
-                    char_list[char_index] += [pad_char_id]*(pad_char_len - len(char_list[char_index]))
-            batch_data['question_char_ids'][index] = char_list
-        batch_data['question_char_ids'] = [(ids + [[pad_char_id]*pad_char_len]*(pad_q_len-len(ids)))[:pad_q_len]
-                                        for ids in batch_data['question_char_ids']]
-
+        pad_p_len = min(self.max_p_len, max(batch_data['passage_length']))
+        pad_q_len = min(self.max_q_len, max(batch_data['question_length']))
+        batch_data['passage_token_ids'] = pad_sequences(batch_data['passage_token_ids'], pad_p_len, pad_id)
+        batch_data['passage_char_ids'] = pad_char_sequences(batch_data['passage_char_ids'], pad_p_len,
+                                                            pad_char_len, pad_char_id)
+        batch_data['question_token_ids'] = pad_sequences(batch_data['question_token_ids'], pad_q_len, pad_id)
+        batch_data['question_char_ids'] = pad_char_sequences(batch_data['question_char_ids'], pad_q_len,
+                                                             pad_char_len, pad_char_id)
+        batch_data['passage_length'] = np.asarray(batch_data['passage_length'], dtype=np.int32)
+        batch_data['question_length'] = np.asarray(batch_data['question_length'], dtype=np.int32)
         return batch_data, pad_p_len, pad_q_len
 
     def word_iter(self, set_name=None):
@@ -213,8 +236,20 @@ class DataLoader(object):
         Returns:
             a generator
         """
+        if self.stream:
+            set_names = ['train', 'dev', 'test'] if set_name is None else [set_name]
+            for name in set_names:
+                if name not in self.data_files:
+                    raise NotImplementedError('No data set named as {}'.format(name))
+                for sample in self._stream_set(name):
+                    for token in sample['question_tokens']:
+                        yield token
+                    for passage in sample['passages']:
+                        for token in passage['passage_tokens']:
+                            yield token
+            return
         if set_name is None:
-            data_set = self.train_set + self.dev_set + self.test_set
+            data_set = itertools.chain(self.train_set, self.dev_set, self.test_set)
         elif set_name == 'train':
             data_set = self.train_set
         elif set_name == 'dev':
@@ -238,15 +273,76 @@ class DataLoader(object):
         Args:
             vocab: the vocabulary on this dataset
         """
+        # streamed samples are converted when they are read
+        self.vocab = vocab
         for data_set in [self.train_set, self.dev_set, self.test_set]:
             if data_set is None:
                 continue
+            if isinstance(data_set, CachedDataset):
+                data_set.check_vocab([vocab.word_size(), vocab.char_size()], self._vocab_hash(vocab))
+                continue
             for sample in data_set:
-                sample['question_token_ids'] = vocab.convert_word_to_ids(sample['question_tokens'])
-                sample["question_char_ids"] = vocab.convert_char_to_ids(sample['question_tokens'])
-                for passage in sample['passages']:
-                    passage['passage_token_ids'] = vocab.convert_word_to_ids(passage['passage_tokens'])
-                    passage['passage_char_ids'] = vocab.convert_char_to_ids(passage['passage_tokens'])
+                self._convert_sample_to_ids(sample, vocab)
+
+    def _convert_sample_to_ids(self, sample, vocab):
+        """
+        Converts one sample into int32 arrays, the char ids of each token padded to max_char_len
+        """
+        # the question and the passages are converted in one lookup pass
+        token_lists = [sample['question_tokens']] + [passage['passage_tokens'] for passage in sample['passages']]
+        token_ids = vocab.convert_word_batch(token_lists)
+        char_ids = vocab.convert_char_batch(token_lists, self.max_char_len, vocab.get_char_id(vocab.pad_token))
+        sample['question_token_ids'], sample['question_char_ids'] = token_ids[0], char_ids[0]
+        for passage, passage_token_ids, passage_char_ids in zip(sample['passages'], token_ids[1:], char_ids[1:]):
+            passage['passage_token_ids'] = passage_token_ids
+            passage['passage_char_ids'] = passage_char_ids
+
+    def _sample_length(self, sample):
+        """
+        The length a sample is padded to, that of its longest passage
+        """
+        passages = sample['passages'][:self.max_p_num]
+        return min(self.max_p_len, max([len(passage['passage_token_ids']) for passage in passages] or [0]))
+
+    def _sample_lengths(self, data):
+        """
+        The lengths of all the samples of a set, used to bucket the batches
+        """
+        if isinstance(data, CachedDataset):
+            return np.minimum(data.sample_lengths(self.max_p_num), self.max_p_len)
+        return [self._sample_length(sample) for sample in data]
+
+    def _cache_signature(self, set_name):
+        """
+        The files and settings a compiled set depends on, the train and dev sets are filtered by max_p_len
+        """
+        return {'data_files': file_stats(self.data_files[set_name]), 'max_p_len': self.max_p_len}
+
+    @staticmethod
+    def _vocab_hash(vocab):
+        return vocab_hash(vocab.id2word, vocab.id2char, lower=vocab.lower)
+
+    def compile_cache(self, cache_dir):
+        """
+        Compiles the converted sets into flat arrays in cache_dir, later runs memory-map them
+        Args:
+            cache_dir: the dir to write the compiled sets
+        """
+        assert self.vocab is not None, 'convert_to_ids must be called before compile_cache'
+        for set_name in ['train', 'dev', 'test']:
+            if not self.data_files[set_name]:
+                continue
+            if self.stream:
+                samples = self._stream_set(set_name)
+            else:
+                samples = getattr(self, set_name + '_set')
+            sample_num = compile_dataset(samples, cache_dir, set_name,
+                                         [self.vocab.word_size(), self.vocab.char_size()],
+                                         signature=self._cache_signature(set_name),
+                                         max_char_len=self.max_char_len,
+                                         pad_char_id=self.vocab.get_char_id(self.vocab.pad_token),
+                                         vocab_digest=self._vocab_hash(self.vocab))
+            self.logger.info('Compiled {} {} questions into {}'.format(sample_num, set_name, cache_dir))
 
     def next_batch(self, set_name, batch_size, pad_id, pad_char_id, shuffle=True):
         """
@@ -259,6 +355,18 @@ class DataLoader(object):
         Returns:
             a generator for all batches
         """
+        if self.stream and self.data_files.get(set_name):
+            batch_indices = self._gen_stream_batch_indices(set_name, batch_size, shuffle)
+        else:
+            batch_indices = self._gen_memory_batch_indices(set_name, batch_size, shuffle)
+        # the batches are padded in background threads while the model runs on the previous ones
+        return prefetch_map(lambda item: self._one_mini_batch(item[0], item[1], pad_id, pad_char_id),
+                            batch_indices, self.prefetch, self.num_workers)
+
+    def _gen_memory_batch_indices(self, set_name, batch_size, shuffle):
+        """
+        Generates the data and the sample indices of each batch of a loaded or compiled set
+        """
         if set_name == 'train':
             data = self.train_set
         elif set_name == 'dev':
@@ -267,11 +375,34 @@ class DataLoader(object):
             data = self.test_set
         else:
             raise NotImplementedError('No data set named as {}'.format(set_name))
+        if shuffle and self.bucket_size:
+            for batch_indices in bucket_batches(self._sample_lengths(data), batch_size, self.bucket_size):
+                yield data, batch_indices
+            return
         data_size = len(data)
         indices = np.arange(data_size)
         if shuffle:
             np.random.shuffle(indices)
         for batch_start in np.arange(0, data_size, batch_size):
             batch_indices = indices[batch_start: batch_start + batch_size]
-            yield self._one_mini_batch(data, batch_indices, pad_id, pad_char_id)
+            yield data, batch_indices
 
+    def _gen_stream_batch_indices(self, set_name, batch_size, shuffle):
+        """
+        Generates the samples of each batch from the stream, with a bounded shuffle buffer
+        """
+        samples = self._stream_set(set_name)
+        if shuffle:
+            samples = shuffle_buffer(samples, self.shuffle_buffer_size)
+            if self.bucket_size:
+                for batch in bucket_stream(samples, batch_size, self.bucket_size, self._sample_length):
+                    yield batch, range(len(batch))
+                return
+        batch = []
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) == batch_size:
+                yield batch, range(len(batch))
+                batch = []
+        if batch:
+            yield batch, range(len(batch))
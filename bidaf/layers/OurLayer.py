@@ -318,7 +318,8 @@ def dot_product_attention(q,
                     initializer = tf.zeros_initializer())
             logits += b
         if mask is not None:
-            shapes = [x  if x != None else -1 for x in logits.shape.as_list()]
+            # both the batch size and the length may be dynamic
+            shapes = shape_list(logits)
             mask = tf.reshape(mask, [shapes[0],1,1,shapes[-1]])
             logits = mask_logits(logits, mask)
         weights = tf.nn.softmax(logits, name="attention_weights")
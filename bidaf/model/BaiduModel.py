@@ -24,15 +24,17 @@ Note that we use Pointer Network for the decoding stage of both models.
 import os
 import time
 import logging
-import json
 import numpy as np
 import tensorflow as tf
-from utils import compute_bleu_rouge
-from utils import normalize
+from utils import PredictionWriter
+from utils import find_best_answers
+from utils import find_best_passage_span
 from layers.BaiduLayer import rnn
 from layers.BaiduLayer import MatchLSTMLayer
 from layers.BaiduLayer import AttentionFlowMatchLayer
 from layers.BaiduLayer import PointerNetDecoder
+from model.FrozenModel import export_frozen_graph
+from model.SessionConfig import session_config_from_args
 
 
 class RCModel(object):
@@ -63,8 +65,8 @@ class RCModel(object):
         self.vocab = vocab
 
         # session info
-        sess_config = tf.ConfigProto()
-        sess_config.gpu_options.allow_growth = True
+        # the thread pools, XLA and graph optimizations of the run settings
+        sess_config = session_config_from_args(args, allow_growth=True)
         self.sess = tf.Session(config=sess_config)
 
         self._build_graph()
@@ -216,12 +218,13 @@ class RCModel(object):
             raise NotImplementedError('Unsupported optimizer: {}'.format(self.optim_type))
         self.train_op = self.optimizer.minimize(self.loss)
 
-    def _train_epoch(self, train_batches, dropout_keep_prob,merged,total_step):
+    def _train_epoch(self, train_batches, dropout_keep_prob,merged,total_step, summary_every=100):
         """
         Trains the model for a single epoch.
         Args:
             train_batches: iterable batch data for training
             dropout_keep_prob: float value indicating dropout keep probability
+            summary_every: the summaries are fetched with the train op every summary_every steps
         """
         total_num, total_loss = 0, 0
         log_every_n_batch, n_batch_loss = 50, 0
@@ -233,12 +236,14 @@ class RCModel(object):
                          self.start_label: batch['start_id'],
                          self.end_label: batch['end_id'],
                          self.dropout_keep_prob: dropout_keep_prob}
-            _, loss = self.sess.run([self.train_op, self.loss], feed_dict)
+            if summary_every > 0 and total_step % summary_every == 0:
+                _, loss, summary = self.sess.run([self.train_op, self.loss, merged], feed_dict)
+                self.train_writer.add_summary(summary, total_step)
+            else:
+                _, loss = self.sess.run([self.train_op, self.loss], feed_dict)
             total_loss += loss * len(batch['raw_data'])
             total_num += len(batch['raw_data'])
             n_batch_loss += loss
-            summary = self.sess.run(merged, feed_dict)
-            self.train_writer.add_summary(summary, total_step)
             total_step += 1
             if log_every_n_batch > 0 and bitx % log_every_n_batch == 0:
                 self.logger.info('Average loss from batch {} to {} is {}'.format(
@@ -247,7 +252,7 @@ class RCModel(object):
         return 1.0 * total_loss / total_num,total_step
 
     def train(self, data, epochs, batch_size, save_dir, save_prefix,
-              dropout_keep_prob=1.0, evaluate=True):
+              dropout_keep_prob=1.0, evaluate=True, summary_every=100):
         """
         Train the model with data
         Args:
@@ -258,6 +263,7 @@ class RCModel(object):
             save_prefix: the prefix indicating the model type
             dropout_keep_prob: float value indicating dropout keep probability
             evaluate: whether to evaluate the model on test set after each epoch
+            summary_every: number of steps between two summaries, 0 to disable them
         """
         pad_id = self.vocab.get_id(self.vocab.pad_token)
         max_bleu_4 = 0
@@ -267,7 +273,8 @@ class RCModel(object):
         for epoch in range(1, epochs + 1):
             self.logger.info('Training the model for epoch {}'.format(epoch))
             train_batches = data.gen_mini_batches('train', batch_size, pad_id, shuffle=True)
-            train_loss,total_step = self._train_epoch(train_batches, dropout_keep_prob,merged,total_step)
+            train_loss,total_step = self._train_epoch(train_batches, dropout_keep_prob,merged,total_step,
+                                                       summary_every)
             self.logger.info('Average train loss for epoch {} is {}'.format(epoch, train_loss))
 
             if evaluate:
@@ -295,65 +302,49 @@ class RCModel(object):
             result_prefix: prefix of the file for saving predicted answers,
                            answers will not be saved if None
             save_full_info: if True, the pred_answers will be added to raw sample and saved
+        The predictions are written and scored as each batch finishes, none of them is kept in memory
         """
-        pred_answers, ref_answers = [], []
-        total_loss, total_num = 0, 0
-        for b_itx, batch in enumerate(eval_batches):
-            feed_dict = {self.p: batch['passage_token_ids'],
-                         self.q: batch['question_token_ids'],
-                         self.p_length: batch['passage_length'],
-                         self.q_length: batch['question_length'],
-                         self.start_label: batch['start_id'],
-                         self.end_label: batch['end_id'],
-                         self.dropout_keep_prob: 1.0}
-            start_probs, end_probs, loss = self.sess.run([self.start_probs,
-                                                          self.end_probs, self.loss], feed_dict)
-
-            total_loss += loss * len(batch['raw_data'])
-            total_num += len(batch['raw_data'])
-
-            padded_p_len = len(batch['passage_token_ids'][0])
-            for sample, start_prob, end_prob in zip(batch['raw_data'], start_probs, end_probs):
-
-                best_answer = self.find_best_answer(sample, start_prob, end_prob, padded_p_len)
-                if save_full_info:
-                    sample['pred_answers'] = [best_answer]
-                    pred_answers.append(sample)
-                else:
-                    pred_answers.append({'question_id': sample['question_id'],
-                                         'question': ''.join(sample['segmented_question']),
-                                         'question_type': sample['question_type'],
-                                         'answers': [best_answer],
-                                         'entity_answers': [[]],
-                                         'yesno_answers': []})
-                if 'answers' in sample:
-                    ref_answers.append({'question_id': sample['question_id'],
-                                         'question_type': sample['question_type'],
-                                         'answers': sample['answers'],
-                                         'entity_answers': [[]],
-                                         'yesno_answers': []})
-
+        result_file = None
         if result_dir is not None and result_prefix is not None:
             result_file = os.path.join(result_dir, result_prefix + '.json')
-            with open(result_file, 'w') as fout:
-                for pred_answer in pred_answers:
-                    fout.write(json.dumps(pred_answer, ensure_ascii=False) + '\n')
-
+        total_loss, total_num = 0, 0
+        with PredictionWriter(result_file) as writer:
+            for b_itx, batch in enumerate(eval_batches):
+                feed_dict = {self.p: batch['passage_token_ids'],
+                             self.q: batch['question_token_ids'],
+                             self.p_length: batch['passage_length'],
+                             self.q_length: batch['question_length'],
+                             self.start_label: batch['start_id'],
+                             self.end_label: batch['end_id'],
+                             self.dropout_keep_prob: 1.0}
+                start_probs, end_probs, loss = self.sess.run([self.start_probs,
+                                                              self.end_probs, self.loss], feed_dict)
+
+                total_loss += loss * len(batch['raw_data'])
+                total_num += len(batch['raw_data'])
+
+                padded_p_len = len(batch['passage_token_ids'][0])
+                best_answers = self.find_best_answers(batch['raw_data'], start_probs, end_probs, padded_p_len)
+                for sample, best_answer in zip(batch['raw_data'], best_answers):
+                    if save_full_info:
+                        sample['pred_answers'] = [best_answer]
+                        pred_answer = sample
+                    else:
+                        pred_answer = {'question_id': sample['question_id'],
+                                       'question': ''.join(sample['segmented_question']),
+                                       'question_type': sample['question_type'],
+                                       'answers': [best_answer],
+                                       'entity_answers': [[]],
+                                       'yesno_answers': []}
+                    writer.add(sample['question_id'], best_answer, sample.get('answers'), pred_answer)
+
+        if result_file is not None:
             self.logger.info('Saving {} results to {}'.format(result_prefix, result_file))
 
         # this average loss is invalid on test set, since we don't have true start_id and end_id
-        ave_loss = 1.0 * total_loss / total_num
-        # compute the bleu and rouge scores if reference answers is provided
-        if len(ref_answers) > 0:
-            pred_dict, ref_dict = {}, {}
-            for pred, ref in zip(pred_answers, ref_answers):
-                question_id = ref['question_id']
-                if len(ref['answers']) > 0:
-                    pred_dict[question_id] = normalize(pred['answers'])
-                    ref_dict[question_id] = normalize(ref['answers'])
-            bleu_rouge = compute_bleu_rouge(pred_dict, ref_dict)
-        else:
-            bleu_rouge = None
+        ave_loss = 1.0 * total_loss / max(total_num, 1)
+        # the bleu and rouge scores if reference answers is provided
+        bleu_rouge = writer.metrics()
         return ave_loss, bleu_rouge
 
     def evaluate_one(self, eval_batches, result_dir=None, result_prefix=None, save_full_info=False):
@@ -383,9 +374,8 @@ class RCModel(object):
             total_num += len(batch['raw_data'])
 
             padded_p_len = len(batch['passage_token_ids'][0])
-            for sample, start_prob, end_prob in zip(batch['raw_data'], start_probs, end_probs):
-
-                best_answer = self.find_best_answer(sample, start_prob, end_prob, padded_p_len)
+            best_answers = self.find_best_answers(batch['raw_data'], start_probs, end_probs, padded_p_len)
+            for sample, best_answer in zip(batch['raw_data'], best_answers):
                 if save_full_info:
                     sample['pred_answers'] = [best_answer]
                     pred_answers.append(sample)
@@ -408,51 +398,42 @@ class RCModel(object):
         else:
             return '预测失败'
 
+    def predict_probs(self, batch):
+        """
+        Runs the forward pass on one batch without computing the loss
+        Args:
+            batch: one batch generated by BRCDataset._one_mini_batch
+        Returns:
+            the start_probs and end_probs of the batch
+        """
+        feed_dict = {self.p: batch['passage_token_ids'],
+                     self.q: batch['question_token_ids'],
+                     self.p_length: batch['passage_length'],
+                     self.q_length: batch['question_length'],
+                     self.start_label: batch['start_id'],
+                     self.end_label: batch['end_id'],
+                     self.dropout_keep_prob: 1.0}
+        return self.sess.run([self.start_probs, self.end_probs], feed_dict)
+
+    def find_best_answers(self, samples, start_probs, end_probs, padded_p_len):
+        """
+        Finds the best answer of every sample in a batch with one vectorized span decoding
+        """
+        return find_best_answers(samples, start_probs, end_probs, padded_p_len,
+                                 self.max_p_num, self.max_p_len, self.max_a_len)
+
     def find_best_answer(self, sample, start_prob, end_prob, padded_p_len):
         """
         Finds the best answer for a sample given start_prob and end_prob for each position.
-        This will call find_best_answer_for_passage because there are multiple passages in a sample
-        """
-        best_p_idx, best_span, best_score = None, None, 0
-        for p_idx, passage in enumerate(sample['passages']):
-            if p_idx >= self.max_p_num:
-                continue
-            passage_len = min(self.max_p_len, len(passage['passage_tokens']))
-            answer_span, score = self.find_best_answer_for_passage(
-                start_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
-                end_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
-                passage_len)
-            if score > best_score:
-                best_score = score
-                best_p_idx = p_idx
-                best_span = answer_span
-        if best_p_idx is None or best_span is None:
-            best_answer = ''
-        else:
-            best_answer = ''.join(
-                sample['passages'][best_p_idx]['passage_tokens'][best_span[0]: best_span[1] + 1])
-        return best_answer
+        There are multiple passages in a sample, the passage with the best span is chosen
+        """
+        return self.find_best_answers([sample], [start_prob], [end_prob], padded_p_len)[0]
 
     def find_best_answer_for_passage(self, start_probs, end_probs, passage_len=None):
         """
         Finds the best answer with the maximum start_prob * end_prob from a single passage
         """
-        if passage_len is None:
-            passage_len = len(start_probs)
-        else:
-            passage_len = min(len(start_probs), passage_len)
-        best_start, best_end, max_prob = -1, -1, 0
-        for start_idx in range(passage_len):
-            for ans_len in range(self.max_a_len):
-                end_idx = start_idx + ans_len
-                if end_idx >= passage_len:
-                    continue
-                prob = start_probs[start_idx] * end_probs[end_idx]
-                if prob > max_prob:
-                    best_start = start_idx
-                    best_end = end_idx
-                    max_prob = prob
-        return (best_start, best_end), max_prob
+        return find_best_passage_span(start_probs, end_probs, self.max_a_len, passage_len)
 
     def save(self, model_dir, model_prefix):
         """
@@ -467,3 +448,21 @@ class RCModel(object):
         """
         self.saver.restore(self.sess, os.path.join(model_dir, model_prefix))
         self.logger.info('Model restored from {}, with prefix {}'.format(model_dir, model_prefix))
+
+    def export(self, export_dir, version=None):
+        """
+        Exports the inference graph and the vocab into a new version of export_dir, see model.FrozenModel
+        """
+        inputs = {'passage_token_ids': self.p,
+                  'question_token_ids': self.q,
+                  'passage_length': self.p_length,
+                  'question_length': self.q_length,
+                  # only the shape of the labels is used, it gives the number of samples of the batch
+                  'start_id': self.start_label}
+        outputs = {'start_probs': self.start_probs, 'end_probs': self.end_probs}
+        meta = {'model': 'RCModel', 'algo': self.algo, 'max_p_num': self.max_p_num,
+                'max_p_len': self.max_p_len, 'max_q_len': self.max_q_len, 'max_a_len': self.max_a_len}
+        version_dir = export_frozen_graph(self.sess, inputs, outputs, {self.dropout_keep_prob: 1.0},
+                                          self.vocab, export_dir, meta=meta, version=version)
+        self.logger.info('Model exported to {}'.format(version_dir))
+        return version_dir
@@ -0,0 +1,160 @@
+# -*- coding:utf8 -*-
+"""
+This module exports a trained model into a frozen, inference-only artifact and serves it.
+
+An artifact is one versioned directory export_dir/<version>:
+    frozen_graph.pb: the graph pruned to the inputs and the start/end outputs, the variables folded into
+                     constants, without the optimizer slots, the EMA shadow variables, the loss or the summaries
+    vocab.json, vocab*.npy: the vocab the model was trained with, see the Vocab classes
+    signature.json: the tensor of each input field and output, and the length limits of the model
+
+The loader only parses the graph, it neither builds the training graph nor restores a checkpoint.
+"""
+
+import os
+import json
+import time
+import logging
+import importlib
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+from utils import find_best_answers
+
+GRAPH_FILE = 'frozen_graph.pb'
+VOCAB_PREFIX = 'vocab'
+SIGNATURE_FILE = 'signature.json'
+
+
+def export_frozen_graph(sess, inputs, outputs, constants, vocab, export_dir, meta=None, version=None):
+    """
+    Writes the inference graph of a trained model into a new version of export_dir
+    Args:
+        sess: the session holding the trained variables
+        inputs: the placeholder fed from each field of a batch
+        outputs: the output tensors, start_probs and end_probs
+        constants: the value baked into the graph for the placeholders only used in training, like the dropout
+        vocab: the vocab the model was trained with
+        export_dir: the root dir of the versions
+        meta: other settings of the model saved in the signature, like the length limits
+        version: the version number, the current timestamp if not set
+    Returns:
+        the dir of the new version
+    """
+    if version is None:
+        version = int(time.time())
+    version_dir = os.path.join(export_dir, str(version))
+    if not os.path.exists(version_dir):
+        os.makedirs(version_dir)
+
+    output_nodes = [tensor.op.name for tensor in outputs.values()]
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_nodes)
+    kept_nodes = set(node.name for node in graph_def.node)
+    with tf.Graph().as_default() as graph:
+        input_map = {placeholder.name: tf.constant(value, dtype=placeholder.dtype,
+                                                   name='frozen/' + placeholder.op.name)
+                     for placeholder, value in constants.items() if placeholder.op.name in kept_nodes}
+        tf.import_graph_def(graph_def, input_map=input_map, name='')
+        graph_def = graph.as_graph_def()
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, output_nodes)
+    for node in graph_def.node:
+        node.device = ''
+    input_nodes = [placeholder.op.name for placeholder in inputs.values()]
+    graph_def = TransformGraph(graph_def, input_nodes, output_nodes,
+                               ['fold_constants(ignore_errors=true)', 'sort_by_execution_order'])
+
+    with open(os.path.join(version_dir, GRAPH_FILE), 'wb') as fout:
+        fout.write(graph_def.SerializeToString())
+    vocab.save(os.path.join(version_dir, VOCAB_PREFIX))
+    signature = dict(meta or {})
+    signature.update({'version': version,
+                      'vocab_class': '{}.{}'.format(type(vocab).__module__, type(vocab).__name__),
+                      'inputs': {field: placeholder.name for field, placeholder in inputs.items()},
+                      'outputs': {name: tensor.name for name, tensor in outputs.items()}})
+    with open(os.path.join(version_dir, SIGNATURE_FILE), 'w') as fout:
+        json.dump(signature, fout, indent=2)
+    return version_dir
+
+
+def export_model(model, export_dir, logger=None):
+    """
+    Exports a restored RCModel or QANet Model into a new version of export_dir, the driver of --export
+    Args:
+        model: the trained model, restored from its checkpoint by the run script
+        export_dir: the root dir of the versions
+        logger: the logger of the run script
+    Returns:
+        the dir of the new version
+    """
+    logger = logger or logging.getLogger("brc")
+    logger.info('Exporting the model...')
+    print('Exporting the model...')
+    version_dir = model.export(export_dir)
+    print('Model exported to {}'.format(version_dir))
+    return version_dir
+
+
+def latest_version_dir(export_dir, version=None):
+    """
+    Returns the dir of version in export_dir, or of the latest version if not set
+    """
+    if os.path.exists(os.path.join(export_dir, SIGNATURE_FILE)):
+        return export_dir
+    if version is None:
+        versions = [int(name) for name in os.listdir(export_dir) if name.isdigit()
+                    and os.path.exists(os.path.join(export_dir, name, SIGNATURE_FILE))]
+        if not versions:
+            raise IOError('No exported model in {}'.format(export_dir))
+        version = max(versions)
+    return os.path.join(export_dir, str(version))
+
+
+class FrozenModel(object):
+    """
+    Serves an exported artifact with the same predict_probs and find_best_answers as the models
+    """
+    def __init__(self, export_dir, version=None, sess_config=None):
+        self.logger = logging.getLogger("brc")
+        start_t = time.time()
+        self.version_dir = latest_version_dir(export_dir, version)
+        with open(os.path.join(self.version_dir, SIGNATURE_FILE)) as fin:
+            self.signature = json.load(fin)
+        self.max_p_num = self.signature['max_p_num']
+        self.max_p_len = self.signature['max_p_len']
+        self.max_a_len = self.signature['max_a_len']
+        vocab_module, vocab_class = self.signature['vocab_class'].rsplit('.', 1)
+        self.vocab = getattr(importlib.import_module(vocab_module), vocab_class).load(
+            os.path.join(self.version_dir, VOCAB_PREFIX))
+
+        graph_def = tf.GraphDef()
+        with open(os.path.join(self.version_dir, GRAPH_FILE), 'rb') as fin:
+            graph_def.ParseFromString(fin.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.inputs = {field: self.graph.get_tensor_by_name(name)
+                       for field, name in self.signature['inputs'].items()}
+        self.outputs = [self.graph.get_tensor_by_name(self.signature['outputs'][name])
+                        for name in ['start_probs', 'end_probs']]
+        self.graph.finalize()
+
+        if sess_config is None:
+            sess_config = tf.ConfigProto(allow_soft_placement=True)
+            sess_config.gpu_options.allow_growth = True
+        self.sess = tf.Session(graph=self.graph, config=sess_config)
+        self.logger.info('Frozen model loaded from {} in {} s'.format(self.version_dir, time.time() - start_t))
+
+    def predict_probs(self, batch):
+        """
+        Runs the forward pass on one batch generated by the data loader
+        Returns:
+            the start_probs and end_probs of the batch
+        """
+        feed_dict = {placeholder: batch[field] for field, placeholder in self.inputs.items()}
+        return self.sess.run(self.outputs, feed_dict)
+
+    def find_best_answers(self, samples, start_probs, end_probs, padded_p_len):
+        """
+        Finds the best answer of every sample in a batch with one vectorized span decoding
+        """
+        return find_best_answers(samples, start_probs, end_probs, padded_p_len,
+                                 self.max_p_num, self.max_p_len, self.max_a_len)
@@ -3,14 +3,16 @@
 import os
 import time
 import logging
-import json
 import tensorflow as tf
 from layers.OurLayer import  regularizer, residual_block, highway, conv, mask_logits, trilinear, total_params, position_embedding
 from model.Optimizer import AdamWOptimizer
+from model.FrozenModel import export_frozen_graph
+from model.SessionConfig import session_config_from_args
 from tensorflow.python.ops import array_ops
 
-from utils.dureader_eval import compute_bleu_rouge
-from utils.dureader_eval import normalize
+from utils.prediction_writer import PredictionWriter
+from utils.span_decoder import find_best_answers
+from utils.span_decoder import find_best_passage_span
 
 class Model(object):
     def __init__(self, vocab, config, demo=False):
@@ -41,8 +43,8 @@ class Model(object):
         self.vocab = vocab
 
         # session info
-        sess_config = tf.ConfigProto()
-        sess_config.gpu_options.allow_growth = False
+        # the thread pools, XLA and graph optimizations of the run settings
+        sess_config = session_config_from_args(config, allow_growth=False)
         self.sess = tf.Session(config=sess_config)
 
         self._build_graph()
@@ -73,20 +75,15 @@ class Model(object):
 
     def _setup_placeholders(self):
         """Placeholders"""
-        if self.demo:
-            self.c = tf.placeholder(tf.int32, [None, self.config.max_p_len],"context")
-            self.q = tf.placeholder(tf.int32, [None, self.config.max_q_len],"question")
-            self.ch = tf.placeholder(tf.int32, [None, self.config.max_p_len, self.config.max_ch_len], "context_char")
-            self.qh = tf.placeholder(tf.int32, [None, self.config.max_q_len, self.config.max_ch_len], "question_char")
-            self.start_label = tf.placeholder(tf.int32, [None],"answer_label1")
-            self.end_label = tf.placeholder(tf.int32, [None],"answer_label2")
-        else:
-            self.c = tf.placeholder(tf.int32, [self.config.batch_size*self.max_p_num, self.config.max_p_len], "context")
-            self.q = tf.placeholder(tf.int32, [self.config.batch_size*self.max_p_num, self.config.max_q_len], "question")
-            self.ch = tf.placeholder(tf.int32, [self.config.batch_size*self.max_p_num, self.config.max_p_len, self.config.max_ch_len], "context_char")
-            self.qh = tf.placeholder(tf.int32, [self.config.batch_size*self.max_p_num, self.config.max_q_len, self.config.max_ch_len], "question_char")
-            self.start_label = tf.placeholder(tf.int32, [self.config.batch_size],"answer_label1")
-            self.end_label = tf.placeholder(tf.int32, [self.config.batch_size],"answer_label2")
+        # the batch size, passage number and lengths vary from batch to batch, so that short
+        # (length-bucketed) batches are not padded to max_p_len and max_q_len
+        self.c = tf.placeholder(tf.int32, [None, None], "context")
+        self.q = tf.placeholder(tf.int32, [None, None], "question")
+        self.ch = tf.placeholder(tf.int32, [None, None, self.config.max_ch_len], "context_char")
+        self.qh = tf.placeholder(tf.int32, [None, None, self.config.max_ch_len], "question_char")
+        self.start_label = tf.placeholder(tf.int32, [None],"answer_label1")
+        self.end_label = tf.placeholder(tf.int32, [None],"answer_label2")
+        self.batch_size = tf.shape(self.c)[0]
 
         self.position_emb = position_embedding(self.c, 2*self.config.hidden_size)
         self.c_mask = tf.cast(self.c, tf.bool) 
@@ -157,9 +154,9 @@ class Model(object):
             dc = self.char_mat.get_shape()[-1]
         with tf.variable_scope("Input_Embedding_Layer"):
             ch_emb = tf.reshape(tf.nn.embedding_lookup(
-                self.char_mat, self.ch), [N*PL*self.max_p_num, CL, dc])
+                self.char_mat, self.ch), [-1, CL, dc])
             qh_emb = tf.reshape(tf.nn.embedding_lookup(
-                self.char_mat, self.qh), [N*QL*self.max_p_num, CL, dc])
+                self.char_mat, self.qh), [-1, CL, dc])
             ch_emb = tf.nn.dropout(ch_emb, 1.0 - 0.5 * self.dropout)
             qh_emb = tf.nn.dropout(qh_emb, 1.0 - 0.5 * self.dropout)
 
@@ -171,8 +168,8 @@ class Model(object):
             ch_emb = tf.reduce_max(ch_emb, axis = 1) # character-level feature
             qh_emb = tf.reduce_max(qh_emb, axis = 1)
 
-            ch_emb = tf.reshape(ch_emb, [N* self.max_p_num, PL, -1])
-            qh_emb = tf.reshape(qh_emb, [N* self.max_p_num, QL, -1])
+            ch_emb = tf.reshape(ch_emb, [tf.shape(self.c)[0], PL, d])
+            qh_emb = tf.reshape(qh_emb, [tf.shape(self.q)[0], QL, d])
 
             c_emb = tf.nn.dropout(tf.nn.embedding_lookup(self.word_mat, self.c), 1.0 - self.dropout) # word embedding
             q_emb = tf.nn.dropout(tf.nn.embedding_lookup(self.word_mat, self.q), 1.0 - self.dropout)
@@ -214,9 +211,13 @@ class Model(object):
 
     def _fuse(self):
 
+        N, PL, QL, CL, d, dc, nh = self._params()
         with tf.variable_scope("Context_to_Query_Attention_Layer"):
-            C = tf.tile(tf.expand_dims(self.c_embed_encoding,2),[1,1,self.max_q_len,1])
-            Q = tf.tile(tf.expand_dims(self.q_embed_encoding,1),[1,self.max_p_len,1,1])
+            C = tf.tile(tf.expand_dims(self.c_embed_encoding,2),[1,1,QL,1])
+            Q = tf.tile(tf.expand_dims(self.q_embed_encoding,1),[1,PL,1,1])
+            # the multiples are dynamic, keep the static depth for trilinear
+            C.set_shape([None, None, None, self.c_embed_encoding.get_shape()[-1]])
+            Q.set_shape([None, None, None, self.q_embed_encoding.get_shape()[-1]])
             S = trilinear([C, Q, C*Q], input_keep_prob = 1.0 - self.dropout)
             mask_q = tf.expand_dims(self.q_mask, 1)
             S_ = tf.nn.softmax(mask_logits(S, mask = mask_q))
@@ -389,12 +390,13 @@ class Model(object):
 
 
     def _params(self):
-        return (self.config.batch_size if not self.demo else 1, self.max_p_len,
-                self.max_q_len, self.config.max_ch_len, self.config.hidden_size,
+        # the number of samples and the padded lengths are only known when a batch is fed
+        return (self.batch_size, tf.shape(self.c)[1],
+                tf.shape(self.q)[1], self.config.max_ch_len, self.config.hidden_size,
                 self.config.char_embed_size, self.config.head_size)
 
     def train(self, data, epochs, batch_size, save_dir, save_prefix,
-              dropout=0.0, evaluate=True):
+              dropout=0.0, evaluate=True, summary_every=100):
 
 
         def _train_epoch(train_batches, dropout,merged,train_writer,sess,total_step):
@@ -411,12 +413,16 @@ class Model(object):
                              self.dropout: dropout}
 
                 try:
-                    _, loss, global_step = self.sess.run([self.train_op, self.loss, self.global_step], feed_dict)
+                    # the summaries are fetched with the train op, so they cost no extra forward pass
+                    if summary_every > 0 and total_step % summary_every == 0:
+                        _, loss, global_step, summary = sess.run(
+                            [self.train_op, self.loss, self.global_step, merged], feed_dict)
+                        train_writer.add_summary(summary, total_step)
+                    else:
+                        _, loss, global_step = sess.run([self.train_op, self.loss, self.global_step], feed_dict)
                     total_loss += loss * len(batch['raw_data'])
                     total_num += len(batch['raw_data'])
                     n_batch_loss += loss
-                    summary = sess.run(merged, feed_dict)
-                    train_writer.add_summary(summary, total_step)
                     total_step += 1
 
                 except Exception as e:
@@ -469,112 +475,72 @@ class Model(object):
 
 
     def evaluate(self, eval_batches, result_dir=None, result_prefix=None, save_full_info=False):
-        pred_answers, ref_answers = [], []
-        total_loss, total_num = 0, 0
-        for b_itx, batch in enumerate(eval_batches):
-
-            feed_dict = {self.c: batch['passage_token_ids'],
-                         self.q: batch['question_token_ids'],
-                         self.qh: batch['question_char_ids'],
-                         self.ch: batch["passage_char_ids"],
-                         self.start_label: batch['start_id'],
-                         self.end_label: batch['end_id'],
-                         self.dropout: 0.0}
-
-            try:
-                start_probs, end_probs, loss = self.sess.run([self.logits1,
-                                                          self.logits2, self.loss], feed_dict)
-                total_loss += loss * len(batch['raw_data'])
-                total_num += len(batch['raw_data'])
-
-                padded_p_len = len(batch['passage_token_ids'][0])
-                for sample, start_prob, end_prob in zip(batch['raw_data'], start_probs, end_probs):
-
-                    best_answer = self.find_best_answer(sample, start_prob, end_prob, padded_p_len)
-                    if save_full_info:
-                        sample['pred_answers'] = [best_answer]
-                        pred_answers.append(sample)
-                    else:
-                        pred_answers.append({'question_id': sample['question_id'],
-                                             'question': ''.join(sample['segmented_question']),
-                                             'question_type': sample['question_type'],
-                                             'answers': [best_answer]})
-                    if 'answers' in sample:
-                        ref_answers.append({'question_id': sample['question_id'],
-                                             'question_type': sample['question_type'],
-                                             'answers': sample['answers']})
-
-            except:
-                continue
-
+        result_file = None
         if result_dir is not None and result_prefix is not None:
             result_file = os.path.join(result_dir, result_prefix + '.json')
-            with open(result_file, 'w') as fout:
-                for pred_answer in pred_answers:
-                    fout.write(json.dumps(pred_answer, ensure_ascii=False) + '\n')
+        total_loss, total_num = 0, 0
+        # the predictions are written and scored as each batch finishes
+        with PredictionWriter(result_file) as writer:
+            for b_itx, batch in enumerate(eval_batches):
+
+                feed_dict = {self.c: batch['passage_token_ids'],
+                             self.q: batch['question_token_ids'],
+                             self.qh: batch['question_char_ids'],
+                             self.ch: batch["passage_char_ids"],
+                             self.start_label: batch['start_id'],
+                             self.end_label: batch['end_id'],
+                             self.dropout: 0.0}
+
+                try:
+                    start_probs, end_probs, loss = self.sess.run([self.logits1,
+                                                              self.logits2, self.loss], feed_dict)
+                    total_loss += loss * len(batch['raw_data'])
+                    total_num += len(batch['raw_data'])
+
+                    padded_p_len = len(batch['passage_token_ids'][0])
+                    best_answers = self.find_best_answers(batch['raw_data'], start_probs, end_probs, padded_p_len)
+                    for sample, best_answer in zip(batch['raw_data'], best_answers):
+                        if save_full_info:
+                            sample['pred_answers'] = [best_answer]
+                            pred_answer = sample
+                        else:
+                            pred_answer = {'question_id': sample['question_id'],
+                                           'question': ''.join(sample['segmented_question']),
+                                           'question_type': sample['question_type'],
+                                           'answers': [best_answer]}
+                        writer.add(sample['question_id'], best_answer, sample.get('answers'), pred_answer)
+
+                except:
+                    continue
 
+        if result_file is not None:
             self.logger.info('Saving {} results to {}'.format(result_prefix, result_file))
 
         # this average loss is invalid on test set, since we don't have true start_id and end_id
-        ave_loss = 1.0 * total_loss / total_num
-        # compute the bleu and rouge scores if reference answers is provided
-        if len(ref_answers) > 0:
-            pred_dict, ref_dict = {}, {}
-            for pred, ref in zip(pred_answers, ref_answers):
-                question_id = ref['question_id']
-                if len(ref['answers']) > 0:
-                    pred_dict[question_id] = normalize(pred['answers'])
-                    ref_dict[question_id] = normalize(ref['answers'])
-            bleu_rouge = compute_bleu_rouge(pred_dict, ref_dict)
-        else:
-            bleu_rouge = None
+        ave_loss = 1.0 * total_loss / max(total_num, 1)
+        # the bleu and rouge scores if reference answers is provided
+        bleu_rouge = writer.metrics()
         return ave_loss, bleu_rouge
 
+    def find_best_answers(self, samples, start_probs, end_probs, padded_p_len):
+        """
+        Finds the best answer of every sample in a batch with one vectorized span decoding
+        """
+        return find_best_answers(samples, start_probs, end_probs, padded_p_len,
+                                 self.max_p_num, self.max_p_len, self.max_a_len)
+
     def find_best_answer(self, sample, start_prob, end_prob, padded_p_len):
         """
         Finds the best answer for a sample given start_prob and end_prob for each position.
-        This will call find_best_answer_for_passage because there are multiple passages in a sample
+        There are multiple passages in a sample, the passage with the best span is chosen
         """
-        best_p_idx, best_span, best_score = None, None, 0
-        for p_idx, passage in enumerate(sample['passages']):
-            if p_idx >= self.max_p_num:
-                continue
-            passage_len = min(self.max_p_len, len(passage['passage_tokens']))
-            answer_span, score = self.find_best_answer_for_passage(
-                start_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
-                end_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
-                passage_len)
-            if score > best_score:
-                best_score = score
-                best_p_idx = p_idx
-                best_span = answer_span
-        if best_p_idx is None or best_span is None:
-            best_answer = ''
-        else:
-            best_answer = ''.join(
-                sample['passages'][best_p_idx]['passage_tokens'][best_span[0]: best_span[1] + 1])
-        return best_answer
+        return self.find_best_answers([sample], [start_prob], [end_prob], padded_p_len)[0]
 
     def find_best_answer_for_passage(self, start_probs, end_probs, passage_len=None):
         """
         Finds the best answer with the maximum start_prob * end_prob from a single passage
         """
-        if passage_len is None:
-            passage_len = len(start_probs)
-        else:
-            passage_len = min(len(start_probs), passage_len)
-        best_start, best_end, max_prob = -1, -1, 0
-        for start_idx in range(passage_len):
-            for ans_len in range(self.max_a_len):
-                end_idx = start_idx + ans_len
-                if end_idx >= passage_len:
-                    continue
-                prob = start_probs[start_idx] * end_probs[end_idx]
-                if prob > max_prob:
-                    best_start = start_idx
-                    best_end = end_idx
-                    max_prob = prob
-        return (best_start, best_end), max_prob
+        return find_best_passage_span(start_probs, end_probs, self.max_a_len, passage_len)
 
     def save(self, model_dir, model_prefix):
         """
@@ -591,3 +557,20 @@ class Model(object):
         self.saver.restore(self.sess, tf.train.latest_checkpoint(model_dir))
         self.logger.info('Model restored from {}, with prefix {}'.format(model_dir, model_prefix))
 
+    def export(self, export_dir, version=None):
+        """
+        Exports the inference graph and the vocab into a new version of export_dir, see model.FrozenModel
+        """
+        inputs = {'passage_token_ids': self.c,
+                  'question_token_ids': self.q,
+                  'passage_char_ids': self.ch,
+                  'question_char_ids': self.qh}
+        # the masked logits are decoded like the probs, as in evaluate
+        outputs = {'start_probs': self.logits1, 'end_probs': self.logits2}
+        meta = {'model': 'QANet', 'max_p_num': self.max_p_num, 'max_p_len': self.max_p_len,
+                'max_q_len': self.max_q_len, 'max_a_len': self.max_a_len, 'max_ch_len': self.config.max_ch_len}
+        version_dir = export_frozen_graph(self.sess, inputs, outputs, {self.dropout: 0.0},
+                                          self.vocab, export_dir, meta=meta, version=version)
+        self.logger.info('Model exported to {}'.format(version_dir))
+        return version_dir
+
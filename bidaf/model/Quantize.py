@@ -0,0 +1,344 @@
+# -*- coding:utf8 -*-
+"""
+This module quantizes an exported inference artifact (see model.FrozenModel) for CPU serving.
+
+Two modes are supported:
+    int8: the embeddings are stored as uint8 rows with a per-row min and scale, and dequantized after the
+          lookup, so only the looked up rows are converted. The other weights are quantized to 8 bits and the
+          matmuls and convolutions run with the quantized kernels. Their activation ranges are computed
+          dynamically on each run, or frozen from a few calibration batches if given.
+    fp16: the embeddings and the large weights are stored in half precision and cast back to float32
+          after the lookup / on use, the computation stays in float32.
+
+The quantized artifact is written as a new version with the same vocab and signature, so FrozenModel serves it as is.
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import logging
+import tempfile
+import itertools
+import numpy as np
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+from model.FrozenModel import FrozenModel, GRAPH_FILE, VOCAB_PREFIX, SIGNATURE_FILE, latest_version_dir
+from utils import PredictionWriter
+
+QUANTIZE_MODES = ['int8', 'fp16']
+GATHER_OPS = ['Gather', 'GatherV2']
+
+
+def _node_name(input_name):
+    return input_name.lstrip('^').split(':')[0]
+
+
+def _new_node(op, name, inputs, **attrs):
+    node = tf.NodeDef()
+    node.op = op
+    node.name = name
+    node.input.extend(inputs)
+    for key, value in attrs.items():
+        node.attr[key].CopyFrom(value)
+    return node
+
+
+def _const_node(name, value):
+    return _new_node('Const', name, [],
+                     dtype=tf.AttrValue(type=tf.as_dtype(value.dtype).as_datatype_enum),
+                     value=tf.AttrValue(tensor=tf.make_tensor_proto(value)))
+
+
+def _cast_node(name, input_name, src_dtype, dst_dtype):
+    return _new_node('Cast', name, [input_name],
+                     SrcT=tf.AttrValue(type=src_dtype.as_datatype_enum),
+                     DstT=tf.AttrValue(type=dst_dtype.as_datatype_enum))
+
+
+def _binary_node(op, name, x, y):
+    return _new_node(op, name, [x, y], T=tf.AttrValue(type=tf.float32.as_datatype_enum))
+
+
+def _copy_gather(gather, name, params, dtype):
+    node = tf.NodeDef()
+    node.CopyFrom(gather)
+    node.name = name
+    node.input[0] = params
+    node.attr['Tparams'].type = dtype.as_datatype_enum
+    return node
+
+
+def _float_consts(graph_def, min_size):
+    consts = {}
+    for node in graph_def.node:
+        if node.op == 'Const' and node.attr['dtype'].type == tf.float32.as_datatype_enum:
+            shape = [dim.size for dim in node.attr['value'].tensor.tensor_shape.dim]
+            if int(np.prod(shape)) >= min_size:
+                consts[node.name] = node
+    return consts
+
+
+def quantize_embeddings(graph_def, mode, min_size=1024):
+    """
+    Stores the tables of the embedding lookups in int8 (per row) or fp16, the lookup gathers the compact rows
+    and only the gathered rows are converted back to float32
+    Args:
+        graph_def: a frozen graph
+        mode: int8 or fp16
+        min_size: the smaller tables are kept in float32
+    Returns:
+        the rewritten graph_def
+    """
+    nodes = {node.name: node for node in graph_def.node}
+    consumers = {}
+    for node in graph_def.node:
+        for input_name in node.input:
+            consumers.setdefault(_node_name(input_name), []).append(node)
+
+    def resolve(name):
+        # the variables are read through an Identity, which stays after the freezing
+        while nodes[name].op == 'Identity':
+            name = _node_name(nodes[name].input[0])
+        return name
+
+    def only_gathered(name):
+        for consumer in consumers.get(name, []):
+            if consumer.op == 'Identity':
+                if not only_gathered(consumer.name):
+                    return False
+            elif consumer.op not in GATHER_OPS or _node_name(consumer.input[0]) != name:
+                return False
+        return True
+
+    tables = _float_consts(graph_def, min_size)
+    gathers = {}
+    for node in graph_def.node:
+        if node.op in GATHER_OPS:
+            table = resolve(_node_name(node.input[0]))
+            if table in tables and only_gathered(table):
+                gathers.setdefault(table, []).append(node)
+
+    replaced, new_nodes = set(), []
+    for table, table_gathers in gathers.items():
+        value = tf.make_ndarray(tables[table].attr['value'].tensor)
+        if mode == 'int8':
+            row_min = value.min(axis=1, keepdims=True)
+            row_scale = (value.max(axis=1, keepdims=True) - row_min) / 255.0
+            row_scale[row_scale == 0] = 1.0
+            quantized = np.round((value - row_min) / row_scale).astype(np.uint8)
+            new_nodes += [_const_node(table + '/int8', quantized),
+                          _const_node(table + '/row_min', row_min.astype(np.float32)),
+                          _const_node(table + '/row_scale', row_scale.astype(np.float32))]
+            for gather in table_gathers:
+                name = gather.name
+                new_nodes += [_copy_gather(gather, name + '/int8', table + '/int8', tf.uint8),
+                              _copy_gather(gather, name + '/row_min', table + '/row_min', tf.float32),
+                              _copy_gather(gather, name + '/row_scale', table + '/row_scale', tf.float32),
+                              _cast_node(name + '/dequantize', name + '/int8', tf.uint8, tf.float32),
+                              _binary_node('Mul', name + '/scaled', name + '/dequantize', name + '/row_scale'),
+                              _binary_node('Add', name, name + '/scaled', name + '/row_min')]
+                replaced.add(name)
+        else:
+            new_nodes.append(_const_node(table + '/fp16', value.astype(np.float16)))
+            for gather in table_gathers:
+                new_nodes += [_copy_gather(gather, gather.name + '/fp16', table + '/fp16', tf.float16),
+                              _cast_node(gather.name, gather.name + '/fp16', tf.float16, tf.float32)]
+                replaced.add(gather.name)
+
+    output = tf.GraphDef()
+    output.versions.CopyFrom(graph_def.versions)
+    output.node.extend([node for node in graph_def.node if node.name not in replaced] + new_nodes)
+    return output
+
+
+def half_constants(graph_def, min_size=1024):
+    """
+    Stores the float32 constants of at least min_size elements in fp16, cast back to float32 on use
+    """
+    consts = _float_consts(graph_def, min_size)
+    output = tf.GraphDef()
+    output.versions.CopyFrom(graph_def.versions)
+    for node in graph_def.node:
+        if node.name not in consts:
+            output.node.extend([node])
+            continue
+        value = tf.make_ndarray(node.attr['value'].tensor).astype(np.float16)
+        half = _const_node(node.name + '/fp16', value)
+        # the control inputs keep the constant in its while loop frame
+        half.input.extend(node.input)
+        output.node.extend([half, _cast_node(node.name, half.name, tf.float16, tf.float32)])
+    return output
+
+
+def _run_batches(graph_def, signature, batches):
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    inputs = {field: graph.get_tensor_by_name(name) for field, name in signature['inputs'].items()}
+    outputs = [graph.get_tensor_by_name(name) for name in signature['outputs'].values()]
+    with tf.Session(graph=graph) as sess:
+        for batch in batches:
+            sess.run(outputs, {placeholder: batch[field] for field, placeholder in inputs.items()})
+
+
+def freeze_ranges(graph_def, signature, input_nodes, output_nodes, calibration_batches):
+    """
+    Runs the calibration batches through the quantized graph and freezes the ranges of its requantizations
+    to the observed ones, instead of computing them on each run
+    """
+    logged = TransformGraph(graph_def, input_nodes, output_nodes,
+                            ['insert_logging(op=RequantizationRange, show_name=true, message="__requant_min_max:")'])
+    log_file = tempfile.NamedTemporaryFile(suffix='.log', delete=False)
+    # the logging ops print to the stderr of the process
+    sys.stderr.flush()
+    saved_stderr = os.dup(2)
+    os.dup2(log_file.fileno(), 2)
+    try:
+        _run_batches(logged, signature, calibration_batches)
+    finally:
+        os.dup2(saved_stderr, 2)
+        os.close(saved_stderr)
+        log_file.close()
+    try:
+        return TransformGraph(graph_def, input_nodes, output_nodes,
+                              ['freeze_requantization_ranges(min_max_log_file="{}")'.format(log_file.name)])
+    finally:
+        os.remove(log_file.name)
+
+
+def quantize_artifact(export_dir, mode, quantized_dir, calibration_batches=None, version=None, min_size=1024):
+    """
+    Quantizes the latest artifact of export_dir into a new version of quantized_dir
+    Args:
+        export_dir: the dir of the float32 artifacts
+        mode: int8 or fp16
+        quantized_dir: the root dir of the quantized versions
+        calibration_batches: batches of the dev set used to freeze the int8 ranges, dynamic ranges if not set
+        version: the version number, the current timestamp if not set
+        min_size: the constants with fewer elements are kept in float32
+    Returns:
+        the dir of the quantized version
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError('Unsupported quantization: {}'.format(mode))
+    source_dir = latest_version_dir(export_dir)
+    with open(os.path.join(source_dir, SIGNATURE_FILE)) as fin:
+        signature = json.load(fin)
+    graph_def = tf.GraphDef()
+    with open(os.path.join(source_dir, GRAPH_FILE), 'rb') as fin:
+        graph_def.ParseFromString(fin.read())
+    input_nodes = [_node_name(name) for name in signature['inputs'].values()]
+    output_nodes = [_node_name(name) for name in signature['outputs'].values()]
+
+    graph_def = quantize_embeddings(graph_def, mode, min_size)
+    # drops the float32 tables replaced by the compact ones
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, output_nodes)
+    if mode == 'int8':
+        graph_def = TransformGraph(graph_def, input_nodes, output_nodes,
+                                   ['quantize_weights(minimum_size={})'.format(min_size), 'quantize_nodes'])
+        if calibration_batches is not None:
+            graph_def = freeze_ranges(graph_def, signature, input_nodes, output_nodes, calibration_batches)
+    else:
+        graph_def = half_constants(graph_def, min_size)
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, output_nodes)
+    graph_def = TransformGraph(graph_def, input_nodes, output_nodes, ['sort_by_execution_order'])
+
+    if version is None:
+        version = int(time.time())
+    version_dir = os.path.join(quantized_dir, str(version))
+    if not os.path.exists(version_dir):
+        os.makedirs(version_dir)
+    with open(os.path.join(version_dir, GRAPH_FILE), 'wb') as fout:
+        fout.write(graph_def.SerializeToString())
+    for vocab_file in glob.glob(os.path.join(source_dir, VOCAB_PREFIX + '.*')):
+        shutil.copy(vocab_file, version_dir)
+    signature.update({'version': version, 'quantization': mode,
+                      'calibrated': calibration_batches is not None, 'source': source_dir})
+    with open(os.path.join(version_dir, SIGNATURE_FILE), 'w') as fout:
+        json.dump(signature, fout, indent=2)
+    return version_dir
+
+
+def evaluate_artifact(model, eval_batches):
+    """
+    Predicts the answers of eval_batches with a FrozenModel
+    Returns:
+        the bleu and rouge scores, None without reference answers, and the mean seconds of a forward pass
+    """
+    writer = PredictionWriter()
+    run_seconds, batch_num = 0.0, 0
+    for batch in eval_batches:
+        start_t = time.time()
+        start_probs, end_probs = model.predict_probs(batch)
+        run_seconds += time.time() - start_t
+        batch_num += 1
+        padded_p_len = len(batch['passage_token_ids'][0])
+        best_answers = model.find_best_answers(batch['raw_data'], start_probs, end_probs, padded_p_len)
+        for sample, best_answer in zip(batch['raw_data'], best_answers):
+            writer.add(sample['question_id'], best_answer, sample.get('answers'))
+    return writer.metrics(), run_seconds / max(batch_num, 1)
+
+
+def accuracy_report(reference, quantized, gen_batches):
+    """
+    Compares a quantized FrozenModel with the float32 one on the same batches and saves the report
+    along with the quantized artifact
+    Args:
+        reference: the float32 FrozenModel
+        quantized: the quantized FrozenModel
+        gen_batches: returns a new generator of the evaluation batches
+    Returns:
+        the report, with the scores, the forward pass time and the graph size of both
+    """
+    report = {}
+    for name, model in [('float32', reference), (quantized.signature['quantization'], quantized)]:
+        bleu_rouge, seconds = evaluate_artifact(model, gen_batches())
+        report[name] = {'bleu_rouge': bleu_rouge,
+                        'seconds_per_batch': seconds,
+                        'graph_bytes': os.path.getsize(os.path.join(model.version_dir, GRAPH_FILE))}
+    with open(os.path.join(quantized.version_dir, 'quantization_report.json'), 'w') as fout:
+        json.dump(report, fout, indent=2)
+    return report
+
+
+def quantize_export(export_dir, mode, dev_batches, calibration_batches=0, tolerance=0.01,
+                    reference=None, logger=None):
+    """
+    Quantizes the latest artifact of export_dir into <export_dir>_<mode>/, calibrated and checked on the dev set,
+    the driver of --quantize
+    Args:
+        export_dir: the dir of the float32 artifacts
+        mode: int8 or fp16
+        dev_batches: returns a new generator of the dev batches, converted with the vocab of the artifact
+        calibration_batches: the number of dev batches used to freeze the int8 ranges, dynamic ranges if 0
+        tolerance: the drop of Bleu-4 or Rouge-L above which a warning is logged
+        reference: the float32 FrozenModel of export_dir, loaded if not given
+        logger: the logger of the run script
+    Returns:
+        the accuracy report, see accuracy_report
+    """
+    logger = logger or logging.getLogger("brc")
+    if reference is None:
+        reference = FrozenModel(export_dir)
+    quantized_dir = export_dir.rstrip('/') + '_' + mode + '/'
+    calibration = None
+    if mode == 'int8' and calibration_batches > 0:
+        calibration = itertools.islice(dev_batches(), calibration_batches)
+    logger.info('Quantizing the model to {}...'.format(mode))
+    print('Quantizing the model to {}...'.format(mode))
+    version_dir = quantize_artifact(reference.version_dir, mode, quantized_dir, calibration)
+    logger.info('Quantized model saved in {}'.format(version_dir))
+
+    report = accuracy_report(reference, FrozenModel(version_dir), dev_batches)
+    logger.info('Quantization report: {}'.format(report))
+    print('Quantization report: {}'.format(report))
+    if report['float32']['bleu_rouge'] is not None:
+        for metric in ['Bleu-4', 'Rouge-L']:
+            drop = report['float32']['bleu_rouge'][metric] - report[mode]['bleu_rouge'][metric]
+            if drop > tolerance:
+                logger.warning('{} drops by {} after the quantization, more than the tolerance {}'.format(
+                    metric, drop, tolerance))
+    return report
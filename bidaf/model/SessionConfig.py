@@ -0,0 +1,139 @@
+# -*- coding:utf8 -*-
+"""
+This module builds the session config of the models from the run settings, so that the replicas and
+the serving workers sharing one box can split its cores instead of each taking all of them,
+and benchmarks the forward pass under several configs.
+"""
+
+import os
+import json
+import time
+import logging
+import itertools
+import numpy as np
+import tensorflow as tf
+from model.FrozenModel import FrozenModel
+
+OPT_LEVELS = {'L0': tf.OptimizerOptions.L0, 'L1': tf.OptimizerOptions.L1}
+
+
+def session_config(intra_op_threads=0, inter_op_threads=0, xla=False, opt_level='L1',
+                   allow_growth=True, allow_soft_placement=False, per_session_threads=False):
+    """
+    Builds a session config
+    Args:
+        intra_op_threads: number of threads running one op, 0 to let tensorflow choose
+        inter_op_threads: number of ops run in parallel, 0 to let tensorflow choose
+        xla: compiles the graph with the XLA JIT if True
+        opt_level: the graph optimization level, L1 folds the constants and eliminates the common
+                   subexpressions, L0 does neither
+        allow_growth: allocates the GPU memory as needed instead of all at once
+        allow_soft_placement: places the ops without a kernel on the requested device on another one
+        per_session_threads: gives the session its own thread pools instead of the pools of the process,
+                             which are sized by the first session
+    Returns:
+        the tf.ConfigProto
+    """
+    config = tf.ConfigProto(allow_soft_placement=allow_soft_placement)
+    config.gpu_options.allow_growth = allow_growth
+    config.intra_op_parallelism_threads = intra_op_threads
+    config.inter_op_parallelism_threads = inter_op_threads
+    config.use_per_session_threads = per_session_threads
+    optimizer_options = config.graph_options.optimizer_options
+    optimizer_options.opt_level = OPT_LEVELS[opt_level]
+    if xla:
+        optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    return config
+
+
+def session_settings(args):
+    """
+    Returns the session settings of the run args, the missing ones keep the tensorflow defaults
+    Args:
+        args: the parsed args of a run script, or the config of QANet, which is the args of OurRun
+              or the demo config module without these settings
+    """
+    return {'intra_op_threads': getattr(args, 'intra_op_threads', 0) or 0,
+            'inter_op_threads': getattr(args, 'inter_op_threads', 0) or 0,
+            'xla': bool(getattr(args, 'xla', False)),
+            'opt_level': getattr(args, 'opt_level', None) or 'L1'}
+
+
+def session_config_from_args(args, **kwargs):
+    """
+    Builds the session config of the run args or the QANet config, kwargs are passed to session_config
+    """
+    settings = session_settings(args)
+    settings.update(kwargs)
+    return session_config(**settings)
+
+
+def benchmark_session_configs(load_model, batches, configs, repeats=3):
+    """
+    Measures the forward pass of a model under several session configs on the same batches
+    Args:
+        load_model: builds the model from a session config, like a FrozenModel with this sess_config
+        batches: the fixed batches, run once to warm up and then repeats times
+        configs: the session settings of each config, the kwargs of session_config
+        repeats: the number of timed passes over the batches
+    Returns:
+        the report of each config, with the latency of a batch in ms and the throughput in questions/s
+    """
+    question_num = sum(len(batch['raw_data']) for batch in batches)
+    reports = []
+    for settings in configs:
+        model = load_model(session_config(per_session_threads=True, **settings))
+        for batch in batches:
+            model.predict_probs(batch)
+        latencies = []
+        for _ in range(repeats):
+            for batch in batches:
+                start_t = time.time()
+                model.predict_probs(batch)
+                latencies.append(time.time() - start_t)
+        model.sess.close()
+        latencies = np.array(latencies) * 1000
+        reports.append({'config': settings,
+                        'batches': len(batches),
+                        'questions': question_num,
+                        'latency_ms': {'mean': float(np.mean(latencies)),
+                                       'p50': float(np.percentile(latencies, 50)),
+                                       'p90': float(np.percentile(latencies, 90)),
+                                       'p99': float(np.percentile(latencies, 99))},
+                        'questions_per_second': question_num * repeats / (np.sum(latencies) / 1000)})
+    return reports
+
+
+def benchmark_export(args, dev_batches, logger=None):
+    """
+    Benchmarks the latest artifact of args.export_dir on a fixed dev sample under the session configs of the
+    run args, and saves the reports into result_dir/session_benchmark.json, the driver of --benchmark_session
+    Args:
+        args: the parsed args of a run script
+        dev_batches: returns a new generator of the dev batches, converted with the vocab of the artifact
+        logger: the logger of the run script
+    Returns:
+        the report of each config, see benchmark_session_configs
+    """
+    logger = logger or logging.getLogger("brc")
+    # the same fixed sample for all the configs
+    batch_num = (args.benchmark_questions + args.batch_size - 1) // args.batch_size
+    batches = list(itertools.islice(dev_batches(), batch_num))
+    configs = [{'intra_op_threads': intra_op_threads, 'inter_op_threads': inter_op_threads,
+                'xla': xla, 'opt_level': args.opt_level}
+               for intra_op_threads in args.benchmark_intra_op_threads or [args.intra_op_threads]
+               for inter_op_threads in args.benchmark_inter_op_threads or [args.inter_op_threads]
+               for xla in ([False, True] if args.benchmark_xla else [args.xla])]
+    logger.info('Benchmarking {} session configs...'.format(len(configs)))
+    print('Benchmarking {} session configs...'.format(len(configs)))
+    reports = benchmark_session_configs(lambda config: FrozenModel(args.export_dir, sess_config=config),
+                                        batches, configs, args.benchmark_repeats)
+    for report in reports:
+        logger.info('Session benchmark: {}'.format(report))
+        print('{config}: {latency_ms[p50]:.1f} ms per batch (p50), {questions_per_second:.1f} questions/s'.format(
+            **report))
+    report_path = os.path.join(args.result_dir, 'session_benchmark.json')
+    with open(report_path, 'w') as fout:
+        json.dump(reports, fout, indent=2)
+    logger.info('Session benchmark saved to {}'.format(report_path))
+    return reports
@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-
+"""
+This module keeps the reading comprehension model resident in the serving process,
+so that a question request only pays for tokenization and one sess.run.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataloader.BaiduDataLoader import BRCDataset
+
+'''Which dataset do you want to use, just choose between search and zhidao'''
+dataName = 'search'
+
+
+@contextmanager
+def _stage(timings, name):
+    """
+    Adds the seconds of the block to timings[name], if timings is not None
+    """
+    if timings is None:
+        yield
+        return
+    start_t = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.time() - start_t
+
+
+class Predictor(object):
+    """
+    Holds the vocab, the graph and the session of one restored RCModel, or of the
+    frozen artifact in args.export_dir if set.
+    model_id identifies the served artifact by its dir and version.
+    Build it once per worker process and share it between requests.
+    """
+    def __init__(self, args):
+        self.logger = logging.getLogger("brc")
+        self.args = args
+
+        if getattr(args, 'export_dir', None):
+            # the artifact carries its vocab and needs none of the training code
+            from model.FrozenModel import FrozenModel
+            from model.SessionConfig import session_config_from_args
+            self.logger.info('Loading the exported model...')
+            self.rc_model = FrozenModel(args.export_dir, sess_config=session_config_from_args(
+                args, allow_soft_placement=True))
+            signature = self.rc_model.signature
+            # the batches are built by BRCDataset with the word ids only, QANet also needs the char ids
+            if signature.get('model') != 'RCModel':
+                self.rc_model.sess.close()
+                raise ValueError('{} holds a {} artifact, only RCModel artifacts can be served'.format(
+                    self.rc_model.version_dir, signature.get('model')))
+            self.vocab = self.rc_model.vocab
+            self.model_id = '{}:{}'.format(self.rc_model.version_dir, signature['version'])
+        else:
+            from model.BaiduModel import RCModel
+            from VocabBuild.BaiduVocab import Vocab
+            self.logger.info('Load vocab...')
+            self.vocab = Vocab.load(os.path.join(args.vocab_dir, dataName + 'BaiduVocab'))
+            self.logger.info('Restoring the model...')
+            self.rc_model = RCModel(self.vocab, args)
+            self.rc_model.restore(model_dir=args.model_dir, model_prefix=args.algo)
+            self.model_id = args.algo
+        self.pad_id = self.vocab.get_id(self.vocab.pad_token)
+
+        # only used for its batching helpers, no file is loaded
+        self.brc_data = BRCDataset(args.max_p_num, args.max_p_len, args.max_q_len)
+
+        self._lock = threading.Lock()
+
+    def _prepare(self, samples, timings=None):
+        """
+        Selects the paragraphs and converts the tokens of the samples into ids
+        Args:
+            samples: a list of samples processed by predict_one.data_precess
+            timings: a dict to add the seconds of the select and convert stages to, or None
+        Returns:
+            the samples ready for batching
+        """
+        data = []
+        with _stage(timings, 'select'):
+            for sample in samples:
+                data += BRCDataset._load_one_dataset(sample)
+        with _stage(timings, 'convert'):
+            for sample in data:
+                BRCDataset._convert_sample_to_ids(sample, self.vocab)
+        return data
+
+    def predict(self, samples, timings=None):
+        """
+        Predicts the answers of samples, this method is safe to call from several threads
+        Args:
+            samples: a list of samples processed by predict_one.data_precess
+            timings: a dict to add the seconds of each stage to, or None:
+                select, convert, pad, lock_wait, sess_run and decode
+        Returns:
+            a list of answer strings in the same order as samples
+        """
+        if not samples:
+            return []
+        data = self._prepare(samples, timings)
+        with _stage(timings, 'pad'):
+            batch = self.brc_data._one_mini_batch(data, range(len(data)), self.pad_id)
+        with _stage(timings, 'lock_wait'):
+            self._lock.acquire()
+        try:
+            with _stage(timings, 'sess_run'):
+                start_probs, end_probs = self.rc_model.predict_probs(batch)
+        finally:
+            self._lock.release()
+        with _stage(timings, 'decode'):
+            padded_p_len = len(batch['passage_token_ids'][0])
+            return self.rc_model.find_best_answers(data, start_probs, end_probs, padded_p_len)
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def get_predictor(args):
+    """
+    Returns the predictor of the current process, building it on first use
+    """
+    global _predictor
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                _predictor = Predictor(args)
+    return _predictor
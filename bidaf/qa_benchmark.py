@@ -0,0 +1,261 @@
+# -*- coding:utf-8 -*-
+"""
+This module benchmarks the question answering path of SearchView outside of django:
+the es query, the answer cache, the jieba segmentation of data_precess, and the stages timed by
+Predictor.predict: the paragraph selection, convert_to_ids, the padding, the wait for the session lock,
+sess.run and the span decoding.
+
+The questions come from a JSONL file with one request per line, a question and its documents
+with their title and paragraphs, like the DuReader files (their segmented fields are ignored).
+The es query is answered by a local stub from the same file, so only the model settings of
+predict_one are needed, preferably with a small checkpoint:
+
+    python qa_benchmark.py --requests_file data/demo/search.dev.json --model_dir ... \
+        --concurrency 1 4 16 --output benchmark.json
+
+The answer cache is the AnswerCache of SearchView without redis. It is disabled by default so that
+every request reaches the model, --answer_cache_size sets its size to measure the repeated questions.
+
+The report is one JSON object, with the per-stage latencies of the requests answered one by one,
+the throughput and latency of the whole path under each concurrency level, and the peak RSS.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from predict_one import args as model_args, data_precess, predict_one
+from predictor import get_predictor
+
+# the answer cache of SearchView lives in the search app at the root of the project
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search.cache import AnswerCache
+
+STAGES = ['es', 'answer', 'segment', 'select', 'convert', 'pad', 'lock_wait', 'sess_run', 'decode']
+
+
+def parse_args():
+    """
+    Parses the benchmark arguments, the model arguments are those of predict_one
+    """
+    parser = argparse.ArgumentParser('Benchmark of the question answering path')
+    parser.add_argument('--requests_file', required=True,
+                        help='JSONL file with a question and its documents on each line')
+    parser.add_argument('--max_requests', type=int, default=200,
+                        help='number of requests read from the file')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='number of passes over the requests for each measure')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='numbers of concurrent clients of the throughput measures')
+    parser.add_argument('--es_latency_ms', type=float, default=0,
+                        help='latency added to each query of the stub es')
+    parser.add_argument('--answer_cache_size', type=int, default=0,
+                        help='size of the answer cache, 0 answers every request with the model')
+    parser.add_argument('--answer_cache_ttl', type=float, default=600,
+                        help='seconds the answers are cached')
+    parser.add_argument('--output', default=None,
+                        help='path of the JSON report, printed if not set')
+    return parser.parse_known_args()[0]
+
+
+def load_requests(requests_file, max_requests):
+    """
+    Reads the question and the documents of each request, without their segmented fields
+    """
+    requests = []
+    with open(requests_file, encoding='utf-8') as fin:
+        for line in fin:
+            if len(requests) >= max_requests:
+                break
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            requests.append({'question': sample['question'],
+                             'documents': [{'title': doc['title'], 'paragraphs': doc['paragraphs']}
+                                           for doc in sample['documents']]})
+    return requests
+
+
+class StubElasticsearch(object):
+    """
+    Answers the question queries of SearchView with the documents of the requests,
+    decoded from JSON on each query like the response of a real es
+    """
+    def __init__(self, requests, latency_ms=0):
+        self.latency = latency_ms / 1000.0
+        self._responses = {}
+        for request in requests:
+            hit = {'_score': 1.0, '_source': {'title': request['documents'][0]['title'],
+                                              'content': request['documents']}}
+            self._responses[request['question']] = json.dumps(
+                {'hits': {'total': 1, 'hits': [hit]}}, ensure_ascii=False)
+
+    def search(self, index=None, body=None, request_timeout=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        question = body['query']['multi_match']['query']
+        return json.loads(self._responses.get(question, '{"hits": {"total": 0, "hits": []}}'))
+
+
+def question_body(question):
+    """
+    The query body of SearchView for a question
+    """
+    return {'query': {'multi_match': {'query': question, 'fields': ['tags', 'title', 'content']}},
+            'from': 0, 'size': 1}
+
+
+def input_data(question, response):
+    """
+    The sample answer_question builds from the first hit
+    """
+    return {'documents': response['hits']['hits'][0]['_source']['content'],
+            'question': question,
+            'question_type': 'ENTITY',
+            'fact_or_opinion': 'FACT'}
+
+
+def new_answer_cache(args, predictor):
+    """
+    The answer cache of SearchView, without redis
+    """
+    return AnswerCache(max_size=args.answer_cache_size, ttl=args.answer_cache_ttl,
+                       model_id=predictor.model_id)
+
+
+def answer_stages(predictor, answer_cache, es, question):
+    """
+    Answers one question like SearchView, through the answer cache and Predictor.predict
+    without the micro batcher
+    Returns:
+        the answer and the seconds of each stage, only the es and answer stages on a cache hit
+    """
+    timings = {}
+    start_t = time.time()
+    response = es.search(index='electric_power', body=question_body(question))
+    timings['es'] = time.time() - start_t
+
+    def compute():
+        start_t = time.time()
+        sample = data_precess(input_data(question, response))
+        timings['segment'] = time.time() - start_t
+        return predictor.predict([sample], timings)
+
+    start_t = time.time()
+    answer = answer_cache.get_or_compute(question, response['hits']['hits'][0]['_source']['content'], compute)
+    timings['answer'] = time.time() - start_t
+    return answer[0], timings
+
+
+def answer_question(answer_cache, es, question):
+    """
+    Answers one question like SearchView, through the answer cache and the micro batcher of predict_one
+    """
+    response = es.search(index='electric_power', body=question_body(question))
+
+    def compute():
+        return predict_one(model_args, data_precess(input_data(question, response)))
+
+    return answer_cache.get_or_compute(question, response['hits']['hits'][0]['_source']['content'], compute)[0]
+
+
+def latency_summary(seconds):
+    """
+    Returns the mean and the percentiles of latencies in ms
+    """
+    latencies = np.array(seconds) * 1000
+    return {'mean': float(np.mean(latencies)),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99))}
+
+
+def measure_stages(predictor, answer_cache, es, questions, repeats):
+    """
+    Answers the questions one by one and summarizes the latency of each stage,
+    the model stages only cover the cache misses
+    """
+    stage_seconds = {stage: [] for stage in STAGES + ['total']}
+    for _ in range(repeats):
+        for question in questions:
+            _, timings = answer_stages(predictor, answer_cache, es, question)
+            for stage, seconds in timings.items():
+                stage_seconds[stage].append(seconds)
+            stage_seconds['total'].append(timings['es'] + timings['answer'])
+    return {stage: latency_summary(seconds) for stage, seconds in stage_seconds.items() if seconds}
+
+
+def measure_concurrency(answer_cache, es, questions, repeats, concurrency):
+    """
+    Answers the questions with concurrent clients
+    Returns:
+        the throughput in requests/s and the latency summary of the whole path
+    """
+    def timed(question):
+        start_t = time.time()
+        answer_question(answer_cache, es, question)
+        return time.time() - start_t
+
+    start_t = time.time()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = list(executor.map(timed, questions * repeats))
+    wall_seconds = time.time() - start_t
+    return {'concurrency': concurrency,
+            'requests': len(latencies),
+            'requests_per_second': len(latencies) / wall_seconds,
+            'latency_ms': latency_summary(latencies),
+            'answer_cache': answer_cache.stats()}
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process in MB
+    """
+    # ru_maxrss is in KB on linux and in bytes on mac os
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run():
+    args = parse_args()
+    requests = load_requests(args.requests_file, args.max_requests)
+    assert requests, 'No request in {}'.format(args.requests_file)
+    questions = [request['question'] for request in requests]
+    es = StubElasticsearch(requests, args.es_latency_ms)
+
+    start_t = time.time()
+    predictor = get_predictor(model_args)
+    load_seconds = time.time() - start_t
+    # the first run builds the kernels and loads the jieba dictionary, its answer is not cached
+    answer_stages(predictor, AnswerCache(max_size=0, model_id=predictor.model_id), es, questions[0])
+    answer_cache = new_answer_cache(args, predictor)
+
+    report = {'requests_file': args.requests_file,
+              'requests': len(questions),
+              'repeats': args.repeats,
+              'model': model_args.export_dir or model_args.model_dir,
+              'batch_size': model_args.batch_size,
+              'max_wait_ms': model_args.max_wait_ms,
+              'es_latency_ms': args.es_latency_ms,
+              'answer_cache_size': args.answer_cache_size,
+              'model_load_seconds': load_seconds,
+              'stages_ms': measure_stages(predictor, answer_cache, es, questions, args.repeats),
+              'stages_answer_cache': answer_cache.stats()}
+    report['concurrency'] = [measure_concurrency(new_answer_cache(args, predictor), es, questions,
+                                                 args.repeats, concurrency)
+                             for concurrency in args.concurrency]
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            fout.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,88 @@
+# -*- coding:utf8 -*-
+"""
+Checks the BLEU of Bleu, with its cached references and its multi-process cooking,
+against the BleuScorer accumulation it replaced.
+Run from the bidaf dir: python -m pytest tests
+"""
+
+import random
+import unittest
+from unittest import mock
+from utils.bleu_metric import bleu
+from utils.bleu_metric.bleu import Bleu
+from utils.bleu_metric.bleu_score import BleuScorer, RefCache
+
+
+def scorer_bleu(gts, res):
+    """
+    The scores of Bleu.compute_score before the cached references, one BleuScorer += per question
+    """
+    bleu_scorer = BleuScorer(n=4)
+    for id in gts:
+        bleu_scorer += (res[id][0], gts[id])
+    return bleu_scorer.compute_score(option='closest', verbose=0)
+
+
+def random_sentence(rng, vocab_size, max_len):
+    return ' '.join('w{}'.format(rng.randint(0, vocab_size)) for _ in range(rng.randint(1, max_len)))
+
+
+def random_questions(rng, num):
+    res = {qid: [random_sentence(rng, 10, 20)] for qid in range(num)}
+    gts = {qid: [random_sentence(rng, 10, 20) for _ in range(rng.randint(1, 3))] for qid in range(num)}
+    return gts, res
+
+
+class BleuTest(unittest.TestCase):
+
+    def assertScoresEqual(self, scores, expected):
+        self.assertEqual(scores[0], expected[0])
+        self.assertEqual(scores[1], expected[1])
+
+    def test_serial_matches_scorer(self):
+        gts, res = random_questions(random.Random(10), 300)
+        ref_cache = RefCache()
+        expected = scorer_bleu(gts, res)
+        # cooks the references, then reuses them
+        self.assertScoresEqual(Bleu(ref_cache=ref_cache).compute_score(gts, res), expected)
+        self.assertEqual(len(ref_cache), 300)
+        self.assertScoresEqual(Bleu(ref_cache=ref_cache).compute_score(gts, res), expected)
+        self.assertScoresEqual(Bleu(ref_cache=None).compute_score(gts, res), expected)
+
+    def test_processes_match_scorer(self):
+        gts, res = random_questions(random.Random(11), 200)
+        ref_cache = RefCache()
+        expected = scorer_bleu(gts, res)
+        with mock.patch.object(bleu, 'MIN_PARALLEL_QUESTIONS', 10):
+            # the workers cook the references and the parent caches them
+            self.assertScoresEqual(Bleu(processes=2, ref_cache=ref_cache).compute_score(gts, res), expected)
+            self.assertEqual(len(ref_cache), 200)
+            self.assertScoresEqual(Bleu(processes=2, ref_cache=ref_cache).compute_score(gts, res), expected)
+            self.assertScoresEqual(Bleu(processes=2, ref_cache=None).compute_score(gts, res), expected)
+        self.assertScoresEqual(Bleu(ref_cache=ref_cache).compute_score(gts, res), expected)
+
+    def test_other_references_of_same_ids(self):
+        gts, res = random_questions(random.Random(12), 100)
+        # like the yesno task, which scores the same question ids against a part of their references
+        filtered_gts = {qid: refs[-1:] for qid, refs in gts.items()}
+        ref_cache = RefCache()
+        for _ in range(2):
+            for question_gts in [gts, filtered_gts]:
+                self.assertScoresEqual(Bleu(ref_cache=ref_cache).compute_score(question_gts, res),
+                                       scorer_bleu(question_gts, res))
+        self.assertEqual(len(ref_cache), 100 + sum(len(refs) > 1 for refs in gts.values()))
+
+    def test_cache_keeps_last_questions(self):
+        ref_cache = RefCache(max_size=3)
+        for qid in range(5):
+            ref_cache.cook(qid, ['w{}'.format(qid)])
+        ref_cache.cook(2, ['w2'])
+        ref_cache.cook(5, ['w5'])
+        self.assertEqual(len(ref_cache), 3)
+        self.assertIsNone(ref_cache.get(3, ['w3']))
+        for qid in [2, 4, 5]:
+            self.assertIsNotNone(ref_cache.get(qid, ['w{}'.format(qid)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
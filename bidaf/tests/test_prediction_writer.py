@@ -0,0 +1,51 @@
+# -*- coding:utf8 -*-
+"""
+Checks the streamed scores of PredictionWriter against compute_bleu_rouge on the collected predictions.
+Run from the bidaf dir: python -m pytest tests
+"""
+
+import os
+import json
+import random
+import tempfile
+import unittest
+from utils import PredictionWriter, compute_bleu_rouge, normalize
+
+
+def random_answer(rng):
+    return ' '.join('w{}'.format(rng.randint(0, 15)) for _ in range(rng.randint(1, 12)))
+
+
+class PredictionWriterTest(unittest.TestCase):
+
+    def test_metrics_match_compute_bleu_rouge(self):
+        rng = random.Random(9)
+        result_file = os.path.join(tempfile.mkdtemp(), 'dev.predicted.json')
+        pred_dict, ref_dict, pred_answers = {}, {}, []
+        with PredictionWriter(result_file) as writer:
+            for question_id in range(300):
+                best_answer = random_answer(rng) if rng.random() < 0.9 else ''
+                ref_answers = [random_answer(rng) for _ in range(rng.randint(0, 3))]
+                pred_answer = {'question_id': question_id, 'answers': [best_answer]}
+                writer.add(question_id, best_answer, ref_answers, pred_answer)
+                pred_answers.append(pred_answer)
+                if ref_answers:
+                    pred_dict[question_id] = normalize([best_answer])
+                    ref_dict[question_id] = normalize(ref_answers)
+            metrics = writer.metrics()
+            self.assertEqual(writer.pred_num, 300)
+        expected = compute_bleu_rouge(pred_dict, ref_dict)
+        self.assertEqual(sorted(metrics), sorted(expected))
+        for name, score in expected.items():
+            self.assertAlmostEqual(metrics[name], score, places=12)
+        with open(result_file) as fin:
+            self.assertEqual([json.loads(line) for line in fin], pred_answers)
+
+    def test_no_reference_answers(self):
+        with PredictionWriter() as writer:
+            writer.add(0, 'w1 w2')
+            self.assertIsNone(writer.metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding:utf8 -*-
+"""
+Checks the incremental span F1 of the fake answer search against the span by span scan it replaced.
+Run from the bidaf dir: python -m pytest tests
+"""
+
+import copy
+import random
+import unittest
+from collections import Counter
+from utils.preprocess import find_best_answer_span
+from utils.preprocess import find_fake_answer
+
+
+def counter_f1(prediction_tokens, ground_truth_tokens):
+    """
+    The f1 score of precision_recall_f1 before the incremental search, with two Counters per span
+    """
+    common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
+    num_same = sum(common.values())
+    if num_same == 0:
+        return 0
+    p = 1.0 * num_same / len(prediction_tokens)
+    r = 1.0 * num_same / len(ground_truth_tokens)
+    return (2 * p * r) / (p + r)
+
+
+def scan_answer_span(para_tokens, answers):
+    """
+    The span search of find_fake_answer before the incremental search
+    """
+    answer_tokens = set()
+    for answer in answers:
+        answer_tokens |= set(answer)
+    best_score, best_span = 0, [-1, -1]
+    for start_tidx in range(len(para_tokens)):
+        if para_tokens[start_tidx] not in answer_tokens:
+            continue
+        for end_tidx in range(len(para_tokens) - 1, start_tidx - 1, -1):
+            span_tokens = para_tokens[start_tidx: end_tidx + 1]
+            match_score = max([counter_f1(span_tokens, answer) for answer in answers])
+            if match_score == 0:
+                break
+            if match_score > best_score:
+                best_score = match_score
+                best_span = [start_tidx, end_tidx]
+    return best_score, best_span
+
+
+def random_tokens(rng, length, vocab_size):
+    return ['w{}'.format(rng.randint(0, vocab_size)) for _ in range(length)]
+
+
+def random_sample(rng):
+    answers = [random_tokens(rng, rng.randint(1, 6), 8) for _ in range(rng.randint(0, 3))]
+    documents = []
+    for _ in range(rng.randint(1, 4)):
+        documents.append({'is_selected': rng.random() < 0.7,
+                          'segmented_paragraphs': [random_tokens(rng, rng.randint(0, 25), 12)
+                                                   for _ in range(rng.randint(1, 4))]})
+    return {'segmented_answers': answers, 'documents': documents}
+
+
+class FakeAnswerTest(unittest.TestCase):
+
+    def test_answer_span_matches_scan(self):
+        rng = random.Random(5)
+        for _ in range(500):
+            para_tokens = random_tokens(rng, rng.randint(0, 30), 10)
+            answers = [random_tokens(rng, rng.randint(1, 8), 10) for _ in range(rng.randint(1, 3))]
+            self.assertEqual(find_best_answer_span(para_tokens, answers), scan_answer_span(para_tokens, answers))
+
+    def test_fake_answers_match_scan(self):
+        rng = random.Random(6)
+        for _ in range(200):
+            sample = random_sample(rng)
+            expected = copy.deepcopy(sample)
+            find_fake_answer(sample)
+            find_fake_answer(expected)
+            best_score, best_d_idx, best_span, best_answer = 0, -1, [-1, -1], None
+            for d_idx, doc in enumerate(expected['documents']):
+                if not doc['is_selected'] or not expected['segmented_answers']:
+                    continue
+                para_tokens = doc['segmented_paragraphs'][doc['most_related_para']][:1000]
+                score, span = scan_answer_span(para_tokens, expected['segmented_answers'])
+                if score > best_score:
+                    best_score, best_d_idx, best_span = score, d_idx, span
+                    best_answer = ''.join(para_tokens[span[0]: span[1] + 1])
+            if best_score > 0:
+                self.assertEqual(sample['answer_docs'], [best_d_idx])
+                self.assertEqual(sample['answer_spans'], [best_span])
+                self.assertEqual(sample['fake_answers'], [best_answer])
+                self.assertEqual(sample['match_scores'], [best_score])
+            else:
+                self.assertEqual(sample['answer_spans'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding:utf8 -*-
+"""
+Checks the bit-parallel LCS of ROUGE-L against the dynamic programming table it replaced,
+and the multi-process scoring against the serial one.
+Run from the bidaf dir: python -m pytest tests
+"""
+
+import random
+import unittest
+from unittest import mock
+from utils.rouge_metric import rouge
+from utils.rouge_metric.rouge import my_lcs, Rouge
+
+
+def table_lcs(string, sub):
+    """
+    The LCS length of my_lcs before the bit-parallel version
+    """
+    if len(string) < len(sub):
+        sub, string = string, sub
+    lengths = [[0 for i in range(0, len(sub) + 1)] for j in range(0, len(string) + 1)]
+    for j in range(1, len(sub) + 1):
+        for i in range(1, len(string) + 1):
+            if string[i - 1] == sub[j - 1]:
+                lengths[i][j] = lengths[i - 1][j - 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i - 1][j], lengths[i][j - 1])
+    return lengths[len(string)][len(sub)]
+
+
+def random_sentence(rng, vocab_size, max_len):
+    return ' '.join('w{}'.format(rng.randint(0, vocab_size)) for _ in range(rng.randint(1, max_len)))
+
+
+class RougeTest(unittest.TestCase):
+
+    def test_lcs_matches_table(self):
+        rng = random.Random(7)
+        for _ in range(2000):
+            vocab_size = rng.choice([2, 5, 50])
+            string = ['w{}'.format(rng.randint(0, vocab_size)) for _ in range(rng.randint(0, 80))]
+            sub = ['w{}'.format(rng.randint(0, vocab_size)) for _ in range(rng.randint(0, 80))]
+            self.assertEqual(my_lcs(string, sub), table_lcs(string, sub))
+
+    def test_processes_match_serial(self):
+        rng = random.Random(8)
+        res = {qid: [random_sentence(rng, 10, 20)] for qid in range(200)}
+        gts = {qid: [random_sentence(rng, 10, 20) for _ in range(rng.randint(1, 3))] for qid in range(200)}
+        serial_score, serial_scores = Rouge().compute_score(gts, res)
+        with mock.patch.object(rouge, 'MIN_PARALLEL_QUESTIONS', 10):
+            pool_score, pool_scores = Rouge(processes=2).compute_score(gts, res)
+        self.assertEqual(serial_scores.tolist(), pool_scores.tolist())
+        self.assertEqual(serial_score, pool_score)
+
+
+if __name__ == '__main__':
+    unittest.main()
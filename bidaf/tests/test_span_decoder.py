@@ -0,0 +1,119 @@
+# -*- coding:utf8 -*-
+"""
+Checks the vectorized span decoding against the Python double loop it replaced.
+Run from the bidaf dir: python -m pytest tests
+"""
+
+import unittest
+import numpy as np
+from utils.span_decoder import find_best_spans
+from utils.span_decoder import find_best_answers
+from utils.span_decoder import find_best_passage_span
+
+
+def loop_passage_span(start_probs, end_probs, max_a_len, passage_len=None):
+    """
+    The span search of the models before the vectorized decoding
+    """
+    if passage_len is None:
+        passage_len = len(start_probs)
+    else:
+        passage_len = min(len(start_probs), passage_len)
+    best_start, best_end, max_prob = -1, -1, 0
+    for start_idx in range(passage_len):
+        for ans_len in range(max_a_len):
+            end_idx = start_idx + ans_len
+            if end_idx >= passage_len:
+                continue
+            prob = start_probs[start_idx] * end_probs[end_idx]
+            if prob > max_prob:
+                best_start = start_idx
+                best_end = end_idx
+                max_prob = prob
+    return (best_start, best_end), max_prob
+
+
+def loop_answer(sample, start_prob, end_prob, padded_p_len, max_p_num, max_p_len, max_a_len):
+    """
+    The answer search of the models before the vectorized decoding
+    """
+    best_p_idx, best_span, best_score = None, None, 0
+    for p_idx, passage in enumerate(sample['passages']):
+        if p_idx >= max_p_num:
+            continue
+        passage_len = min(max_p_len, len(passage['passage_tokens']))
+        answer_span, score = loop_passage_span(
+            start_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
+            end_prob[p_idx * padded_p_len: (p_idx + 1) * padded_p_len],
+            max_a_len, passage_len)
+        if score > best_score:
+            best_score = score
+            best_p_idx = p_idx
+            best_span = answer_span
+    if best_p_idx is None or best_span is None:
+        return ''
+    return ''.join(sample['passages'][best_p_idx]['passage_tokens'][best_span[0]: best_span[1] + 1])
+
+
+def random_probs(rng, shape):
+    """
+    Coarse probabilities with many ties and zeros, where the tie breaking matters
+    """
+    probs = rng.randint(0, 5, size=shape) / 4.0
+    if rng.rand() < 0.5:
+        probs = rng.rand(*shape) * (rng.rand(*shape) < 0.7)
+    return probs.astype(np.float32)
+
+
+class SpanDecoderTest(unittest.TestCase):
+
+    def test_passage_spans_match_loop(self):
+        rng = np.random.RandomState(2)
+        for _ in range(300):
+            p_len = rng.randint(1, 40)
+            max_a_len = rng.randint(1, 12)
+            start_probs, end_probs = random_probs(rng, [p_len]), random_probs(rng, [p_len])
+            passage_len = None if rng.rand() < 0.3 else rng.randint(0, p_len + 5)
+            span, score = find_best_passage_span(start_probs, end_probs, max_a_len, passage_len)
+            expected_span, expected_score = loop_passage_span(start_probs, end_probs, max_a_len, passage_len)
+            self.assertEqual(span, expected_span)
+            self.assertEqual(score, expected_score)
+
+    def test_top_k_starts_with_best_span(self):
+        rng = np.random.RandomState(3)
+        for _ in range(100):
+            p_len = rng.randint(1, 30)
+            start_probs, end_probs = random_probs(rng, [2, p_len]), random_probs(rng, [2, p_len])
+            starts, ends, scores = find_best_spans(start_probs, end_probs, [p_len, p_len - 1], 5)
+            top_spans = find_best_spans(start_probs, end_probs, [p_len, p_len - 1], 5, top_k=3)
+            for pidx, spans in enumerate(top_spans):
+                if scores[pidx] > 0:
+                    self.assertEqual(spans[0][:2], (starts[pidx], ends[pidx]))
+                    self.assertEqual(spans[0][2], scores[pidx])
+                    self.assertEqual([span[2] for span in spans], sorted([span[2] for span in spans], reverse=True))
+                else:
+                    self.assertEqual(spans, [])
+
+    def test_answers_match_loop(self):
+        rng = np.random.RandomState(4)
+        for _ in range(100):
+            max_p_num, max_p_len, max_a_len = rng.randint(1, 5), rng.randint(1, 30), rng.randint(1, 10)
+            padded_p_len = rng.randint(1, max_p_len + 1)
+            passage_num = rng.randint(1, max_p_num + 1)
+            samples = []
+            for _ in range(rng.randint(1, 6)):
+                passages = [{'passage_tokens': ['t{}_{}'.format(pidx, tidx)
+                                                for tidx in range(rng.randint(0, max_p_len + 5))]}
+                            for pidx in range(rng.randint(0, max_p_num + 2))]
+                samples.append({'passages': passages})
+            start_probs = random_probs(rng, [len(samples), passage_num * padded_p_len])
+            end_probs = random_probs(rng, [len(samples), passage_num * padded_p_len])
+            answers = find_best_answers(samples, start_probs, end_probs, padded_p_len,
+                                        max_p_num, max_p_len, max_a_len)
+            expected = [loop_answer(sample, start_prob, end_prob, padded_p_len, max_p_num, max_p_len, max_a_len)
+                        for sample, start_prob, end_prob in zip(samples, start_probs, end_probs)]
+            self.assertEqual(answers, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,10 +27,50 @@ from .dureader_eval import compute_bleu_rouge
 from .dureader_eval import normalize
 from .preprocess import find_fake_answer
 from .preprocess import find_best_question_match
+from .span_decoder import find_best_spans
+from .span_decoder import find_best_sample_spans
+from .span_decoder import find_best_answers
+from .span_decoder import find_best_passage_span
+from .padding import pad_sequences
+from .padding import pad_token_chars
+from .padding import pad_char_sequences
+from .bucketing import bucket_batches
+from .bucketing import bucket_stream
+from .prefetch import prefetch_map
+from .streaming import slim_sample
+from .streaming import shuffle_buffer
+from .embeddings import load_embeddings
+from .embeddings import convert_embeddings
+from .prediction_writer import PredictionWriter
+from .sharding import write_shard
+from .sharding import shard_prefix
+from .sharding import merge_shards
+from .sharding import merge_test_shards
+from .sharding import predict_shards
 
 __all__ = [
     'compute_bleu_rouge',
     'normalize',
     'find_fake_answer',
     'find_best_question_match',
+    'find_best_spans',
+    'find_best_sample_spans',
+    'find_best_answers',
+    'find_best_passage_span',
+    'pad_sequences',
+    'pad_token_chars',
+    'pad_char_sequences',
+    'bucket_batches',
+    'bucket_stream',
+    'prefetch_map',
+    'slim_sample',
+    'shuffle_buffer',
+    'load_embeddings',
+    'convert_embeddings',
+    'PredictionWriter',
+    'write_shard',
+    'shard_prefix',
+    'merge_shards',
+    'merge_test_shards',
+    'predict_shards',
     ]
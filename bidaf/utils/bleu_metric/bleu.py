@@ -8,34 +8,61 @@
 # Last Modified : Thu 19 Mar 2015 09:13:28 PM PDT
 # Authors : Hao Fang <hfang@uw.edu> and Tsung-Yi Lin <tl483@cornell.edu>
 
-from .bleu_score import BleuScorer
+import multiprocessing
+from .bleu_score import BleuScorer, RefCache, cook_refs, cook_test
+
+# below this number of questions, starting the processes costs more than cooking them
+MIN_PARALLEL_QUESTIONS = 10000
+
+# shared by the Bleu instances of the process, the dev references are cooked once for all the epochs,
+# bounded to the questions of a few dev sets
+REF_CACHE = RefCache(max_size=100000)
+
+
+def _cook_question(item):
+    """
+    Cooks the prediction of one question in a worker, with its references if they are not cached
+    Returns:
+        the cooked prediction, and the cooked references to cache or None
+    """
+    hypo, ref, crefs = item
+    if crefs is None:
+        crefs = cook_refs(ref)
+        return cook_test(hypo, crefs), crefs
+    return cook_test(hypo, crefs), None
 
 
 class Bleu:
-    def __init__(self, n=4):
+    def __init__(self, n=4, processes=1, ref_cache=REF_CACHE):
         # default compute Blue score up to 4
         self._n = n
+        # the questions are cooked in this number of processes when there are many of them
+        self.processes = processes
+        self.ref_cache = ref_cache
         self._hypo_for_image = {}
         self.ref_for_image = {}
 
-    def compute_score(self, gts, res):
-
-        assert(list(gts.keys()) == list(res.keys()))
-        imgIds = list(gts.keys())
-
-        bleu_scorer = BleuScorer(n=self._n)
-        for id in imgIds:
-            hypo = res[id]
-            ref = gts[id]
+    def new_scorer(self):
+        return BleuScorer(n=self._n)
 
-            # Sanity check.
-            assert(type(hypo) is list)
-            assert(len(hypo) == 1)
-            assert(type(ref) is list)
-            assert(len(ref) >= 1)
+    def add(self, bleu_scorer, id, hypo, ref):
+        """
+        Cooks the prediction of one question into bleu_scorer, with the cached references of the id
+        """
+        # Sanity check.
+        assert(type(hypo) is list)
+        assert(len(hypo) == 1)
+        assert(type(ref) is list)
+        assert(len(ref) >= 1)
 
-            bleu_scorer += (hypo[0], ref)
+        if self.ref_cache is None:
+            crefs = cook_refs(ref)
+        else:
+            crefs = self.ref_cache.cook(id, ref)
+        bleu_scorer.append_cooked(cook_test(hypo[0], crefs), crefs)
+        return bleu_scorer
 
+    def score(self, bleu_scorer):
         #score, scores = bleu_scorer.compute_score(option='shortest')
         score, scores = bleu_scorer.compute_score(option='closest', verbose=1)
         #score, scores = bleu_scorer.compute_score(option='average', verbose=1)
@@ -43,5 +70,45 @@ class Bleu:
         # return (bleu, bleu_info)
         return score, scores
 
+    def compute_score(self, gts, res):
+
+        assert(list(gts.keys()) == list(res.keys()))
+        imgIds = list(gts.keys())
+
+        bleu_scorer = self.new_scorer()
+        if self.processes > 1 and len(imgIds) >= MIN_PARALLEL_QUESTIONS:
+            items = []
+            for id in imgIds:
+                hypo = res[id]
+                ref = gts[id]
+
+                # Sanity check.
+                assert(type(hypo) is list)
+                assert(len(hypo) == 1)
+                assert(type(ref) is list)
+                assert(len(ref) >= 1)
+
+                crefs = None if self.ref_cache is None else self.ref_cache.get(id, ref)
+                items.append((hypo[0], ref, crefs))
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                # map keeps the order of the questions, only the missing references are cooked in the workers
+                cooked = pool.map(_cook_question, items,
+                                  chunksize=max(1, len(items) // (4 * self.processes)))
+            finally:
+                pool.close()
+                pool.join()
+            for id, (hypo, ref, crefs), (ctest, new_crefs) in zip(imgIds, items, cooked):
+                if new_crefs is not None:
+                    crefs = new_crefs
+                    if self.ref_cache is not None:
+                        self.ref_cache.put(id, ref, crefs)
+                bleu_scorer.append_cooked(ctest, crefs)
+        else:
+            for id in imgIds:
+                self.add(bleu_scorer, id, res[id], gts[id])
+
+        return self.score(bleu_scorer)
+
     def method(self):
         return "Bleu"
@@ -14,12 +14,14 @@
 '''Provides:
 cook_refs(refs, n=4): Transform a list of reference sentences as strings into a form usable by cook_test().
 cook_test(test, refs, n=4): Transform a test sentence as a string (together with the cooked reference sentences) into a form usable by score_cooked().
+RefCache: Keeps the cooked references of the last questions across evaluations.
+BleuTotals: Sums cooked tests one by one for the corpus-level BLEU.
 '''
 
 import copy
 # import sys, math, re
 import math
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 
 def precook(s, n=4, out=False):
@@ -87,6 +89,85 @@ def cook_test(test, xxx_todo_changeme, eff=None, n=4):
     return result
 
 
+def corpus_bleu(totalcomps, n=4):
+    '''returns the corpus-level BLEU scores up to n of the summed statistics of the cooked tests,
+    and the length ratio.'''
+    small = 1e-9
+    tiny = 1e-15  ## so that if guess is 0 still return 0
+
+    bleus = []
+    bleu = 1.
+    for k in range(n):
+        bleu *= float(totalcomps['correct'][k] + tiny) \
+                / (totalcomps['guess'][k] + small)
+        bleus.append(bleu ** (1. / (k + 1)))
+    ratio = (totalcomps['testlen'] + tiny) / (totalcomps['reflen'] + small)  ## N.B.: avoid zero division
+    if ratio < 1:
+        for k in range(n):
+            bleus[k] *= math.exp(1 - 1 / ratio)
+    return bleus, ratio
+
+
+class BleuTotals(object):
+    '''Sums the cooked tests one by one without keeping them, the corpus-level BLEU is the one of
+    BleuScorer.compute_score(option="closest") in a memory that does not grow with the corpus.'''
+
+    def __init__(self, n=4):
+        self.n = n
+        self.size = 0
+        self.totalcomps = {'testlen': 0, 'reflen': 0, 'guess': [0] * n, 'correct': [0] * n}
+
+    def append_cooked(self, ctest, crefs=None):
+        testlen = ctest['testlen']
+        self.totalcomps['testlen'] += testlen
+        self.totalcomps['reflen'] += min((abs(l - testlen), l) for l in ctest['reflen'])[1]
+        for key in ['guess', 'correct']:
+            for k in range(self.n):
+                self.totalcomps[key][k] += ctest[key][k]
+        self.size += 1
+
+    def compute_score(self):
+        return corpus_bleu(self.totalcomps, self.n)[0]
+
+
+class RefCache(object):
+    '''Keeps the cooked references of the last max_size questions, so that the evaluation after
+    each epoch only cooks the predictions. The entries are keyed by the question id and its
+    references, the same question scored with other references gets an entry of its own.'''
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._cooked = OrderedDict()
+
+    def get(self, key, refs):
+        '''returns the cooked refs of the question, None if they are not cached.'''
+        key = (key, tuple(refs))
+        crefs = self._cooked.get(key)
+        if crefs is not None:
+            self._cooked.move_to_end(key)
+        return crefs
+
+    def put(self, key, refs, crefs):
+        key = (key, tuple(refs))
+        self._cooked[key] = crefs
+        self._cooked.move_to_end(key)
+        while len(self._cooked) > self.max_size:
+            self._cooked.popitem(last=False)
+
+    def cook(self, key, refs):
+        crefs = self.get(key, refs)
+        if crefs is None:
+            crefs = cook_refs(refs)
+            self.put(key, refs, crefs)
+        return crefs
+
+    def clear(self):
+        self._cooked.clear()
+
+    def __len__(self):
+        return len(self._cooked)
+
+
 class BleuScorer(object):
     """Bleu scorer.
     """
@@ -125,6 +206,13 @@ class BleuScorer(object):
 
         self._score = None  ## need to recompute
 
+    def append_cooked(self, ctest, crefs=None):
+        '''appends a test already cooked by cook_test, with its cooked refs if known.'''
+
+        self.crefs.append(crefs)
+        self.ctest.append(ctest)
+        self._score = None  ## need to recompute
+
     def ratio(self, option=None):
         self.compute_score(option=option)
         return self._ratio
@@ -250,16 +338,7 @@ class BleuScorer(object):
         totalcomps['reflen'] = self._reflen
         totalcomps['testlen'] = self._testlen
 
-        bleus = []
-        bleu = 1.
-        for k in range(n):
-            bleu *= float(totalcomps['correct'][k] + tiny) \
-                    / (totalcomps['guess'][k] + small)
-            bleus.append(bleu ** (1. / (k + 1)))
-        ratio = (self._testlen + tiny) / (self._reflen + small)  ## N.B.: avoid zero division
-        if ratio < 1:
-            for k in range(n):
-                bleus[k] *= math.exp(1 - 1 / ratio)
+        bleus, ratio = corpus_bleu(totalcomps, n)
 
         if verbose > 0:
             print(totalcomps)
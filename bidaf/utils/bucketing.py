@@ -0,0 +1,66 @@
+# -*- coding:utf8 -*-
+"""
+This module groups samples of similar length into the same batch, so that dynamically padded
+batches carry little padding. The samples are shuffled, then sorted by length inside buckets of
+bucket_size batches, and the resulting batches are shuffled again.
+"""
+
+import numpy as np
+
+
+def bucket_batches(lengths, batch_size, bucket_size, shuffle=True):
+    """
+    Groups the indices of the samples into length-bucketed batches
+    Args:
+        lengths: the length of each sample
+        batch_size: number of samples in one batch
+        bucket_size: number of batches sorted together, larger buckets pad less but mix less
+        shuffle: if set to be true, the samples and the batches are shuffled
+    Returns:
+        a list of index arrays, one for each batch
+    """
+    lengths = np.asarray(lengths)
+    indices = np.arange(len(lengths))
+    if shuffle:
+        np.random.shuffle(indices)
+    pool_size = batch_size * bucket_size
+    batches = []
+    for pool_start in range(0, len(indices), pool_size):
+        pool = indices[pool_start: pool_start + pool_size]
+        pool = pool[np.argsort(lengths[pool], kind='mergesort')]
+        batches += [pool[batch_start: batch_start + batch_size] for batch_start in range(0, len(pool), batch_size)]
+    if shuffle:
+        np.random.shuffle(batches)
+    return batches
+
+
+def bucket_stream(samples, batch_size, bucket_size, length_fn, shuffle=True):
+    """
+    Groups a stream of samples into length-bucketed batches, keeping one bucket in memory
+    Args:
+        samples: an iterable of samples
+        batch_size: number of samples in one batch
+        bucket_size: number of batches sorted together
+        length_fn: returns the length of a sample
+        shuffle: if set to be true, the batches of a bucket are shuffled
+    Returns:
+        a generator of lists of samples
+    """
+    pool_size = batch_size * bucket_size
+    pool = []
+    for sample in samples:
+        pool.append(sample)
+        if len(pool) == pool_size:
+            for batch in _split_pool(pool, batch_size, length_fn, shuffle):
+                yield batch
+            pool = []
+    for batch in _split_pool(pool, batch_size, length_fn, shuffle):
+        yield batch
+
+
+def _split_pool(pool, batch_size, length_fn, shuffle):
+    pool = sorted(pool, key=length_fn)
+    batches = [pool[batch_start: batch_start + batch_size] for batch_start in range(0, len(pool), batch_size)]
+    if shuffle:
+        np.random.shuffle(batches)
+    return batches
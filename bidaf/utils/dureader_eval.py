@@ -122,17 +122,18 @@ def read_file(file_name, task, is_ref=False):
     return results
 
 
-def compute_bleu_rouge(pred_dict, ref_dict, bleu_order=4):
+def compute_bleu_rouge(pred_dict, ref_dict, bleu_order=4, processes=1):
     """
     Compute bleu and rouge scores.
+    Bleu and Rouge-L are computed in processes processes when there are many questions.
     """
     assert set(pred_dict.keys()) == set(ref_dict.keys()), \
             "missing keys: {}".format(set(ref_dict.keys()) - set(pred_dict.keys()))
     scores = {}
-    bleu_scores, _ = Bleu(bleu_order).compute_score(ref_dict, pred_dict)
+    bleu_scores, _ = Bleu(bleu_order, processes).compute_score(ref_dict, pred_dict)
     for i, bleu_score in enumerate(bleu_scores):
         scores['Bleu-%d' % (i + 1)] = bleu_score
-    rouge_score, _ = Rouge().compute_score(ref_dict, pred_dict)
+    rouge_score, _ = Rouge(processes).compute_score(ref_dict, pred_dict)
     scores['Rouge-L'] = rouge_score
     return scores
 
@@ -209,7 +210,7 @@ def filter_dict(result_dict, key_tag):
     return filtered
 
 
-def get_metrics(pred_result, ref_result, task, source):
+def get_metrics(pred_result, ref_result, task, source, processes=1):
     """
     Computes metrics.
     """
@@ -232,7 +233,7 @@ def get_metrics(pred_result, ref_result, task, source):
         pred_dict, ref_dict = prepare_bleu(pred_result_filtered,
                 ref_result_filtered,
                 task)
-        metrics = compute_bleu_rouge(pred_dict, ref_dict)
+        metrics = compute_bleu_rouge(pred_dict, ref_dict, processes=processes)
     elif task == 'yesno':
         pred_dict, ref_dict = prepare_bleu(pred_result_filtered,
                 ref_result_filtered,
@@ -241,10 +242,10 @@ def get_metrics(pred_result, ref_result, task, source):
         preds = [filter_dict(pred_dict, k) for k in keys]
         refs = [filter_dict(ref_dict, k) for k in keys]
 
-        metrics = compute_bleu_rouge(pred_dict, ref_dict)
+        metrics = compute_bleu_rouge(pred_dict, ref_dict, processes=processes)
 
         for k, pred, ref in zip(keys, preds, refs):
-            m = compute_bleu_rouge(pred, ref)
+            m = compute_bleu_rouge(pred, ref, processes=processes)
             k_metric = [(k + '|' + key, v) for key, v in m.items()]
             metrics.update(k_metric)
 
@@ -255,7 +256,7 @@ def get_metrics(pred_result, ref_result, task, source):
                 ref_result_filtered,
                 task)
         metrics = compute_prf(pred_dict, ref_dict)
-        metrics.update(compute_bleu_rouge(pred_dict_bleu, ref_dict_bleu))
+        metrics.update(compute_bleu_rouge(pred_dict_bleu, ref_dict_bleu, processes=processes))
     else:
         raise ValueError("Illegal task name: {}".format(task))
 
@@ -523,7 +524,7 @@ def main(args):
             sources = sources[:1]
         for source in sources:
             metrics[source] = get_metrics(
-                    pred_result, ref_result, args.task, source)
+                    pred_result, ref_result, args.task, source, args.processes)
     except ValueError as ve:
         err = ve
     except AssertionError as ae:
@@ -540,6 +541,8 @@ if __name__ == '__main__':
     parser.add_argument('ref_file', help='reference file')
     parser.add_argument('task',
             help='task name: Main|Yes_No|All|Entity|Description')
+    parser.add_argument('--processes', type=int, default=1,
+            help='number of processes computing Bleu and Rouge-L')
 
     args = parser.parse_args()
     args.task = args.task.lower().replace('_', '')
@@ -0,0 +1,143 @@
+# -*- coding:utf8 -*-
+"""
+This module loads pretrained embeddings for the tokens of a vocab.
+
+The text format has a token and its vector on each line, with an optional "<token num> <dim>" header.
+It is streamed once, and only the vectors of the vocab tokens are parsed, straight into a float32 matrix.
+
+convert_embeddings writes a binary copy next to the text file, used instead of it while the text file is unchanged:
+    <embedding_path>.json: the token number, the dim and the size and mtime of the text file
+    <embedding_path>.tokens: one token on each line, in the order of the vectors
+    <embedding_path>.bin: the float32 vectors, memory-mapped when loaded
+"""
+
+import os
+import json
+import numpy as np
+
+
+def _text_vectors(embedding_path):
+    """
+    Yields the token and the unparsed vector of each line of a text embedding file
+    """
+    with open(embedding_path, 'rb') as fin:
+        for lidx, line in enumerate(fin):
+            # the token and the vector may be separated by a space or a tab
+            parts = line.split(None, 1)
+            if len(parts) < 2:
+                continue
+            token, vector = parts[0], parts[1].strip()
+            if lidx == 0 and vector.isdigit() and token.isdigit():
+                # the word2vec header
+                continue
+            if vector:
+                yield token.decode('utf8', 'ignore'), vector
+
+
+def _source_stat(embedding_path):
+    """
+    The size and mtime of the text file, None if it does not exist
+    """
+    try:
+        stat = os.stat(embedding_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _has_binary(embedding_path):
+    """
+    Checks whether the binary copy exists and was converted from the current text file,
+    the copy is used as is if the text file was removed
+    """
+    if not os.path.exists(embedding_path + '.json'):
+        return False
+    with open(embedding_path + '.json') as fin:
+        meta = json.load(fin)
+    source_stat = _source_stat(embedding_path)
+    return source_stat is None or meta.get('source_stat') == source_stat
+
+
+def load_embeddings(embedding_path, token2id):
+    """
+    Loads the pretrained vectors of the tokens of a vocab
+    Args:
+        embedding_path: a text embedding file, or the path it was converted from by convert_embeddings
+        token2id: the ids of the vocab tokens
+    Returns:
+        a float32 matrix with the vector of each vocab token, zeros for the missing ones,
+        and the ids of the found tokens in the order of the file
+    """
+    if _has_binary(embedding_path):
+        return _load_binary(embedding_path, token2id)
+    embeddings, found_ids = None, []
+    for token, vector in _text_vectors(embedding_path):
+        idx = token2id.get(token)
+        if idx is None:
+            continue
+        vector = np.array(vector.split(), dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.zeros([len(token2id), len(vector)], dtype=np.float32)
+        elif len(vector) != embeddings.shape[1]:
+            continue
+        embeddings[idx] = vector
+        found_ids.append(idx)
+    if embeddings is None:
+        raise ValueError('No token of the vocab is in {}'.format(embedding_path))
+    return embeddings, found_ids
+
+
+def _load_binary(embedding_path, token2id):
+    with open(embedding_path + '.json') as fin:
+        meta = json.load(fin)
+    vectors = np.memmap(embedding_path + '.bin', dtype=np.float32, mode='r',
+                        shape=(meta['token_num'], meta['dim']))
+    found_ids, rows = [], []
+    with open(embedding_path + '.tokens', 'rb') as fin:
+        for row, line in enumerate(fin):
+            idx = token2id.get(line.rstrip(b'\n').decode('utf8', 'ignore'))
+            if idx is not None:
+                found_ids.append(idx)
+                rows.append(row)
+    embeddings = np.zeros([len(token2id), meta['dim']], dtype=np.float32)
+    # the rows are read in increasing order, so the memory map is read sequentially
+    embeddings[found_ids] = vectors[rows]
+    return embeddings, found_ids
+
+
+def convert_embeddings(embedding_path):
+    """
+    Converts a text embedding file into the binary format once, later loads of embedding_path use it
+    until the text file changes
+    Returns:
+        the number of converted vectors
+    """
+    # the new copy is written under temporary names, so that a previous copy stays whole until it is replaced
+    tmp_suffix = '.tmp{}'.format(os.getpid())
+    tmp_paths = [embedding_path + suffix + tmp_suffix for suffix in ['.bin', '.tokens', '.json']]
+    token_num, dim = 0, None
+    try:
+        with open(tmp_paths[0], 'wb') as vector_out, open(tmp_paths[1], 'wb') as token_out:
+            for token, vector in _text_vectors(embedding_path):
+                vector = np.array(vector.split(), dtype=np.float32)
+                if dim is None:
+                    dim = len(vector)
+                elif len(vector) != dim:
+                    continue
+                vector_out.write(vector.tobytes())
+                token_out.write(token.encode('utf8') + b'\n')
+                token_num += 1
+        with open(tmp_paths[2], 'w') as fout:
+            json.dump({'token_num': token_num, 'dim': dim, 'source_stat': _source_stat(embedding_path)}, fout)
+    except BaseException:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    # the old .json is removed first, so that it never describes a new .bin or .tokens,
+    # and the new one is moved last, so that the copy is only used once its three files are in place
+    if os.path.exists(embedding_path + '.json'):
+        os.remove(embedding_path + '.json')
+    for suffix, tmp_path in zip(['.bin', '.tokens', '.json'], tmp_paths):
+        os.replace(tmp_path, embedding_path + suffix)
+    return token_num
@@ -0,0 +1,64 @@
+# -*- coding:utf8 -*-
+"""
+This module pads the token ids and char ids of a batch into preallocated int32 arrays.
+The source sequences may be lists or arrays and are never modified.
+"""
+
+import numpy as np
+
+
+def pad_sequences(sequences, max_len, pad_id):
+    """
+    Pads or truncates the id sequences to max_len
+    Args:
+        sequences: a list of id sequences, lists or 1-d arrays
+        max_len: the length of the padded sequences
+        pad_id: the id used to pad
+    Returns:
+        an int32 array with shape [len(sequences), max_len]
+    """
+    padded = np.full([len(sequences), max_len], pad_id, dtype=np.int32)
+    for idx, ids in enumerate(sequences):
+        length = min(len(ids), max_len)
+        if length:
+            padded[idx, :length] = ids[:length]
+    return padded
+
+
+def pad_token_chars(char_ids, max_char_len, pad_char_id):
+    """
+    Pads or truncates the char ids of each token of one sequence to max_char_len
+    Args:
+        char_ids: the char ids of each token, a list of lists or an array already padded to max_char_len
+        max_char_len: the number of chars kept for each token
+        pad_char_id: the id used to pad
+    Returns:
+        an int32 array with shape [len(char_ids), max_char_len]
+    """
+    if isinstance(char_ids, np.ndarray) and char_ids.ndim == 2 and char_ids.shape[1] == max_char_len:
+        return char_ids
+    chars = np.full([len(char_ids), max_char_len], pad_char_id, dtype=np.int32)
+    for tidx, token_chars in enumerate(char_ids):
+        length = min(len(token_chars), max_char_len)
+        if length:
+            chars[tidx, :length] = token_chars[:length]
+    return chars
+
+
+def pad_char_sequences(sequences, max_len, max_char_len, pad_char_id):
+    """
+    Pads or truncates the char id sequences to max_len tokens of max_char_len chars
+    Args:
+        sequences: a list of char id sequences, see pad_token_chars
+        max_len: the number of tokens of the padded sequences
+        max_char_len: the number of chars of each token
+        pad_char_id: the id used to pad
+    Returns:
+        an int32 array with shape [len(sequences), max_len, max_char_len]
+    """
+    padded = np.full([len(sequences), max_len, max_char_len], pad_char_id, dtype=np.int32)
+    for idx, char_ids in enumerate(sequences):
+        length = min(len(char_ids), max_len)
+        if length:
+            padded[idx, :length] = pad_token_chars(char_ids[:length], max_char_len, pad_char_id)
+    return padded
@@ -0,0 +1,70 @@
+# -*- coding:utf8 -*-
+"""
+This module writes the predictions of an evaluation as they come and scores them on the fly,
+so that neither the predictions nor the samples are kept until the end of the evaluation.
+"""
+
+import json
+from array import array
+import numpy as np
+from .dureader_eval import normalize
+from .bleu_metric.bleu import Bleu
+from .bleu_metric.bleu_score import BleuTotals
+from .rouge_metric.rouge import Rouge
+
+
+class PredictionWriter(object):
+    """
+    Writes the predictions to a JSONL file one by one and accumulates the Bleu and Rouge-L statistics
+    of the questions with reference answers, the same scores as compute_bleu_rouge
+    """
+    def __init__(self, result_file=None, bleu_order=4):
+        self.result_file = result_file
+        self.fout = open(result_file, 'w') if result_file is not None else None
+        self.pred_num = 0
+        self.bleu = Bleu(bleu_order)
+        self.bleu_totals = BleuTotals(bleu_order)
+        self.rouge = Rouge()
+        # 8 bytes per question, kept to average them like compute_bleu_rouge
+        self.rouge_scores = array('d')
+
+    def add(self, question_id, best_answer, ref_answers=None, pred_answer=None):
+        """
+        Adds the prediction of one question
+        Args:
+            question_id: the id of the question
+            best_answer: the predicted answer
+            ref_answers: the reference answers, the prediction is not scored without them
+            pred_answer: the json object written to the result file
+        """
+        if self.fout is not None and pred_answer is not None:
+            self.fout.write(json.dumps(pred_answer, ensure_ascii=False) + '\n')
+        self.pred_num += 1
+        if ref_answers:
+            pred, refs = normalize([best_answer]), normalize(ref_answers)
+            self.bleu.add(self.bleu_totals, question_id, pred, refs)
+            self.rouge_scores.append(self.rouge.calc_score(pred, refs))
+
+    def metrics(self):
+        """
+        Returns:
+            the bleu and rouge scores of the scored predictions, None if there is none
+        """
+        if self.bleu_totals.size == 0:
+            return None
+        scores = {}
+        for i, bleu_score in enumerate(self.bleu_totals.compute_score()):
+            scores['Bleu-%d' % (i + 1)] = bleu_score
+        scores['Rouge-L'] = np.mean(np.frombuffer(self.rouge_scores, dtype=np.float64))
+        return scores
+
+    def close(self):
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
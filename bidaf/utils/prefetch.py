@@ -0,0 +1,67 @@
+# -*- coding:utf8 -*-
+"""
+This module builds batches in background threads while the model runs on the current one.
+The session releases the GIL during sess.run, and so does most of the numpy padding, so the
+next batches are ready when the step finishes.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_END = object()
+
+
+def prefetch_map(fn, items, prefetch=2, num_workers=1):
+    """
+    Applies fn to the items in background threads, at most prefetch results ahead of the consumer
+    Args:
+        fn: builds one result from one item, called from several threads if num_workers > 1
+        items: an iterable of items, consumed by a single background thread
+        prefetch: the number of results prepared in advance, 0 to apply fn synchronously
+        num_workers: the number of threads applying fn
+    Returns:
+        a generator of fn(item), in the order of the items
+    """
+    if prefetch <= 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    futures = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(future):
+        while not stop.is_set():
+            try:
+                futures.put(future, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                put(executor.submit(fn, item))
+        except Exception as e:
+            # the error of the item iterator is raised in the consumer
+            failed = Future()
+            failed.set_exception(e)
+            put(failed)
+        put(_END)
+
+    producer = threading.Thread(target=produce, name='batch-prefetch')
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            future = futures.get()
+            if future is _END:
+                return
+            yield future.result()
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
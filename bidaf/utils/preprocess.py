@@ -16,13 +16,19 @@
 # ==============================================================================
 """
 This module finds the most related paragraph of each document according to recall.
+
+Run as a script, it adds the fake answers to the samples of a jsonl file, in several processes:
+    python utils/preprocess.py --workers 8 < search.train.json > search.train.preprocessed.json
 """
 
 import sys
 if sys.version[0] == '2':
     reload(sys)
     sys.setdefaultencoding("utf-8")
+import io
 import json
+import argparse
+import multiprocessing
 from collections import Counter
 
 
@@ -47,10 +53,14 @@ def precision_recall_f1(prediction, ground_truth):
         ground_truth_tokens = ground_truth
     common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
     num_same = sum(common.values())
+    return _precision_recall_f1(num_same, len(prediction_tokens), len(ground_truth_tokens))
+
+
+def _precision_recall_f1(num_same, prediction_len, ground_truth_len):
     if num_same == 0:
         return 0, 0, 0
-    p = 1.0 * num_same / len(prediction_tokens)
-    r = 1.0 * num_same / len(ground_truth_tokens)
+    p = 1.0 * num_same / prediction_len
+    r = 1.0 * num_same / ground_truth_len
     f1 = (2 * p * r) / (p + r)
     return p, r, f1
 
@@ -139,6 +149,50 @@ def find_best_question_match(doc, question, with_score=False):
     return most_related_para
 
 
+def find_best_answer_span(para_tokens, answers):
+    """
+    Finds the span of the paragraph with the max f1_score over the answers, the same span as
+    scanning every start in the answers and every end from the last token backwards, but the
+    overlap with each answer is updated as the end moves instead of counted again for each span
+    Args:
+        para_tokens: the paragraph tokens
+        answers: the token lists of the answers
+    Returns:
+        the f1 score and the [start, end] of the span, 0 and [-1, -1] if no token matches
+    """
+    answer_counts = [Counter(answer) for answer in answers]
+    answer_tokens = set()
+    for counts in answer_counts:
+        answer_tokens |= set(counts)
+    # the count of each answer token in the paragraph from the current start
+    suffix_counts = Counter([token for token in para_tokens if token in answer_tokens])
+    best_score, best_span = 0, [-1, -1]
+    for start_tidx, start_token in enumerate(para_tokens):
+        if start_token not in answer_tokens:
+            continue
+        span_counts = dict(suffix_counts)
+        overlaps = [sum(min(span_counts.get(token, 0), cnt) for token, cnt in counts.items())
+                    for counts in answer_counts]
+        for end_tidx in range(len(para_tokens) - 1, start_tidx - 1, -1):
+            span_len = end_tidx - start_tidx + 1
+            match_score = max([_precision_recall_f1(overlap, span_len, len(answer))[2]
+                               for overlap, answer in zip(overlaps, answers)])
+            if match_score == 0:
+                break
+            if match_score > best_score:
+                best_score = match_score
+                best_span = [start_tidx, end_tidx]
+            # drops the end token from the span
+            end_token = para_tokens[end_tidx]
+            if end_token in span_counts:
+                for aidx, counts in enumerate(answer_counts):
+                    if span_counts[end_token] <= counts.get(end_token, 0):
+                        overlaps[aidx] -= 1
+                span_counts[end_token] -= 1
+        suffix_counts[start_token] -= 1
+    return best_score, best_span
+
+
 def find_fake_answer(sample):
     """
     For each document, finds the most related paragraph based on recall,
@@ -178,32 +232,18 @@ def find_fake_answer(sample):
     best_match_score = 0
     best_match_d_idx, best_match_span = -1, [-1, -1]
     best_fake_answer = None
-    answer_tokens = set()
-    for segmented_answer in sample['segmented_answers']:
-        answer_tokens = answer_tokens | set([token for token in segmented_answer])
     for d_idx, doc in enumerate(sample['documents']):
         if not doc['is_selected']:
             continue
         if doc['most_related_para'] == -1:
             doc['most_related_para'] = 0
         most_related_para_tokens = doc['segmented_paragraphs'][doc['most_related_para']][:1000]
-        for start_tidx in range(len(most_related_para_tokens)):
-            if most_related_para_tokens[start_tidx] not in answer_tokens:
-                continue
-            for end_tidx in range(len(most_related_para_tokens) - 1, start_tidx - 1, -1):
-                span_tokens = most_related_para_tokens[start_tidx: end_tidx + 1]
-                if len(sample['segmented_answers']) > 0:
-                    match_score = metric_max_over_ground_truths(f1_score, span_tokens,
-                                                                sample['segmented_answers'])
-                else:
-                    match_score = 0
-                if match_score == 0:
-                    break
-                if match_score > best_match_score:
-                    best_match_d_idx = d_idx
-                    best_match_span = [start_tidx, end_tidx]
-                    best_match_score = match_score
-                    best_fake_answer = ''.join(span_tokens)
+        match_score, match_span = find_best_answer_span(most_related_para_tokens, sample['segmented_answers'])
+        if match_score > best_match_score:
+            best_match_d_idx = d_idx
+            best_match_span = match_span
+            best_match_score = match_score
+            best_fake_answer = ''.join(most_related_para_tokens[match_span[0]: match_span[1] + 1])
     if best_match_score > 0:
         sample['answer_docs'].append(best_match_d_idx)
         sample['answer_spans'].append(best_match_span)
@@ -211,8 +251,44 @@ def find_fake_answer(sample):
         sample['match_scores'].append(best_match_score)
 
 
+def preprocess_line(line):
+    """
+    Adds the fake answer to one json line
+    """
+    sample = json.loads(line)
+    find_fake_answer(sample)
+    return json.dumps(sample, ensure_ascii=False)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser('Finds the fake answers of the DuReader samples')
+    parser.add_argument('--input', default=None, help='the input jsonl file, stdin if not set')
+    parser.add_argument('--output', default=None, help='the output jsonl file, stdout if not set')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of processes, 1 to preprocess in this process')
+    parser.add_argument('--chunk_size', type=int, default=64,
+                        help='number of lines sent to a process at once')
+    return parser.parse_args()
+
+
+def run():
+    args = parse_args()
+    fin = io.open(args.input, encoding='utf8') if args.input else sys.stdin
+    fout = io.open(args.output, 'w', encoding='utf8') if args.output else sys.stdout
+    lines = (line for line in fin if line.strip())
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers)
+        # imap keeps the order of the input lines
+        results = pool.imap(preprocess_line, lines, chunksize=args.chunk_size)
+    else:
+        pool, results = None, map(preprocess_line, lines)
+    for result in results:
+        fout.write(result + '\n')
+    if pool is not None:
+        pool.close()
+        pool.join()
+    fout.flush()
+
+
 if __name__ == '__main__':
-    for line in sys.stdin:
-        sample = json.loads(line)
-        find_fake_answer(sample)
-        print(json.dumps(sample, encoding='utf8', ensure_ascii=False))
+    run()
@@ -7,11 +7,15 @@
 # Creation Date : 2015-01-07 06:03
 # Author : Ramakrishna Vedantam <vrama91@vt.edu>
 
+import multiprocessing
 import numpy as np
 
 
 # import pdb
 
+# below this number of questions the pool costs more than it saves
+MIN_PARALLEL_QUESTIONS = 10000
+
 
 def my_lcs(string, sub):
     """
@@ -21,20 +25,57 @@ def my_lcs(string, sub):
     :returns: length (list of int): length of the longest common subsequence between the two strings
 
     Note: my_lcs only gives length of the longest common subsequence, not the actual LCS
+
+    The dynamic programming table is kept as the bits of one integer over the shorter string
+    (bit-parallel LCS, Hyyro 2004): a zero bit marks a position where the LCS grows, and each token of
+    the longer string updates all the positions with a few integer operations, in O(min(n, m)) memory.
     """
     if (len(string) < len(sub)):
         sub, string = string, sub
+    if len(sub) == 0:
+        return 0
+
+    matches = {}
+    for i, token in enumerate(sub):
+        matches[token] = matches.get(token, 0) | (1 << i)
+    all_ones = (1 << len(sub)) - 1
+    row = all_ones
+    for token in string:
+        match = matches.get(token)
+        if match is not None:
+            u = row & match
+            row = ((row + u) | (row - u)) & all_ones
+
+    return len(sub) - bin(row).count('1')
+
+
+def _rouge_l(candidate, refs, beta):
+    prec = []
+    rec = []
+
+    # split into tokens
+    token_c = candidate[0].split(" ")
+
+    for reference in refs:
+        # split into tokens
+        token_r = reference.split(" ")
+        # compute the longest common subsequence
+        lcs = my_lcs(token_r, token_c)
+        prec.append(lcs / float(len(token_c)))
+        rec.append(lcs / float(len(token_r)))
+
+    prec_max = max(prec)
+    rec_max = max(rec)
 
-    lengths = [[0 for i in range(0, len(sub) + 1)] for j in range(0, len(string) + 1)]
+    if (prec_max != 0 and rec_max != 0):
+        score = ((1 + beta ** 2) * prec_max * rec_max) / float(rec_max + beta ** 2 * prec_max)
+    else:
+        score = 0.0
+    return score
 
-    for j in range(1, len(sub) + 1):
-        for i in range(1, len(string) + 1):
-            if (string[i - 1] == sub[j - 1]):
-                lengths[i][j] = lengths[i - 1][j - 1] + 1
-            else:
-                lengths[i][j] = max(lengths[i - 1][j], lengths[i][j - 1])
 
-    return lengths[len(string)][len(sub)]
+def _rouge_l_pair(args):
+    return _rouge_l(*args)
 
 
 class Rouge():
@@ -43,9 +84,11 @@ class Rouge():
 
     '''
 
-    def __init__(self):
+    def __init__(self, processes=1):
         # vrama91: updated the value below based on discussion with Hovey
         self.beta = 1.2
+        # the questions are scored in this number of processes when there are many of them
+        self.processes = processes
 
     def calc_score(self, candidate, refs):
         """
@@ -56,28 +99,7 @@ class Rouge():
         """
         assert (len(candidate) == 1)
         assert (len(refs) > 0)
-        prec = []
-        rec = []
-
-        # split into tokens
-        token_c = candidate[0].split(" ")
-
-        for reference in refs:
-            # split into tokens
-            token_r = reference.split(" ")
-            # compute the longest common subsequence
-            lcs = my_lcs(token_r, token_c)
-            prec.append(lcs / float(len(token_c)))
-            rec.append(lcs / float(len(token_r)))
-
-        prec_max = max(prec)
-        rec_max = max(rec)
-
-        if (prec_max != 0 and rec_max != 0):
-            score = ((1 + self.beta ** 2) * prec_max * rec_max) / float(rec_max + self.beta ** 2 * prec_max)
-        else:
-            score = 0.0
-        return score
+        return _rouge_l(candidate, refs, self.beta)
 
     def compute_score(self, gts, res):
         """
@@ -90,19 +112,31 @@ class Rouge():
         assert (list(gts.keys()) == list(res.keys()))
         imgIds = list(gts.keys())
 
-        score = []
+        pairs = []
         for id in imgIds:
             hypo = res[id]
             ref = gts[id]
 
-            score.append(self.calc_score(hypo, ref))
-
             # Sanity check.
             assert (type(hypo) is list)
             assert (len(hypo) == 1)
             assert (type(ref) is list)
             assert (len(ref) > 0)
 
+            pairs.append((hypo, ref, self.beta))
+
+        if self.processes > 1 and len(pairs) >= MIN_PARALLEL_QUESTIONS:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                # map keeps the order of the questions
+                score = pool.map(_rouge_l_pair, pairs,
+                                 chunksize=max(1, len(pairs) // (4 * self.processes)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            score = [_rouge_l_pair(pair) for pair in pairs]
+
         average_score = np.mean(np.array(score))
         return average_score, np.array(score)
 
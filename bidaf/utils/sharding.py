@@ -0,0 +1,127 @@
+# -*- coding:utf8 -*-
+"""
+This module splits the data files into shards of consecutive lines for the offline prediction,
+so that independent processes or nodes predict one shard each, and merges their results.
+The shards are consecutive, so the merged results are in the order of the data files.
+"""
+
+import os
+import copy
+import shutil
+import logging
+import multiprocessing
+
+
+def count_lines(data_files):
+    """
+    Returns the number of lines of the data files
+    """
+    line_num = 0
+    for data_path in data_files:
+        with open(data_path, 'rb') as fin:
+            for _ in fin:
+                line_num += 1
+    return line_num
+
+
+def shard_prefix(prefix, num_shards, shard_id):
+    """
+    Returns the file prefix of one shard
+    """
+    return '{}.shard{}-of-{}'.format(prefix, shard_id, num_shards)
+
+
+def write_shard(data_files, num_shards, shard_id, shard_dir, prefix='test'):
+    """
+    Writes the lines of one shard of the data files into shard_dir
+    Args:
+        data_files: the data files, read as one sequence of lines
+        num_shards: the number of shards
+        shard_id: the shard to write, in [0, num_shards)
+        shard_dir: the dir of the shard files
+        prefix: the prefix of the shard file
+    Returns:
+        the path of the shard file
+    """
+    assert 0 <= shard_id < num_shards, 'shard_id {} out of {} shards'.format(shard_id, num_shards)
+    line_num = count_lines(data_files)
+    begin, end = line_num * shard_id // num_shards, line_num * (shard_id + 1) // num_shards
+    if not os.path.exists(shard_dir):
+        os.makedirs(shard_dir)
+    shard_path = os.path.join(shard_dir, shard_prefix(prefix, num_shards, shard_id) + '.json')
+    lidx = 0
+    with open(shard_path, 'wb') as fout:
+        for data_path in data_files:
+            with open(data_path, 'rb') as fin:
+                for line in fin:
+                    if begin <= lidx < end:
+                        fout.write(line if line.endswith(b'\n') else line + b'\n')
+                    lidx += 1
+                    if lidx >= end:
+                        return shard_path
+    return shard_path
+
+
+def merge_shards(result_dir, result_prefix, num_shards):
+    """
+    Concatenates the results of the shards in shard order into result_dir/result_prefix.json
+    Returns:
+        the path of the merged results
+    """
+    shard_paths = [os.path.join(result_dir, shard_prefix(result_prefix, num_shards, shard_id) + '.json')
+                   for shard_id in range(num_shards)]
+    missing = [path for path in shard_paths if not os.path.exists(path)]
+    if missing:
+        raise IOError('Missing the results of the shards {}'.format(missing))
+    result_path = os.path.join(result_dir, result_prefix + '.json')
+    with open(result_path, 'wb') as fout:
+        for shard_path in shard_paths:
+            with open(shard_path, 'rb') as fin:
+                shutil.copyfileobj(fin, fout)
+    return result_path
+
+
+def merge_test_shards(args, logger=None):
+    """
+    Merges the answers of the args.num_shards shards predicted with shard_id into test.predicted.json
+    """
+    logger = logger or logging.getLogger("brc")
+    result_path = merge_shards(args.result_dir, 'test.predicted', args.num_shards)
+    logger.info('Merged the answers of {} shards into {}'.format(args.num_shards, result_path))
+    print('Merged the answers of {} shards into {}'.format(args.num_shards, result_path))
+    return result_path
+
+
+def predict_shards(args, predict_shard, logger=None):
+    """
+    Predicts the args.num_shards shards of the test files with one model replica per local process,
+    then merges their answers in the order of the test files
+    Args:
+        args: the parsed args of a run script, each process gets a copy with its shard_id
+        predict_shard: predicts the shard of its args, a module level function of the run script,
+                       which the spawned processes import
+        logger: the logger of the run script
+    Returns:
+        the path of the merged answers
+    """
+    logger = logger or logging.getLogger("brc")
+    base_args = copy.copy(args)
+    if not base_args.intra_op_threads:
+        base_args.intra_op_threads = max(1, multiprocessing.cpu_count() // args.num_shards)
+    logger.info('Predicting {} shards with {} threads each...'.format(args.num_shards, base_args.intra_op_threads))
+    print('Predicting {} shards...'.format(args.num_shards))
+    # spawned, the replicas do not inherit the session or the graph of this process
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for shard_id in range(args.num_shards):
+        shard_args = copy.copy(base_args)
+        shard_args.shard_id = shard_id
+        process = context.Process(target=predict_shard, args=(shard_args,))
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+    failed = [shard_id for shard_id, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        raise RuntimeError('The prediction of the shards {} failed'.format(failed))
+    return merge_test_shards(args, logger)
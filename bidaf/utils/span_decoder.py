@@ -0,0 +1,153 @@
+# -*- coding:utf8 -*-
+"""
+This module decodes answer spans from the start and end probabilities with NumPy.
+It gives the same spans as scanning every (start, length) pair in Python:
+a span is only taken if its score is positive, and ties go to the smallest start, then the smallest end.
+"""
+
+import numpy as np
+
+
+def find_best_spans(start_probs, end_probs, passage_lens, max_a_len, top_k=None):
+    """
+    Finds the spans with the maximum start_prob * end_prob for a batch of passages
+    Args:
+        start_probs: array of shape [passage_num, padded_p_len]
+        end_probs: array of shape [passage_num, padded_p_len]
+        passage_lens: the valid length of each passage
+        max_a_len: the max length of an answer
+        top_k: if set, returns the top_k spans of each passage instead of the best one
+    Returns:
+        if top_k is None, arrays of the best starts, ends and scores, (-1, -1, 0) means no span,
+        otherwise a list with a list of (start, end, score) per passage, best first
+    """
+    start_probs = np.asarray(start_probs)
+    end_probs = np.asarray(end_probs)
+    passage_num, padded_p_len = start_probs.shape
+    passage_lens = np.minimum(np.asarray(passage_lens, dtype=np.int64), padded_p_len)
+    in_passage = np.arange(padded_p_len)[None, :] < passage_lens[:, None]
+    max_a_len = min(max_a_len, padded_p_len)
+    if top_k is not None:
+        return _find_top_k_spans(start_probs, end_probs, in_passage, max_a_len, top_k)
+
+    # running max over the answer length, keeps the best end of each start
+    dtype = (start_probs[:, :1] * end_probs[:, :1]).dtype
+    best_scores = np.zeros([passage_num, padded_p_len], dtype=dtype)
+    best_ends = np.full([passage_num, padded_p_len], -1, dtype=np.int64)
+    for ans_len in range(max_a_len):
+        start_num = padded_p_len - ans_len
+        scores = start_probs[:, :start_num] * end_probs[:, ans_len:]
+        better = (scores > best_scores[:, :start_num]) & in_passage[:, ans_len:]
+        best_scores[:, :start_num] = np.where(better, scores, best_scores[:, :start_num])
+        best_ends[:, :start_num] = np.where(better, np.arange(ans_len, padded_p_len), best_ends[:, :start_num])
+
+    starts = np.argmax(best_scores, axis=1)
+    rows = np.arange(passage_num)
+    scores = best_scores[rows, starts]
+    ends = best_ends[rows, starts]
+    found = scores > 0
+    starts = np.where(found, starts, -1)
+    ends = np.where(found, ends, -1)
+    scores = np.where(found, scores, 0)
+    return starts, ends, scores
+
+
+def _find_top_k_spans(start_probs, end_probs, in_passage, max_a_len, top_k):
+    """
+    Scores the whole band of spans, shape [passage_num, padded_p_len, max_a_len], and keeps the top_k of each passage
+    """
+    passage_num, padded_p_len = start_probs.shape
+    end_idx = np.arange(padded_p_len)[:, None] + np.arange(max_a_len)[None, :]
+    valid_end = end_idx < padded_p_len
+    end_idx = np.minimum(end_idx, padded_p_len - 1)
+    band = start_probs[:, :, None] * end_probs[:, end_idx]
+    valid = valid_end[None, :, :] & in_passage[:, end_idx]
+    band = np.where(valid, band, 0).reshape([passage_num, -1])
+    results = []
+    for row in band:
+        # stable sort keeps the (start, end) order between equal scores
+        order = np.argsort(-row, kind='stable')[:top_k]
+        spans = []
+        for flat_idx in order:
+            if not row[flat_idx] > 0:
+                break
+            start, ans_len = divmod(int(flat_idx), max_a_len)
+            spans.append((start, start + ans_len, row[flat_idx]))
+        results.append(spans)
+    return results
+
+
+def find_best_sample_spans(start_probs, end_probs, passage_lens, padded_p_len, max_a_len):
+    """
+    Finds the best passage and span of each sample in a batch
+    Args:
+        start_probs: array of shape [batch_size, passage_num * padded_p_len], as output by the models
+        end_probs: array of shape [batch_size, passage_num * padded_p_len]
+        passage_lens: a list with the lengths of the passages of each sample
+        padded_p_len: the padded length of a passage
+        max_a_len: the max length of an answer
+    Returns:
+        a list of (passage_idx, (start, end), score) per sample, passage_idx is None if no span is found
+    """
+    start_probs = np.asarray(start_probs)
+    end_probs = np.asarray(end_probs)
+    batch_size = start_probs.shape[0]
+    passage_num = start_probs.shape[1] // padded_p_len
+    lens = np.zeros([batch_size, passage_num], dtype=np.int64)
+    for sidx, sample_lens in enumerate(passage_lens):
+        sample_lens = sample_lens[:passage_num]
+        lens[sidx, :len(sample_lens)] = sample_lens
+    starts, ends, scores = find_best_spans(
+        start_probs[:, :passage_num * padded_p_len].reshape([batch_size * passage_num, padded_p_len]),
+        end_probs[:, :passage_num * padded_p_len].reshape([batch_size * passage_num, padded_p_len]),
+        lens.reshape([-1]), max_a_len)
+    starts = starts.reshape([batch_size, passage_num])
+    ends = ends.reshape([batch_size, passage_num])
+    scores = scores.reshape([batch_size, passage_num])
+    results = []
+    for sidx in range(batch_size):
+        p_idx = int(np.argmax(scores[sidx])) if passage_num > 0 else 0
+        if passage_num == 0 or not scores[sidx, p_idx] > 0:
+            results.append((None, None, 0))
+        else:
+            results.append((p_idx, (int(starts[sidx, p_idx]), int(ends[sidx, p_idx])), scores[sidx, p_idx]))
+    return results
+
+
+def find_best_answers(samples, start_probs, end_probs, padded_p_len, max_p_num, max_p_len, max_a_len):
+    """
+    Finds the best answer of every sample in a batch with one vectorized span decoding
+    Args:
+        samples: the raw samples of the batch, with their passages and passage_tokens
+        start_probs: array of shape [batch_size, passage_num * padded_p_len], as output by the models
+        end_probs: array of shape [batch_size, passage_num * padded_p_len]
+        padded_p_len: the padded length of a passage
+        max_p_num: the max number of passages of a sample
+        max_p_len: the max length of a passage
+        max_a_len: the max length of an answer
+    Returns:
+        the answer string of each sample, '' if no span is found
+    """
+    passage_lens = [[min(max_p_len, len(passage['passage_tokens']))
+                     for passage in sample['passages'][:max_p_num]] for sample in samples]
+    best_spans = find_best_sample_spans(start_probs, end_probs, passage_lens, padded_p_len, max_a_len)
+    best_answers = []
+    for sample, (best_p_idx, best_span, _) in zip(samples, best_spans):
+        if best_p_idx is None or best_span is None:
+            best_answers.append('')
+        else:
+            best_answers.append(''.join(
+                sample['passages'][best_p_idx]['passage_tokens'][best_span[0]: best_span[1] + 1]))
+    return best_answers
+
+
+def find_best_passage_span(start_probs, end_probs, max_a_len, passage_len=None):
+    """
+    Finds the span with the maximum start_prob * end_prob in a single passage
+    Returns:
+        the (start, end) of the span, (-1, -1) if no span is found, and its score
+    """
+    if passage_len is None:
+        passage_len = len(start_probs)
+    starts, ends, scores = find_best_spans([start_probs], [end_probs], [passage_len], max_a_len)
+    return (int(starts[0]), int(ends[0])), scores[0]
@@ -0,0 +1,42 @@
+# -*- coding:utf8 -*-
+"""
+This module holds the helpers of the streaming mode of the dataset loaders, which parse the files
+lazily, keep only the fields needed by batching and evaluation, and shuffle with a bounded buffer.
+"""
+
+import numpy as np
+
+# the fields of a sample that batching and evaluation need, the rest is dropped when streaming
+SLIM_FIELDS = ['question_id', 'question_type', 'segmented_question', 'question_tokens',
+               'answers', 'answer_passages', 'answer_spans']
+
+
+def slim_sample(sample):
+    """
+    Drops the raw documents and keeps only the fields used by batching and evaluation
+    """
+    slim = {field: sample[field] for field in SLIM_FIELDS if field in sample}
+    slim['passages'] = [{'passage_tokens': passage['passage_tokens']} for passage in sample['passages']]
+    return slim
+
+
+def shuffle_buffer(samples, buffer_size):
+    """
+    Shuffles a stream of samples approximately, keeping at most buffer_size samples in memory
+    Args:
+        samples: an iterable of samples
+        buffer_size: the number of samples to draw from
+    Returns:
+        a generator of the shuffled samples
+    """
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        idx = np.random.randint(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = sample
+    np.random.shuffle(buffer)
+    for sample in buffer:
+        yield sample
@@ -0,0 +1,145 @@
+"""
+异步版本的搜索与搜索建议(需要django>=3.1和elasticsearch-py>=7.8, 并通过topSearch.asgi部署)
+排行榜与es请求并发执行, 模型推理放到有界线程池, 不阻塞事件循环
+"""
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.views.generic.base import View
+
+from search.clients import get_async_es_client, search_timeout
+from search.views import search_body, answer_question, needs_answer, hit_to_dict, \
+    hits_total, total_page_nums, hot_keywords
+from search.metrics import RequestTrace
+
+async_client = get_async_es_client()
+# 模型推理线程池, 等待中的推理请求数不超过INFERENCE_QUEUE
+inference_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_SEARCH["INFERENCE_WORKERS"])
+_inference_slots = None
+
+
+def inference_slots():
+    # semaphore需要在事件循环内创建
+    global _inference_slots
+    if _inference_slots is None:
+        _inference_slots = asyncio.Semaphore(settings.ASYNC_SEARCH["INFERENCE_QUEUE"])
+    return _inference_slots
+
+
+async def incr_and_topn(key_words, trace):
+    """排行榜大多数情况下只访问本地缓存, 偶尔的redis往返放到默认线程池"""
+    loop = asyncio.get_running_loop()
+    with trace.stage("leaderboard"):
+        return await loop.run_in_executor(None, hot_keywords.incr_and_top, key_words)
+
+
+async def timed_search(s_type, key_words, page, trace):
+    """返回es结果和用时"""
+    if s_type in ("article", "question"):
+        with trace.stage("es_search"):
+            response = await async_client.search(
+                index="electric_power",
+                request_timeout=search_timeout(),
+                body=search_body(s_type, key_words, page))
+    else:
+        response = {"hits": {"total": 0, "hits": []}}
+    return response, trace.stages.get("es_search", 0.0)
+
+
+async def async_answer_question(key_words, content, trace):
+    async with inference_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            inference_executor, answer_question, key_words, content, trace)
+
+
+async def hit_content(hit, s_type, key_words, trace):
+    if s_type == "question" and needs_answer(hit):
+        return await async_answer_question(key_words, hit["_source"]["content"], trace)
+    return hit["_source"]["content"][:200]
+
+
+class AsyncSearchSuggest(View):
+    """搜索建议"""
+
+    async def get(self, request):
+        key_words = request.GET.get('s', '')
+        current_type = request.GET.get('s_type', '')
+        return_suggest_list = []
+        if current_type == "article" and key_words:
+            with RequestTrace("suggest") as trace:
+                """fuzzy模糊搜索, fuzziness 编辑距离"""
+                with trace.stage("es_suggest"):
+                    response = await async_client.search(
+                        index="electric_power",
+                        body={
+                            "suggest": {
+                                "my_suggest": {
+                                    "text": key_words,
+                                    "completion": {
+                                        "field": "suggest",
+                                        "fuzzy": {"fuzziness": 2},
+                                        "size": 10
+                                    }
+                                }
+                            },
+                            "_source": ["title"]
+                        })
+                for match in response["suggest"]["my_suggest"][0]["options"][:10]:
+                    return_suggest_list.append(match["_source"]["title"])
+        return HttpResponse(
+            json.dumps(return_suggest_list),
+            content_type="application/json")
+
+
+class AsyncSearchView(View):
+
+    async def get(self, request):
+        with RequestTrace("search", s_type=request.GET.get("s_type", "")) as trace:
+            return await self.search(request, trace)
+
+    @staticmethod
+    async def search(request, trace):
+        key_words = request.GET.get("q", "")
+        page = request.GET.get("p", "1")
+        try:
+            page = int(page)
+        except BaseException:
+            page = 1
+        s_type = request.GET.get("s_type", "")
+
+        # redis排行榜与es搜索并发执行
+        topn_search, (response, last_seconds) = await asyncio.gather(
+            incr_and_topn(key_words, trace), timed_search(s_type, key_words, page, trace))
+
+        hits = response["hits"]["hits"]
+        contents = await asyncio.gather(
+            *[hit_content(hit, s_type, key_words, trace) for hit in hits],
+            return_exceptions=True)
+        hit_list = []
+        error_nums = 0
+        for hit, content in zip(hits, contents):
+            try:
+                if isinstance(content, Exception):
+                    raise content
+                hit_list.append(hit_to_dict(hit, content))
+            except Exception:
+                error_nums = error_nums + 1
+                trace.error("hit")
+        total_nums = hits_total(response)
+
+        page_nums = total_page_nums(total_nums, page)
+        with trace.stage("render"):
+            return render(request, "result.html", {"page": page,
+                                                   "all_hits": hit_list,
+                                                   "key_words": key_words,
+                                                   "total_nums": total_nums,
+                                                   "page_nums": page_nums,
+                                                   "last_seconds": last_seconds,
+                                                   "topn_search": topn_search,
+                                                   })
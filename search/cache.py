@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from search.metrics import timer
+
+
+def checkpoint_id(model_dir, model_prefix):
+    """模型checkpoint标识, 重新训练保存后缓存自动失效"""
+    index_path = os.path.join(model_dir, model_prefix + ".index")
+    try:
+        return "{}:{}".format(model_prefix, int(os.path.getmtime(index_path)))
+    except OSError:
+        return model_prefix
+
+
+class AnswerCache(object):
+    """
+    问答结果缓存: 进程内TTL+LRU, 可选redis作为二级缓存
+    model_id为模型标识, 也可以是返回标识的函数(在第一次查询时才调用, 例如加载模型后读取导出版本)
+    """
+
+    def __init__(self, max_size=1024, ttl=600, redis_client=None,
+                 key_prefix="qa_answer:", model_id=""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self._model_id = model_id
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def model_id(self):
+        if callable(self._model_id):
+            self._model_id = self._model_id()
+        return self._model_id
+
+    def make_key(self, question, documents):
+        """key = 归一化问题 + 文档内容hash + 模型checkpoint"""
+        question = " ".join(question.split()).lower()
+        doc_hash = hashlib.sha1(json.dumps(
+            documents, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+        raw_key = "\x00".join([self.model_id, question, doc_hash])
+        return self.key_prefix + hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not None:
+            self._count(local=True)
+            return value
+        if self.redis_client is not None:
+            try:
+                with timer("redis_cache_get"):
+                    cached = self.redis_client.get(key)
+            except Exception:
+                cached = None
+            if cached is not None:
+                value = json.loads(cached)
+                self._set_local(key, value)
+                self._count(redis=True)
+                return value
+        self._count()
+        return None
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        if self.redis_client is not None:
+            try:
+                with timer("redis_cache_set"):
+                    self.redis_client.setex(key, self.ttl, json.dumps(value, ensure_ascii=False))
+            except Exception:
+                pass
+
+    def get_or_compute(self, question, documents, compute):
+        """命中直接返回, 否则调用compute()生成答案并写入缓存"""
+        key = self.make_key(question, documents)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def _count(self, local=False, redis=False):
+        with self._lock:
+            if local:
+                self.hits += 1
+                self.local_hits += 1
+            elif redis:
+                self.hits += 1
+                self.redis_hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "local_hits": self.local_hits,
+                    "redis_hits": self.redis_hits,
+                    "misses": self.misses,
+                    "size": len(self._local)}
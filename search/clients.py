@@ -0,0 +1,78 @@
+"""
+es与redis客户端工厂, 参数来自settings.ELASTICSEARCH / settings.REDIS
+每个进程只创建一次, 所有视图和ElectricPowerIndex共用同一个连接池
+"""
+import threading
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from elasticsearch import Elasticsearch
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _es_kwargs():
+    conf = settings.ELASTICSEARCH
+    return {
+        "hosts": conf["HOSTS"],
+        "timeout": conf["TIMEOUT"],
+        "maxsize": conf["MAXSIZE"],
+        "max_retries": conf["MAX_RETRIES"],
+        "retry_on_timeout": conf["RETRY_ON_TIMEOUT"],
+        "sniff_on_start": conf["SNIFF_ON_START"],
+        "sniff_on_connection_fail": conf["SNIFF_ON_CONNECTION_FAIL"],
+        "sniffer_timeout": conf["SNIFFER_TIMEOUT"],
+    }
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def get_es_client():
+    """同步es客户端, urllib3连接池默认keep-alive"""
+    return _get_or_create("es", lambda: Elasticsearch(**_es_kwargs()))
+
+
+def get_async_es_client():
+    """异步视图使用的es客户端, 需要elasticsearch-py>=7.8并安装aiohttp(pip install "elasticsearch[async]>=7.8")"""
+    def factory():
+        try:
+            from elasticsearch import AsyncElasticsearch
+        except ImportError:
+            raise ImproperlyConfigured(
+                'async views need elasticsearch-py>=7.8 with aiohttp: pip install "elasticsearch[async]>=7.8"')
+        return AsyncElasticsearch(**_es_kwargs())
+    return _get_or_create("async_es", factory)
+
+
+def get_redis_client():
+    """共用连接池的redis客户端, 连接用完时等待空闲连接, 超过POOL_TIMEOUT秒才报错"""
+    def factory():
+        conf = settings.REDIS
+        pool = redis.BlockingConnectionPool(
+            host=conf["HOST"],
+            port=conf["PORT"],
+            db=conf["DB"],
+            max_connections=conf["MAX_CONNECTIONS"],
+            timeout=conf["POOL_TIMEOUT"],
+            socket_timeout=conf["SOCKET_TIMEOUT"],
+            socket_connect_timeout=conf["SOCKET_CONNECT_TIMEOUT"],
+            socket_keepalive=True,
+            retry_on_timeout=conf["RETRY_ON_TIMEOUT"],
+            health_check_interval=conf["HEALTH_CHECK_INTERVAL"])
+        return redis.StrictRedis(connection_pool=pool)
+    return _get_or_create("redis", factory)
+
+
+def search_timeout():
+    """单次搜索请求的超时时间(秒)"""
+    return settings.ELASTICSEARCH["SEARCH_TIMEOUT"]
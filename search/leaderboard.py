@@ -0,0 +1,166 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from search.metrics import timer
+
+logger = logging.getLogger("search.leaderboard")
+
+
+class HotKeywordLeaderboard(object):
+    """
+    热搜排行榜
+    搜索词先在本地累加, 每flush_interval秒通过一次pipeline批量写入redis;
+    topn在进程内缓存refresh_interval秒, 刷新时与写入合并为一次往返.
+    window不为None时按bucket_seconds分桶计数, 只统计最近window秒(可按decay衰减旧桶).
+    后台线程每flush_interval秒写入一次, 没有请求时计数也不会一直积压, 进程退出时再写入一次.
+    redis出错时本地计数放回待写入, 下次重试, 视图继续使用旧的topn.
+    """
+
+    def __init__(self, redis_client, key="search_keywords_set", top_n=5,
+                 refresh_interval=5, flush_interval=1,
+                 window=None, bucket_seconds=300, decay=1.0):
+        self.redis_client = redis_client
+        self.key = key
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.decay = decay
+
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.time()
+        self._topn = []
+        self._last_refresh = 0
+        self._flusher_pid = None
+        self._stopped = threading.Event()
+
+    def _bucket_key(self, bucket):
+        return "{}:{}".format(self.key, bucket)
+
+    def _window_key(self):
+        return "{}:window".format(self.key)
+
+    def _queue_increments(self, pipe, pending, now):
+        bucket = int(now // self.bucket_seconds)
+        for keyword, count in pending.items():
+            pipe.zincrby(self.key, count, keyword)
+            if self.window is not None:
+                pipe.zincrby(self._bucket_key(bucket), count, keyword)
+        if self.window is not None and pending:
+            pipe.expire(self._bucket_key(bucket), self.window + self.bucket_seconds)
+
+    def _queue_topn(self, pipe, now):
+        if self.window is None:
+            pipe.zrevrangebyscore(self.key, "+inf", "-inf", start=0, num=self.top_n)
+            return
+        # 最近window秒的桶做并集, 越旧的桶权重越低
+        current = int(now // self.bucket_seconds)
+        bucket_num = max(1, int(self.window // self.bucket_seconds))
+        weights = {self._bucket_key(current - age): self.decay ** age for age in range(bucket_num)}
+        pipe.zunionstore(self._window_key(), weights)
+        pipe.zrevrangebyscore(self._window_key(), "+inf", "-inf", start=0, num=self.top_n)
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.time()
+        return pending
+
+    def _restore_pending(self, pending):
+        """写入失败的计数放回, 与期间新增的计数合并"""
+        with self._lock:
+            self._pending.update(pending)
+
+    def flush(self):
+        """把本地累加的搜索次数写入redis, 失败时保留计数并返回False"""
+        pending = self._take_pending()
+        if not pending:
+            return True
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._queue_increments(pipe, pending, time.time())
+        try:
+            with timer("redis_leaderboard_flush"):
+                pipe.execute()
+        except Exception:
+            self._restore_pending(pending)
+            logger.exception("failed to flush %d hot keywords", len(pending))
+            return False
+        return True
+
+    def refresh(self):
+        """写入本地计数并重新读取topn, 只用一次往返; 失败时返回旧的topn"""
+        pending = self._take_pending()
+        now = time.time()
+        # 窗口统计的临时集合被多个进程共用, 用事务保证并集和读取之间不被覆盖
+        pipe = self.redis_client.pipeline(transaction=self.window is not None)
+        self._queue_increments(pipe, pending, now)
+        self._queue_topn(pipe, now)
+        try:
+            with timer("redis_leaderboard_refresh"):
+                results = pipe.execute()
+        except Exception:
+            self._restore_pending(pending)
+            logger.exception("failed to refresh the hot keywords")
+            # refresh_interval秒后再重试, 不让每个请求都等redis超时
+            with self._lock:
+                self._last_refresh = now
+                return list(self._topn)
+        topn = [str(keyword, encoding="utf-8") for keyword in results[-1]]
+        with self._lock:
+            self._topn = topn
+            self._last_refresh = now
+        return topn
+
+    def _ensure_flusher(self):
+        """每个进程第一次计数时启动后台写入线程, fork出的worker各自启动"""
+        if self.flush_interval <= 0 or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        flusher = threading.Thread(target=self._flush_periodically, name="hot-keywords-flusher")
+        flusher.daemon = True
+        flusher.start()
+        atexit.register(self.close)
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """停止后台线程并写入剩余计数"""
+        self._stopped.set()
+        self.flush()
+
+    def incr(self, keyword):
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[keyword] += 1
+            should_flush = time.time() - self._last_flush >= self.flush_interval
+        if should_flush:
+            self.flush()
+
+    def top(self):
+        with self._lock:
+            if time.time() - self._last_refresh < self.refresh_interval:
+                return list(self._topn)
+        return self.refresh()
+
+    def incr_and_top(self, keyword):
+        """搜索页: 关键词加1并返回topn"""
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[keyword] += 1
+        if self.flush_interval <= 0:
+            return self.refresh()
+        topn = self.top()
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return topn
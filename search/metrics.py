@@ -0,0 +1,334 @@
+"""
+轻量的进程内指标: 计数器和直方图, 以prometheus文本格式在/metrics/输出
+每个请求的各阶段耗时和异常另写一行json结构化日志(logger: search.metrics)
+每个worker进程单独统计; 多个worker共用/metrics/时, 由configure指定共享目录,
+各进程定期把快照写入该目录, /metrics/读取所有进程的快照相加后输出.
+未指定目录时/metrics/只有处理本次抓取的那个进程的指标, 只适用于单进程部署.
+"""
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("search.metrics")
+
+# 秒, 覆盖redis往返到模型推理
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter(object):
+    """只增不减的计数, 按标签值分别累加"""
+    type_name = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"type": self.type_name, "documentation": self.documentation,
+                "label_names": list(self.label_names), "values": values}
+
+    def merge(self, snapshot):
+        """加上另一个进程的快照"""
+        with self._lock:
+            for key, value in snapshot["values"]:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ["{}{} {}".format(self.name, _format_labels(self.label_names, key), _format_value(value))
+                for key, value in values]
+
+
+class Histogram(object):
+    """耗时分布: 每个标签值一组累计桶, 以及总和与次数"""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+        return {"type": self.type_name, "documentation": self.documentation,
+                "label_names": list(self.label_names), "buckets": list(self.buckets[:-1]), "values": values}
+
+    def merge(self, snapshot):
+        """加上另一个进程的快照, 桶不同(新旧版本的进程同时在线)时忽略"""
+        if list(snapshot["buckets"]) != list(self.buckets[:-1]):
+            return
+        with self._lock:
+            for key, counts, total in snapshot["values"]:
+                key = tuple(key)
+                old_counts, old_total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+                self._values[key] = ([old + new for old, new in zip(old_counts, counts)], old_total + total)
+
+    def lines(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, _format_labels(self.label_names, key, [("le", _format_value(bound))]), cumulative))
+            labels = _format_labels(self.label_names, key)
+            lines.append("{}_sum{} {}".format(self.name, labels, _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+class Registry(object):
+    """
+    指标注册表, 同名指标只创建一次
+    multiprocess_dir不为None时, 每个进程每flush_interval秒把快照写入该目录下的metrics_<pid>.json,
+    render输出目录中所有进程的快照之和. 退出的worker的快照保留, 计数器不会因worker重启而减少;
+    目录需在部署启动前清空, 否则会加上上次运行的计数.
+    """
+
+    def __init__(self, multiprocess_dir=None, flush_interval=1):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.configure(multiprocess_dir, flush_interval)
+        self._write_lock = threading.Lock()
+        self._written = None
+        self._writer_pid = None
+        self._stopped = threading.Event()
+
+    def configure(self, multiprocess_dir=None, flush_interval=1):
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+        self.multiprocess_dir = multiprocess_dir or None
+        self.flush_interval = flush_interval
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, label_names, buckets)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def merge(self, snapshot):
+        for name, metric in snapshot.items():
+            if metric["type"] == Counter.type_name:
+                self.counter(name, metric["documentation"], metric["label_names"]).merge(metric)
+            else:
+                self.histogram(name, metric["documentation"], metric["label_names"],
+                               metric["buckets"]).merge(metric)
+
+    def write_snapshot(self):
+        """把本进程的快照写入共享目录, 与上次写入相同时跳过"""
+        if self.multiprocess_dir is None:
+            return
+        data = json.dumps(self.snapshot(), ensure_ascii=False, sort_keys=True)
+        with self._write_lock:
+            if data == self._written:
+                return
+            path = os.path.join(self.multiprocess_dir, "metrics_{}.json".format(os.getpid()))
+            # 先写临时文件再替换, 读取的进程不会读到写了一半的快照
+            with open(path + ".tmp", "w", encoding="utf-8") as fout:
+                fout.write(data)
+            os.replace(path + ".tmp", path)
+            self._written = data
+
+    def read_snapshots(self):
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.multiprocess_dir, "metrics_*.json"))):
+            try:
+                with open(path, encoding="utf-8") as fin:
+                    snapshots.append(json.load(fin))
+            except (OSError, ValueError):
+                logger.exception("failed to read the metrics of %s", path)
+        return snapshots
+
+    def ensure_writer(self):
+        """每个进程第一次记录时启动后台写入线程, fork出的worker各自启动"""
+        if self.multiprocess_dir is None or self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        writer = threading.Thread(target=self._write_periodically, name="metrics-writer")
+        writer.daemon = True
+        writer.start()
+        atexit.register(self.write_snapshot)
+
+    def _write_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.write_snapshot()
+            except Exception:
+                logger.exception("failed to write the metrics to %s", self.multiprocess_dir)
+
+    def render(self):
+        """prometheus文本格式, 多进程时为所有进程之和"""
+        if self.multiprocess_dir is None:
+            return self._render()
+        self.write_snapshot()
+        merged = Registry()
+        for snapshot in self.read_snapshots():
+            merged.merge(snapshot)
+        return merged._render()
+
+    def _render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type_name))
+            lines.extend(metric.lines())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_seconds", "Seconds spent in each stage of the search requests", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "search_stage_errors_total", "Exceptions raised in each stage of the search requests", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "search_request_seconds", "Seconds spent in each view", ["view"])
+REQUESTS = REGISTRY.counter(
+    "search_requests_total", "Requests of each view, with status error if any of their stages failed", ["view", "status"])
+
+
+@contextmanager
+def timer(stage, trace=None):
+    """记录一个阶段的耗时, 异常计数后照常抛出; trace不为None时同时记入该请求"""
+    start_time = time.time()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        if trace is not None:
+            trace.add_error(stage)
+        raise
+    finally:
+        seconds = time.time() - start_time
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        REGISTRY.ensure_writer()
+        if trace is not None:
+            trace.add_seconds(stage, seconds)
+
+
+class RequestTrace(object):
+    """
+    一个请求的各阶段耗时和异常, 结束时计入请求指标并写一行json日志
+    作为with语句使用时, 视图抛出异常也会结束并记为error
+    """
+
+    def __init__(self, view, **fields):
+        self.view = view
+        self.fields = fields
+        self.stages = {}
+        self.errors = {}
+        self._start_time = time.time()
+        # 异步视图的推理在线程池中执行, 各阶段可能并发写入
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return timer(name, self)
+
+    def add_seconds(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_error(self, stage):
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def error(self, stage):
+        """记录在视图中被捕获的异常, 不再抛出"""
+        STAGE_ERRORS.inc(stage=stage)
+        self.add_error(stage)
+        logger.exception("%s failed in %s", stage, self.view)
+
+    def finish(self, exception=None):
+        """exception为视图抛出的异常, 此时请求记为error"""
+        seconds = time.time() - self._start_time
+        status = "error" if self.errors or exception is not None else "ok"
+        REQUEST_SECONDS.observe(seconds, view=self.view)
+        REQUESTS.inc(view=self.view, status=status)
+        REGISTRY.ensure_writer()
+        record = dict(self.fields)
+        record.update({"view": self.view,
+                       "status": status,
+                       "seconds": round(seconds, 6),
+                       "stages": {stage: round(value, 6) for stage, value in self.stages.items()},
+                       "errors": self.errors})
+        if exception is not None:
+            record["exception"] = "{}: {}".format(type(exception).__name__, exception)
+        logger.info(json.dumps(record, ensure_ascii=False))
+        return seconds
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish(exc_value)
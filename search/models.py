@@ -2,7 +2,11 @@ from elasticsearch_dsl import Text, Date, Keyword, Integer, Document, Completion
 from elasticsearch_dsl.connections import connections
 from elasticsearch_dsl import analyzer
 
-connections.create_connection(hosts=["localhost"])
+from search.clients import get_es_client
+
+# 与视图共用同一个es客户端和连接池
+# 单独运行时: DJANGO_SETTINGS_MODULE=topSearch.settings python -m search.models
+connections.add_connection("default", get_es_client())
 
 my_analyzer = analyzer('ik_smart')
 
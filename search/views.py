@@ -5,14 +5,41 @@ import json
 from django.views.generic.base import View
 from search.models import ElectricPowerIndex
 from django.http import HttpResponse
-from datetime import datetime
-import redis
-from elasticsearch import Elasticsearch
+from django.conf import settings
 from bidaf.predict_one import *
-
-client = Elasticsearch(hosts=["localhost"])
+from search.clients import get_es_client, get_redis_client, search_timeout
+from search.cache import AnswerCache, checkpoint_id
+from search.metrics import REGISTRY, RequestTrace, timer
+from search.leaderboard import HotKeywordLeaderboard
+from predictor import get_predictor
+
+client = get_es_client()
+# 多个worker时各进程的指标写入共享目录, /metrics/输出所有进程之和
+REGISTRY.configure(settings.METRICS["MULTIPROCESS_DIR"], settings.METRICS["FLUSH_SECONDS"])
 # 使用redis实现top-n排行榜
-redis_cli = redis.StrictRedis()
+redis_cli = get_redis_client()
+hot_keywords = HotKeywordLeaderboard(
+    redis_cli,
+    top_n=settings.HOT_KEYWORDS["TOP_N"],
+    refresh_interval=settings.HOT_KEYWORDS["REFRESH_SECONDS"],
+    flush_interval=settings.HOT_KEYWORDS["FLUSH_SECONDS"],
+    window=settings.HOT_KEYWORDS["WINDOW_SECONDS"],
+    bucket_seconds=settings.HOT_KEYWORDS["BUCKET_SECONDS"],
+    decay=settings.HOT_KEYWORDS["DECAY"])
+# 模型session配置, 在第一次请求加载模型前生效
+for key, value in settings.QA_SESSION.items():
+    setattr(args, key.lower(), value)
+# 问答结果缓存, 相同问题+相同文档直接返回答案
+# 使用导出模型时以加载的版本目录和版本号区分, 部署新版本后旧答案自动失效
+if getattr(args, "export_dir", None):
+    model_id = lambda: get_predictor(args).model_id
+else:
+    model_id = checkpoint_id(args.model_dir, args.algo)
+answer_cache = AnswerCache(
+    max_size=settings.ANSWER_CACHE["MAX_SIZE"],
+    ttl=settings.ANSWER_CACHE["TTL"],
+    redis_client=redis_cli if settings.ANSWER_CACHE["USE_REDIS"] else None,
+    model_id=model_id)
 
 
 class IndexView(View):
@@ -20,13 +47,7 @@ class IndexView(View):
 
     @staticmethod
     def get(request):
-        topn_search_clean = []
-        topn_search = redis_cli.zrevrangebyscore(
-            "search_keywords_set", "+inf", "-inf", start=0, num=5)
-        for topn_key in topn_search:
-            topn_key = str(topn_key, encoding="utf-8")
-            topn_search_clean.append(topn_key)
-        topn_search = topn_search_clean
+        topn_search = hot_keywords.top()
         return render(request, "index.html", {"topn_search": topn_search})
 
 
@@ -39,40 +60,123 @@ class SearchSuggest(View):
         current_type = request.GET.get('s_type', '')
         if current_type == "article":
             return_suggest_list = []
-            if key_words:
-                s = ElectricPowerIndex.search()
-                """fuzzy模糊搜索, fuzziness 编辑距离, prefix_length前面不变化的前缀长度"""
-                s = s.suggest('my_suggest', key_words, completion={
-                    "field": "suggest", "fuzzy": {
-                        "fuzziness": 2
-                    },
-                    "size": 10
-                })
-                suggestions = s.execute()
-                for match in suggestions.suggest.my_suggest[0].options[:10]:
-                    source = match._source
-                    return_suggest_list.append(source["title"])
+            with RequestTrace("suggest") as trace:
+                if key_words:
+                    s = ElectricPowerIndex.search()
+                    """fuzzy模糊搜索, fuzziness 编辑距离, prefix_length前面不变化的前缀长度"""
+                    s = s.suggest('my_suggest', key_words, completion={
+                        "field": "suggest", "fuzzy": {
+                            "fuzziness": 2
+                        },
+                        "size": 10
+                    })
+                    with trace.stage("es_suggest"):
+                        suggestions = s.execute()
+                    for match in suggestions.suggest.my_suggest[0].options[:10]:
+                        source = match._source
+                        return_suggest_list.append(source["title"])
             return HttpResponse(
                 json.dumps(return_suggest_list),
                 content_type="application/json")
 
 
+def search_body(s_type, key_words, page):
+    """文章搜索返回10条并高亮, 问答只取最相关的1条"""
+    body = {
+        "query": {
+            "multi_match": {
+                "query": key_words,
+                "fields": ["tags", "title", "content"]
+            }
+        },
+        "from": (page - 1) * 10,
+        "size": 10 if s_type == "article" else 1,
+    }
+    if s_type == "article":
+        body["highlight"] = {
+            "pre_tags": ['<span class="keyWord">'],
+            "post_tags": ['</span>'],
+            "fields": {
+                "title": {},
+                "content": {},
+            }
+        }
+    return body
+
+
+def answer_question(key_words, content, trace=None):
+    """调用bi-daf进行答案生成, 先查缓存; trace记录分词和推理耗时"""
+    input_data = {
+        "documents": content,
+        "question": key_words,
+        "question_type": "ENTITY",
+        "fact_or_opinion": "FACT"
+    }
+
+    def compute():
+        with timer("segmentation", trace):
+            sample = data_precess(input_data)
+        with timer("inference", trace):
+            return predict_one(args, sample)
+
+    with timer("answer", trace):
+        return answer_cache.get_or_compute(key_words, content, compute)
+
+
+def needs_answer(hit):
+    """问答结果没有高亮内容时需要模型生成答案"""
+    return "content" not in hit.get("highlight", {})
+
+
+def hit_to_dict(hit, content):
+    """es命中结果转为模板字段, content为非高亮时展示的内容"""
+    highlight = hit.get("highlight", {})
+    hit_dict = {}
+    if "title" in highlight:
+        hit_dict["title"] = "".join(highlight["title"])
+    else:
+        hit_dict["title"] = hit["_source"]["title"]
+    if "content" in highlight:
+        hit_dict["content"] = "".join(highlight["content"])
+    else:
+        hit_dict["content"] = content
+    hit_dict["publish_date"] = hit["_source"]["publish_time"]
+    hit_dict["crawl_date"] = hit["_source"]["crawl_time"]
+    hit_dict["url"] = hit["_source"]["url"]
+    hit_dict["score"] = hit["_score"]
+    hit_dict["source_site"] = hit["_source"]["website_name"]
+    return hit_dict
+
+
+def hits_total(response):
+    """命中总数: es6及以前为整数, es7为{"value": ..., "relation": ...}"""
+    total = response["hits"]["total"]
+    if isinstance(total, dict):
+        return int(total["value"])
+    return int(total)
+
+
+def total_page_nums(total_nums, page):
+    # 计算出总页数
+    if (page % 10) > 0:
+        return int(total_nums / 10) + 1
+    return int(total_nums / 10)
+
+
 class SearchView(View):
 
     def get(self, request):
+        with RequestTrace("search", s_type=request.GET.get("s_type", "")) as trace:
+            return self.search(request, trace)
+
+    @staticmethod
+    def search(request, trace):
         key_words = request.GET.get("q", "")
 
         # 通用部分
-        # 实现搜索关键词keyword加1操作
-        redis_cli.zincrby("search_keywords_set", 1, key_words)
-        # 获取topn个搜索词
-        topn_search_clean = []
-        topn_search = redis_cli.zrevrangebyscore(
-            "search_keywords_set", "+inf", "-inf", start=0, num=5)
-        for topn_key in topn_search:
-            topn_key = str(topn_key, encoding="utf-8")
-            topn_search_clean.append(topn_key)
-        topn_search = topn_search_clean
+        # 实现搜索关键词keyword加1操作, 并获取topn个搜索词
+        with trace.stage("leaderboard"):
+            topn_search = hot_keywords.incr_and_top(key_words)
 
         # 当前要获取第几页的数据
         page = request.GET.get("p", "1")
@@ -80,118 +184,58 @@ class SearchView(View):
             page = int(page)
         except BaseException:
             page = 1
-        article_response = []
-        question_response = []
-        start_time = datetime.now()
+        response = {"hits": {"total": 0, "hits": []}}
         s_type = request.GET.get("s_type", "")
-        if s_type == "article":
-            article_response = client.search(
-                index="electric_power",
-                request_timeout=60,
-                body={
-                    "query": {
-                        "multi_match": {
-                            "query": key_words,
-                            "fields": ["tags", "title", "content"]
-                        }
-                    },
-                    "from": (page - 1) * 10,
-                    "size": 10,
-                    "highlight": {
-                        "pre_tags": ['<span class="keyWord">'],
-                        "post_tags": ['</span>'],
-                        "fields": {
-                            "title": {},
-                            "content": {},
-                        }
-                    }
-                }
-            )
-
-        elif s_type == "question":
-            question_response = client.search(
-                index="electric_power",
-                request_timeout=60,
-                body={
-                    "query": {
-                        "multi_match": {
-                            "query": key_words,
-                            "fields": ["tags", "title", "content"]
-                        }
-                    },
-                    "from": (page - 1) * 10,
-                    "size": 1,
-                }
-            )
-        end_time = datetime.now()
-        last_seconds = (end_time - start_time).total_seconds()
+        if s_type in ("article", "question"):
+            with trace.stage("es_search"):
+                response = client.search(
+                    index="electric_power",
+                    request_timeout=search_timeout(),
+                    body=search_body(s_type, key_words, page)
+                )
+        last_seconds = trace.stages.get("es_search", 0.0)
 
         hit_list = []
         error_nums = 0
-        if s_type == "article":
-            for hit in article_response["hits"]["hits"]:
-                hit_dict = {}
-                try:
-                    if "title" in hit["highlight"]:
-                        hit_dict["title"] = "".join(hit["highlight"]["title"])
-                    else:
-                        hit_dict["title"] = hit["_source"]["title"]
-                    if "content" in hit["highlight"]:
-                        hit_dict["content"] = "".join(
-                            hit["highlight"]["content"])
-                    else:
-                        hit_dict["content"] = hit["_source"]["content"][:200]
-                    hit_dict["publish_date"] = hit["_source"]["publish_time"]
-                    hit_dict["crawl_date"] = hit["_source"]["crawl_time"]
-                    hit_dict["url"] = hit["_source"]["url"]
-                    hit_dict["score"] = hit["_score"]
-                    hit_dict["source_site"] = hit["_source"]["website_name"]
-                    hit_list.append(hit_dict)
-                except:
-                    error_nums = error_nums + 1
-        elif s_type == "question":
-            for hit in question_response["hits"]["hits"]:
-                hit_dict = {}
-                try:
-                    if "title" in hit["highlight"]:
-                        hit_dict["title"] = "".join(hit["highlight"]["title"])
-                    else:
-                        hit_dict["title"] = hit["_source"]["title"]
-                    if "content" in hit["highlight"]:
-                        hit_dict["content"] = "".join(
-                            hit["highlight"]["content"])
-                    else:
-                        content = hit["_source"]["content"]
-                        input_data = {
-                            "documents": content,
-                            "question": key_words,
-                            "question_type": "ENTITY",
-                            "fact_or_opinion": "FACT"
-                        }
-                        # 调用bi-daf进行答案生成
-                        process_data = data_precess(input_data)
-                        predict_output = predict_one(args, process_data)
-                        hit_dict["content"] = predict_output
-                    hit_dict["publish_date"] = hit["_source"]["publish_time"]
-                    hit_dict["crawl_date"] = hit["_source"]["crawl_time"]
-                    hit_dict["url"] = hit["_source"]["url"]
-                    hit_dict["score"] = hit["_score"]
-                    hit_dict["source_site"] = hit["_source"]["website_name"]
-                    hit_list.append(hit_dict)
-                except:
-                    error_nums = error_nums + 1
-        total_nums = int(article_response["hits"]["total"])
-
-        # 计算出总页数
-        if (page % 10) > 0:
-            page_nums = int(total_nums / 10) + 1
-        else:
-            page_nums = int(total_nums / 10)
-        return render(request, "result.html", {"page": page,
-                                               "all_hits": hit_list,
-                                               "key_words": key_words,
-                                               "total_nums": total_nums,
-                                               "page_nums": page_nums,
-                                               "last_seconds": last_seconds,
-                                               "topn_search": topn_search,
-                                               })
+        for hit in response["hits"]["hits"]:
+            try:
+                if s_type == "question" and needs_answer(hit):
+                    content = answer_question(key_words, hit["_source"]["content"], trace)
+                else:
+                    content = hit["_source"]["content"][:200]
+                hit_list.append(hit_to_dict(hit, content))
+            except Exception:
+                error_nums = error_nums + 1
+                trace.error("hit")
+        total_nums = hits_total(response)
+
+        page_nums = total_page_nums(total_nums, page)
+        with trace.stage("render"):
+            return render(request, "result.html", {"page": page,
+                                                   "all_hits": hit_list,
+                                                   "key_words": key_words,
+                                                   "total_nums": total_nums,
+                                                   "page_nums": page_nums,
+                                                   "last_seconds": last_seconds,
+                                                   "topn_search": topn_search,
+                                                   })
+
+
+class MetricsView(View):
+    """prometheus抓取的各阶段耗时与异常计数"""
+
+    @staticmethod
+    def get(request):
+        return HttpResponse(
+            REGISTRY.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class AnswerCacheStats(View):
+    """问答缓存命中统计"""
+
+    @staticmethod
+    def get(request):
+        return HttpResponse(
+            json.dumps(answer_cache.stats()),
+            content_type="application/json")
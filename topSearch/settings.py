@@ -124,4 +124,96 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = "/media/"
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static')
-]
\ No newline at end of file
+]
+
+# 问答结果缓存, TTL单位为秒, USE_REDIS开启后多个worker共享缓存
+ANSWER_CACHE = {
+    "MAX_SIZE": 1024,
+    "TTL": 600,
+    "USE_REDIS": True,
+}
+
+# 问答模型的tf session: 每个worker的intra/inter op线程数(0为tensorflow默认, 即全部核), XLA JIT, 图优化级别L0/L1
+# 同一台机器部署多个worker时, 各worker线程数之和不超过核数, 避免cpu超额订阅
+QA_SESSION = {
+    "INTRA_OP_THREADS": 0,
+    "INTER_OP_THREADS": 0,
+    "XLA": False,
+    "OPT_LEVEL": "L1",
+}
+
+# 异步搜索视图(django>=3.1, asgi部署), 模型推理线程数与最大排队数
+ASYNC_SEARCH = {
+    "ENABLED": False,
+    "INFERENCE_WORKERS": 4,
+    "INFERENCE_QUEUE": 32,
+}
+
+# 热搜排行榜: 本地累加FLUSH_SECONDS秒后批量写入redis, topn本地缓存REFRESH_SECONDS秒
+# WINDOW_SECONDS为None时统计全部历史, 否则按BUCKET_SECONDS分桶统计最近一段时间, DECAY为旧桶权重衰减
+HOT_KEYWORDS = {
+    "TOP_N": 5,
+    "REFRESH_SECONDS": 5,
+    "FLUSH_SECONDS": 1,
+    "WINDOW_SECONDS": None,
+    "BUCKET_SECONDS": 300,
+    "DECAY": 1.0,
+}
+
+# es客户端: TIMEOUT为默认请求超时, SEARCH_TIMEOUT为搜索请求超时, MAXSIZE为每个节点的连接池大小
+# MAX_RETRIES只重试连接错误; RETRY_ON_TIMEOUT为True时超时也重试,
+# 一次搜索最多占用worker (MAX_RETRIES + 1) * SEARCH_TIMEOUT秒, 开启前应调小SEARCH_TIMEOUT
+ELASTICSEARCH = {
+    "HOSTS": ["localhost"],
+    "TIMEOUT": 10,
+    "SEARCH_TIMEOUT": 60,
+    "MAXSIZE": 25,
+    "MAX_RETRIES": 2,
+    "RETRY_ON_TIMEOUT": False,
+    "SNIFF_ON_START": False,
+    "SNIFF_ON_CONNECTION_FAIL": False,
+    "SNIFFER_TIMEOUT": 60,
+}
+
+# redis连接池, 所有视图共用; 连接用完时最多等待POOL_TIMEOUT秒, 而不是直接报错
+REDIS = {
+    "HOST": "localhost",
+    "PORT": 6379,
+    "DB": 0,
+    "MAX_CONNECTIONS": 50,
+    "POOL_TIMEOUT": 1,
+    "SOCKET_TIMEOUT": 1,
+    "SOCKET_CONNECT_TIMEOUT": 1,
+    "RETRY_ON_TIMEOUT": True,
+    "HEALTH_CHECK_INTERVAL": 30,
+}
+
+# /metrics/的prometheus指标在每个worker进程内统计. MULTIPROCESS_DIR为None时只输出处理该次抓取的进程的指标,
+# 只适用于单进程部署(runserver或单个worker); 多个worker(gunicorn/uwsgi/uvicorn --workers)时必须设为同一台机器上
+# 所有worker共用的目录, 各进程每FLUSH_SECONDS秒写入一次快照, /metrics/输出所有进程之和. 该目录需在启动前清空
+METRICS = {
+    "MULTIPROCESS_DIR": None,
+    "FLUSH_SECONDS": 1,
+}
+
+# 每个请求一行json结构化日志(各阶段耗时与异常), 指标在/metrics/以prometheus文本格式输出
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json_line": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "metrics_console": {
+            "class": "logging.StreamHandler",
+            "formatter": "json_line",
+        },
+    },
+    "loggers": {
+        "search.metrics": {
+            "handlers": ["metrics_console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
@@ -24,8 +24,13 @@ Including another URLconf
 from django.urls import path, re_path
 from django.views.static import serve
 
-from topSearch.settings import MEDIA_ROOT
-from search.views import IndexView, SearchSuggest, SearchView, favicon_view
+from topSearch.settings import MEDIA_ROOT, ASYNC_SEARCH
+from search.views import IndexView, SearchSuggest, SearchView, AnswerCacheStats, MetricsView, favicon_view
+
+if ASYNC_SEARCH["ENABLED"]:
+    # 通过asgi部署时使用异步视图
+    from search.async_views import AsyncSearchSuggest as SearchSuggest
+    from search.async_views import AsyncSearchView as SearchView
 
 urlpatterns = [
     path('favicon.ico', favicon_view),
@@ -33,4 +38,6 @@ urlpatterns = [
     path('', IndexView.as_view(), name="index"),
     path('suggest/', SearchSuggest.as_view(), name="suggest"),
     path('search/', SearchView.as_view(), name="search"),
+    path('cache/stats/', AnswerCacheStats.as_view(), name="cache_stats"),
+    path('metrics/', MetricsView.as_view(), name="metrics"),
 ]
\ No newline at end of file